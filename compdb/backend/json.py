@@ -1,62 +1,166 @@
 from __future__ import print_function, unicode_literals, absolute_import
 
+import hashlib
 import json
 import os
 import re
 import shlex
 
+import compdb.cache
+import compdb.filesystem
+import compdb.profiling
+import compdb.stats
 import compdb.utils
 
-from compdb.models import (CompileCommand, CompilationDatabaseInterface)
+from compdb.models import (ChangeSet, CompileCommand,
+                           CompilationDatabaseInterface, diff_entries)
+
+
+def _entry_hash(entry):
+    return hashlib.sha1(
+        json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class _JSONCompileCommand(CompileCommand):
+    """A compile command whose command line is tokenized on first use.
+
+    Tokenizing is slow, and the users of the compile commands
+    often need only some of them, e.g. to recompute a few headers.
+    """
+
+    def __init__(self, entry):
+        self.directory = entry['directory']
+        self.file = entry['file']
+        self.output = entry.get('output')
+        self._entry = entry
+        self._arguments = None
+
+    @property
+    def arguments(self):
+        if self._arguments is None:
+            self._arguments = JSONCompilationDatabase._get_arguments(
+                self._entry)
+        return self._arguments
 
 
 class JSONCompilationDatabase(CompilationDatabaseInterface):
     def __init__(self, json_db_path):
         self.json_db_path = json_db_path
         self.__data = None
+        # identify the version of the file which has been loaded
+        self.__stamp = None
 
     @classmethod
     def probe_directory(cls, directory):
         """Automatically create a CompilationDatabase from build directory."""
         db_path = os.path.join(directory, 'compile_commands.json')
-        if os.path.exists(db_path):
+        if compdb.filesystem.get_default().exists(db_path):
             return cls(db_path)
         return super(JSONCompilationDatabase, cls).probe_directory(directory)
 
     def get_compile_commands(self, filepath):
         filepath = compdb.utils.logical_abspath(filepath)
         for elem in self._data:
-            if os.path.normpath(os.path.join(elem['directory'],
-                                             elem['file'])) == filepath:
+            if compdb.stats.normpath(
+                    os.path.join(elem['directory'], elem['file'])) == filepath:
                 yield self._dict_to_compile_command(elem)
 
     def get_all_files(self):
         for entry in self._data:
-            yield os.path.normpath(
+            yield compdb.stats.normpath(
                 os.path.join(entry['directory'], entry['file']))
 
     def get_all_compile_commands(self):
         return map(self._dict_to_compile_command, self._data)
 
+    def get_all_compile_command_ids(self):
+        return map(_entry_hash, self._data)
+
+    def unload(self):
+        self.__data = None
+        self.__stamp = None
+
+    def _get_stamp(self):
+        try:
+            st = compdb.filesystem.get_default().stat(self.json_db_path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def refresh(self):
+        if self.__data is None or self._get_stamp() == self.__stamp:
+            return ChangeSet()
+        old_data = self.__data
+        old_stamp = self.__stamp
+        self.__data = None
+        try:
+            new_data = self._data
+        except (IOError, OSError, ValueError):
+            # the database is being rewritten, or has been removed,
+            # keep the previous entries until it can be loaded again
+            self.__data = old_data
+            self.__stamp = old_stamp
+            return ChangeSet()
+        removed, added = diff_entries(old_data, new_data, _entry_hash)
+        return ChangeSet(
+            removed=map(self._dict_to_compile_command, removed),
+            added=map(self._dict_to_compile_command, added))
+
+    def get_fingerprint(self):
+        h = hashlib.sha1()
+        with open(self.json_db_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
     @staticmethod
-    def _dict_to_compile_command(d):
+    def _get_arguments(d):
         if 'arguments' in d:
-            arguments = d['arguments']
-        else:
-            # PERFORMANCE: I think shlex is inherently slow,
-            # something performing better may be necessary
-            arguments = shlex.split(d['command'],
-                                    # XXX: os.name is "posix" on mysys2/cygwin,
-                                    # is that correct?
-                                    posix=os.name == "posix")
-        return CompileCommand(d['directory'], d['file'], arguments,
-                              d.get('output'))
+            return d['arguments']
+        # PERFORMANCE: I think shlex is inherently slow,
+        # something performing better may be necessary
+        with compdb.profiling.phase('command tokenizing'):
+            return shlex.split(
+                d['command'],
+                # XXX: os.name is "posix" on mysys2/cygwin,
+                # is that correct?
+                posix=os.name == "posix")
+
+    @staticmethod
+    def _dict_to_compile_command(d):
+        return _JSONCompileCommand(d)
+
+    def _load_cached(self, cache):
+        """Load the entries, tokenized, from the cache if possible."""
+        compdb.stats.add(compdb.stats.FILE_OPENS)
+        with open(self.json_db_path, 'rb') as f:
+            content = f.read()
+        key = hashlib.sha1(content).hexdigest()
+        cached = cache.get('database-v1', key)
+        if cached is not None:
+            return json.loads(cached.decode('utf-8'))
+        data = []
+        for entry in json.loads(content.decode('utf-8')):
+            if 'arguments' not in entry:
+                entry = dict(entry)
+                entry['arguments'] = self._get_arguments(entry)
+                del entry['command']
+            data.append(entry)
+        cache.put('database-v1', key, json.dumps(data).encode('utf-8'))
+        return data
 
     @property
     def _data(self):
         if self.__data is None:
-            with open(self.json_db_path) as f:
-                self.__data = json.load(f)
+            with compdb.profiling.phase('json load'):
+                self.__stamp = self._get_stamp()
+                cache = compdb.cache.get_default()
+                if cache is not None:
+                    self.__data = self._load_cached(cache)
+                else:
+                    compdb.stats.add(compdb.stats.FILE_OPENS)
+                    with open(self.json_db_path) as f:
+                        self.__data = json.load(f)
         return self.__data
 
 
@@ -81,19 +185,25 @@ def str_to_json(s):
     return '"{}"'.format(s.replace("\\", "\\\\").replace('"', r'\"'))
 
 
-def compile_command_to_json(compile_command):
-    output_str = ""
+def compile_command_to_json(compile_command, indent='  '):
+    """Return the JSON object of a compile command.
+
+    Each member is on its own line, prefixed by indent,
+    or, if indent is None, the object is on a single line.
+    """
+    members = [
+        ('directory', str_to_json(compile_command.directory)),
+        ('command', arguments_to_json(compile_command.arguments)),
+        ('file', str_to_json(compile_command.file)),
+    ]
     if compile_command.output:
-        output_str = ',\n  "output": {}'.format(
-            str_to_json(compile_command.output))
-    return r'''{{
-  "directory": {},
-  "command": {},
-  "file": {}{}
-}}'''.format(
-        str_to_json(compile_command.directory),
-        arguments_to_json(compile_command.arguments),
-        str_to_json(compile_command.file), output_str)
+        members.append(('output', str_to_json(compile_command.output)))
+    if indent is None:
+        start, separator, end = '{', ', ', '}'
+    else:
+        start, separator, end = '{\n' + indent, ',\n' + indent, '\n}'
+    return start + separator.join(
+        '"{}": {}'.format(name, value) for name, value in members) + end
 
 
 class JSONCompileCommandSerializer(object):
@@ -106,9 +216,10 @@ class JSONCompileCommandSerializer(object):
         return self
 
     def serialize(self, compile_command):
-        if self.__count != 0:
-            self.fp.write(',\n\n')
-        self.fp.write(compile_command_to_json(compile_command))
+        with compdb.profiling.phase('serialization'):
+            if self.__count != 0:
+                self.fp.write(',\n\n')
+            self.fp.write(compile_command_to_json(compile_command))
         self.__count += 1
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -117,6 +228,29 @@ class JSONCompileCommandSerializer(object):
         self.fp.write(']\n')
 
 
+class JSONLinesCompileCommandSerializer(object):
+    """Serialize compile commands as newline-delimited JSON.
+
+    Each compile command is a JSON object on its own line,
+    which lets consumers process the entries as they arrive.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+
+    def __enter__(self):
+        return self
+
+    def serialize(self, compile_command):
+        with compdb.profiling.phase('serialization'):
+            self.fp.write(
+                compile_command_to_json(compile_command, indent=None))
+            self.fp.write('\n')
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
 def compile_commands_to_json(compile_commands, fp):
     """
     Dump Json.
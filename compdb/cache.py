@@ -0,0 +1,235 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import contextlib
+import errno
+import os
+import tempfile
+import time
+
+import compdb.config
+import compdb.utils
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+DEFAULT_MAX_SIZE_MB = 512
+DEFAULT_TTL_DAYS = 30
+
+# the cache is scanned for eviction at most once per interval, in seconds
+EVICTION_INTERVAL = 3600
+
+_LOCK_FILENAME = 'lock'
+_EVICTION_STAMP_FILENAME = 'last-eviction'
+
+
+def get_user_cache_dir():
+    """Return the default cache directory, shared by the compdb processes."""
+    return os.path.join(compdb.config.get_user_cache_home(), 'compdb')
+
+
+def register_config(section_schema):
+    """Register the options of the [cache] configuration section."""
+    section_schema.register_path(
+        'directory', 'the cache directory, '
+        'default: compdb/ under the user cache directory')
+    section_schema.register_int(
+        'max_size',
+        'the size of the cache, in MiB, above which the least recently used '
+        'entries are removed, default: {}'.format(DEFAULT_MAX_SIZE_MB))
+    section_schema.register_int(
+        'ttl', 'the number of days after which an unused entry is removed, '
+        'default: {}'.format(DEFAULT_TTL_DAYS))
+
+
+@contextlib.contextmanager
+def _try_lock(path):
+    """Lock a file, exclusively, yield whether the lock has been acquired."""
+    with open(path, 'a+b') as f:
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except (IOError, OSError):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ContentCache(object):
+    """A cache of computation results, keyed by the hash of their input.
+
+    The entries are files, under <directory>/<namespace>/,
+    the namespace identifies the kind and format of the results.
+    The cache can be shared by concurrent processes:
+    the entries are written atomically, by renaming complete files,
+    and the eviction is done by one process at a time, under a file lock.
+
+    Reading an entry updates its modification time,
+    the eviction removes the entries unused for more than the TTL,
+    then the least recently used entries until the cache fits its size.
+    """
+
+    def __init__(self,
+                 directory,
+                 max_size=DEFAULT_MAX_SIZE_MB * 1024 * 1024,
+                 ttl=DEFAULT_TTL_DAYS * 24 * 3600):
+        self.directory = directory
+        # in bytes
+        self.max_size = max_size
+        # in seconds
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, namespace, key):
+        return os.path.join(self.directory, namespace, key[:2], key[2:])
+
+    def get(self, namespace, key):
+        """Return the content of an entry, as bytes, None if not cached."""
+        path = self._path(namespace, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(path, None)
+        except OSError:
+            # evicted in the meantime
+            pass
+        return data
+
+    def put(self, namespace, key, data):
+        """Store an entry, if possible.
+
+        The cache is an optimization,
+        the entry is not stored if the cache directory is not writable,
+        e.g. because it is read-only or the disk is full.
+        """
+        path = self._path(namespace, key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        except (IOError, OSError):
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            getattr(os, 'replace', os.rename)(tmp_path, path)
+        except (IOError, OSError):
+            with compdb.utils.suppress(OSError):
+                os.remove(tmp_path)
+        except BaseException:
+            with compdb.utils.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    def _iter_entries(self):
+        for root, _, files in os.walk(self.directory):
+            if root == self.directory:
+                # the lock and eviction stamp
+                continue
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st
+
+    def _eviction_due(self, now):
+        stamp = os.path.join(self.directory, _EVICTION_STAMP_FILENAME)
+        try:
+            return now - os.stat(stamp).st_mtime >= EVICTION_INTERVAL
+        except OSError:
+            return True
+
+    def evict(self, force=False):
+        """Remove the expired entries and the least recently used ones.
+
+        Unless forced, this is done at most once per EVICTION_INTERVAL.
+        Return the number of removed entries,
+        None if another process is evicting.
+        """
+        now = time.time()
+        if not os.path.isdir(self.directory) or \
+           not (force or self._eviction_due(now)):
+            return 0
+        with _try_lock(os.path.join(self.directory, _LOCK_FILENAME)) as \
+                locked:
+            if not locked:
+                return None
+            with open(os.path.join(self.directory, _EVICTION_STAMP_FILENAME),
+                      'wb'):
+                pass
+            entries = []
+            removed = []
+            for path, st in self._iter_entries():
+                if os.path.basename(path).startswith('.tmp-'):
+                    # an interrupted write, or one in progress
+                    if now - st.st_mtime > EVICTION_INTERVAL:
+                        removed.append(path)
+                elif now - st.st_mtime > self.ttl:
+                    removed.append(path)
+                else:
+                    entries.append((st.st_mtime, st.st_size, path))
+            size = sum(entry_size for _, entry_size, _ in entries)
+            # least recently used first
+            entries.sort()
+            for _, entry_size, path in entries:
+                if size <= self.max_size:
+                    break
+                removed.append(path)
+                size -= entry_size
+            for path in removed:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return len(removed)
+
+
+def from_config(section):
+    """Create a cache from the [cache] section of a LazyTypedConfig."""
+    kwargs = {}
+    if section.max_size is not None:
+        kwargs['max_size'] = section.max_size * 1024 * 1024
+    if section.ttl is not None:
+        kwargs['ttl'] = section.ttl * 24 * 3600
+    return ContentCache(section.directory or get_user_cache_dir(), **kwargs)
+
+
+_default = None
+
+
+def get_default():
+    """Return the cache shared by the subsystems, None if caching is off."""
+    return _default
+
+
+def set_default(cache):
+    global _default
+    _default = cache
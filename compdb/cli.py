@@ -2,22 +2,37 @@ from __future__ import print_function, unicode_literals, absolute_import
 
 import argparse
 import io
+import itertools
 import logging
 import os
 import sys
+import time
 
-import compdb.backend.json
-import compdb.includedb
 import compdb.utils as utils
 
 from compdb.__about__ import (__prog__, __version__)
-from compdb.backend.json import JSONCompileCommandSerializer
-from compdb.core import CompilationDatabase
+
+# The commands import the modules they need lazily,
+# to keep the startup time low for editor integrations,
+# which spawn compdb processes frequently.
 
 
 class Config(object):
     def __init__(self):
         self.build_directory_patterns = []
+        self.__settings = None
+
+    @property
+    def settings(self):
+        """The options of the configuration files, by section."""
+        if self.__settings is None:
+            import compdb.cache
+            import compdb.config
+
+            schema = compdb.config.ConfigSchema()
+            compdb.cache.register_config(schema.get_section_schema('cache'))
+            self.__settings = compdb.config.LazyTypedConfig(schema)
+        return self.__settings
 
     @property
     def compdb_dir(self):
@@ -33,10 +48,53 @@ class Config(object):
         return utils.locate_dominating_file('compile_commands.json')
 
 
+def _make_serializer(args, output_writer):
+    import compdb.backend.json
+
+    if args.format == 'ndjson':
+        serializer_cls = compdb.backend.json.JSONLinesCompileCommandSerializer
+    else:
+        serializer_cls = compdb.backend.json.JSONCompileCommandSerializer
+    serializer = serializer_cls(output_writer)
+    if args.response_files:
+        import compdb.responsefile
+
+        serializer = compdb.responsefile.ResponseFileSerializer(
+            serializer,
+            compdb.responsefile.ResponseFileWriter(args.response_files))
+    return serializer
+
+
 class Command(object):
     def execute(self, config, args):
         raise NotImplementedError
 
+    def _make_database(self, config, patterns=None):
+        """Load the databases of the build directories.
+
+        The build directory patterns default to the configured ones.
+        """
+        from compdb.core import CompilationDatabase
+        from compdb.models import ProbeError
+
+        backend_registry = BackendRegistry(config)
+        database = CompilationDatabase()
+        for database_cls in backend_registry.iter():
+            database.register_backend(database_cls)
+        patterns = patterns or config.build_directory_patterns
+        try:
+            if patterns:
+                database.add_directory_patterns(patterns)
+            else:
+                database.add_directory(config.compdb_dir)
+        except ProbeError as e:
+            print(
+                "{} {}: error: invalid database(s): {}".format(
+                    __prog__, self.name, e),
+                file=sys.stderr)
+            sys.exit(1)
+        return database
+
 
 class HelpCommand(Command):
     name = 'help'
@@ -65,11 +123,64 @@ class HelpCommand(Command):
             main(['--help'])
 
 
+class DependentsCommand(Command):
+    name = 'dependents'
+    help_short = 'list the entries of the files including some files'
+
+    def execute(self, config, argv):
+        import compdb.includedb
+
+        parser = argparse.ArgumentParser(
+            prog='{} {}'.format(__prog__, self.name),
+            description='list the entries of the files of the database '
+            'which include some files, transitively, '
+            'e.g. the files to re-analyze after a change')
+        parser.add_argument(
+            '-o',
+            '--output',
+            metavar='file',
+            help='write to file instead of stdout')
+        parser.add_argument(
+            '--format',
+            choices=['json', 'ndjson'],
+            default='json',
+            help='output a JSON array (default), '
+            'or newline-delimited JSON, one entry per line')
+        parser.add_argument(
+            '--response-files',
+            metavar='dir',
+            help='write the flags shared by the entries '
+            'once, in response files in dir, '
+            'the entries refer to them with @dir/flags-<hash>.rsp')
+        parser.add_argument(
+            'files',
+            metavar='file',
+            nargs='+',
+            help='the changed files, headers or source files')
+        args = parser.parse_args(argv)
+        database = self._make_database(config)
+        included_by_database = \
+            compdb.includedb.IncludeIndexBuilder().build(database)
+        if args.output:
+            output_writer = io.open(args.output, 'w', encoding='utf8')
+        else:
+            output_writer = utils.stdout_unicode_writer()
+        with _make_serializer(args, output_writer) as serializer:
+            for compile_command in \
+                    included_by_database.get_dependent_compile_commands(
+                        args.files):
+                serializer.serialize(compile_command)
+        if args.output:
+            output_writer.close()
+
+
 class ListCommand(Command):
     name = 'list'
     help_short = 'list database entries'
 
     def execute(self, config, argv):
+        import compdb.sharding
+
         parser = argparse.ArgumentParser(
             prog='{} {}'.format(__prog__, self.name),
             description=self.help_short)
@@ -83,28 +194,58 @@ class ListCommand(Command):
             '--output',
             metavar='file',
             help='write to file instead of stdout')
+        parser.add_argument(
+            '--format',
+            choices=['json', 'ndjson'],
+            default='json',
+            help='output a JSON array (default), '
+            'or newline-delimited JSON, one entry per line')
+        parser.add_argument(
+            '--shard',
+            metavar='K/N',
+            help='output only the K-th of N shards of the entries')
+        parser.add_argument(
+            '--shard-by',
+            choices=['hash', 'cost'],
+            default='hash',
+            help='distribute the entries by hash of the file path (default), '
+            'or balance the cost of the shards, estimated from the size of '
+            'the files and their includes')
+        parser.add_argument(
+            '--response-files',
+            metavar='dir',
+            help='write the flags shared by the entries '
+            'once, in response files in dir, '
+            'the entries refer to them with @dir/flags-<hash>.rsp')
         parser.add_argument(
             'files',
             metavar='file',
             nargs='*',
             help='restrict results to a list of files')
         args = parser.parse_args(argv)
+        if args.shard:
+            if args.files:
+                parser.error('--shard cannot be used with a list of files')
+            try:
+                args.shard = compdb.sharding.parse_shard(args.shard)
+            except ValueError as e:
+                parser.error('--shard: {}'.format(e))
         if args.output:
             output_writer = io.open(args.output, 'w', encoding='utf8')
         else:
             output_writer = utils.stdout_unicode_writer()
+        serializer = _make_serializer(args, output_writer)
         has_missing_files = False
         database = self._make_database(config)
-        builder = compdb.includedb.IncludeIndexBuilder()
-        included_by_database = builder.build(database)
-        with JSONCompileCommandSerializer(output_writer) as serializer:
-            for file, compile_commands in self._gen_results(
-                    database, included_by_database, args):
+        with serializer:
+            if not args.files:
+                self._list_all(database, args, serializer, output_writer)
+            for file, compile_commands in self._gen_results(database, args):
                 has_compile_command = False
                 for compile_command in compile_commands:
                     serializer.serialize(compile_command)
                     has_compile_command = True
-                if file and not has_compile_command:
+                if not has_compile_command:
                     print(
                         'error: {}: no such entry'.format(file),
                         file=sys.stderr)
@@ -114,42 +255,366 @@ class ListCommand(Command):
         if has_missing_files:
             sys.exit(1)
 
-    def _make_database(self, config):
-        backend_registry = BackendRegistry(config)
-        database = CompilationDatabase()
-        for database_cls in backend_registry.iter():
-            database.register_backend(database_cls)
-        try:
-            if config.build_directory_patterns:
-                database.add_directory_patterns(
-                    config.build_directory_patterns)
-            else:
-                database.add_directory(config.compdb_dir)
-        except compdb.models.ProbeError as e:
-            print(
-                "{} {}: error: invalid database(s): {}".format(
-                    __prog__, self.name, e),
-                file=sys.stderr)
-            sys.exit(1)
-        return database
+    def _list_all(self, database, args, serializer, output_writer):
+        import compdb.includedb
+        import compdb.profiling
+        import compdb.progress
+        import compdb.sharding
 
-    def _gen_results(self, database, included_by_database, args):
-        if not args.files:
-            yield (None, database.get_all_compile_commands(unique=args.unique))
-            yield (None, included_by_database.get_all_compile_commands())
+        if args.shard and args.shard_by == 'cost':
+            # the cost of each entry is needed before the first output
+            self._list_all_by_cost(database, args, serializer)
             return
+
+        def selected(compile_commands):
+            if not args.shard:
+                return compile_commands
+            index, count = args.shard
+            return compdb.sharding.split_by_hash(compile_commands, index,
+                                                 count)
+
+        def fed(compile_commands):
+            # the index needs all the entries, not only the shard ones
+            for compile_command in compile_commands:
+                builder.feed(compile_command)
+                yield compile_command
+
+        # The database entries are output right away,
+        # while the include index is built in the background.
+        # The header entries follow, once the index is complete.
+        builder = compdb.includedb.BackgroundIncludeIndexBuilder(database)
+        # the total is known once the header count is known
+        progress = compdb.progress.task('serialization')
+        try:
+            for compile_command in selected(fed(progress.iterate(
+                    database.get_all_compile_commands(unique=args.unique)))):
+                serializer.serialize(compile_command)
+        finally:
+            builder.close()
+        # consumers can start working on the partial results
+        output_writer.flush()
+        included_by_database = builder.result()
+        progress.total = progress.done + len(included_by_database.graph)
+        with compdb.profiling.phase('header derivation'):
+            for compile_command in selected(progress.iterate(
+                    included_by_database.get_all_compile_commands())):
+                serializer.serialize(compile_command)
+        progress.finish()
+
+    def _list_all_by_cost(self, database, args, serializer):
+        import compdb.includedb
+        import compdb.sharding
+
+        builder = compdb.includedb.IncludeIndexBuilder()
+        included_by_database = builder.build(database)
+        cost = compdb.sharding.IncludeClosureCost(included_by_database.graph)
+        compile_commands = itertools.chain(
+            database.get_all_compile_commands(unique=args.unique),
+            included_by_database.get_all_compile_commands())
+        for compile_command in compdb.sharding.split_by_cost(
+                compile_commands, args.shard[0], args.shard[1], cost):
+            serializer.serialize(compile_command)
+
+    def _gen_results(self, database, args):
+        import compdb.includedb
+
+        # The include index is expensive to build, do it only if necessary.
+        # It is built from all the compile commands,
+        # the best includer of a header depends on the whole database,
+        # e.g. on the files including it through a relative path.
+        included_by_database = None
         for file in args.files:
             compile_commands = database.get_compile_commands(
                 file, unique=args.unique)
             is_empty, compile_commands = utils.empty_iterator_wrap(
                 compile_commands)
             if is_empty:
-                path = os.path.abspath(file)
+                if included_by_database is None:
+                    included_by_database = \
+                        compdb.includedb.IncludeIndexBuilder().build(database)
                 compile_commands = included_by_database.get_compile_commands(
-                    path)
+                    os.path.abspath(file))
             yield (file, compile_commands)
 
 
+class CoverageCommand(Command):
+    name = 'coverage'
+    help_short = 'report files without compile commands'
+
+    def execute(self, config, argv):
+        import compdb.filelist
+        import compdb.includedb
+
+        parser = argparse.ArgumentParser(
+            prog='{} {}'.format(__prog__, self.name),
+            description=self.help_short)
+        parser.add_argument(
+            '-g',
+            '--group',
+            dest='groups',
+            choices=['source', 'header'],
+            action='append',
+            help='restrict the check to a group of files')
+        parser.add_argument(
+            '--suppressions',
+            metavar='file',
+            action='append',
+            default=[],
+            help='ignore the files matching the patterns of a file')
+        parser.add_argument(
+            '--git',
+            action='store_true',
+            help='check the files tracked by git, '
+            'instead of walking the directories')
+        parser.add_argument(
+            '-j',
+            '--jobs',
+            metavar='N',
+            type=int,
+            default=1,
+            help='number of threads walking the directories')
+        parser.add_argument(
+            'paths',
+            metavar='path',
+            nargs='*',
+            help='source directories, defaults to the current directory')
+        args = parser.parse_args(argv)
+
+        if args.git:
+            scanner = compdb.filelist.GitIndexScanner()
+        else:
+            scanner = compdb.filelist.FileScanner()
+        scanner.jobs = args.jobs
+        for group in args.groups or ['source', 'header']:
+            scanner.enable_group(group)
+        for suppressions_file in args.suppressions:
+            scanner.add_suppressions(
+                compdb.filelist.read_suppressions_file(suppressions_file))
+
+        database = self._make_database(config)
+        builder = compdb.includedb.IncludeIndexBuilder()
+        included_by_database = builder.build(database)
+        # only the set of paths is kept in memory,
+        # the compile commands are not
+        db_files = set(database.get_all_files())
+        db_files.update(included_by_database.get_all_files())
+
+        output_writer = utils.stdout_unicode_writer()
+        missing_count = 0
+        for path in scanner.scan_many(args.paths or [os.curdir]):
+            if path in db_files:
+                continue
+            missing_count += 1
+            output_writer.write(utils.get_friendly_path(path) + '\n')
+        if missing_count:
+            print(
+                '{} {}: error: {} file(s) without compile commands'.format(
+                    __prog__, self.name, missing_count),
+                file=sys.stderr)
+            sys.exit(1)
+
+
+class MergeCommand(Command):
+    name = 'merge'
+    help_short = 'merge compilation databases'
+
+    def execute(self, config, argv):
+        import compdb.merge
+
+        parser = argparse.ArgumentParser(
+            prog='{} {}'.format(__prog__, self.name),
+            description=self.help_short)
+        parser.add_argument(
+            '-o',
+            '--output',
+            metavar='file',
+            help='write to file instead of stdout, '
+            'the file is replaced once complete')
+        parser.add_argument(
+            '--format',
+            choices=['json', 'ndjson'],
+            default='json',
+            help='output a JSON array (default), '
+            'or newline-delimited JSON, one entry per line')
+        parser.add_argument(
+            '--policy',
+            choices=compdb.merge.POLICIES,
+            default='first',
+            help='the entry to keep for a file found in several databases: '
+            'the first one (default), the last one, '
+            'or the one with the most arguments')
+        parser.add_argument(
+            '--response-files',
+            metavar='dir',
+            help='write the flags shared by the entries '
+            'once, in response files in dir, '
+            'the entries refer to them with @dir/flags-<hash>.rsp')
+        parser.add_argument(
+            'patterns',
+            metavar='build-dir',
+            nargs='+',
+            help='build directories, or glob patterns of build directories')
+        args = parser.parse_args(argv)
+
+        database = self._make_database(config, args.patterns)
+
+        tmp_path = None
+        if args.output:
+            # the output may be one of the inputs,
+            # which are read while the output is written
+            import tempfile
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(args.output)),
+                prefix='.compdb-')
+            output_writer = io.open(fd, 'w', encoding='utf8')
+        else:
+            output_writer = utils.stdout_unicode_writer()
+        try:
+            with _make_serializer(args, output_writer) as serializer:
+                for compile_command in compdb.merge.merge_compile_commands(
+                        database.stream_compile_commands(), args.policy):
+                    serializer.serialize(compile_command)
+            if tmp_path:
+                output_writer.close()
+                # like a file created with open(), honor the umask,
+                # mkstemp() creates files readable by the owner only
+                os.chmod(tmp_path, 0o666 & ~utils.get_umask())
+                getattr(os, 'replace', os.rename)(tmp_path, args.output)
+                tmp_path = None
+        finally:
+            if tmp_path:
+                output_writer.close()
+                os.remove(tmp_path)
+
+
+class RunCommand(Command):
+    name = 'run'
+    help_short = 'run a tool on each file of the database'
+
+    def execute(self, config, argv):
+        import compdb.includedb
+        import compdb.runner
+        import compdb.sharding
+
+        parser = argparse.ArgumentParser(
+            prog='{} {}'.format(__prog__, self.name),
+            description=self.help_short,
+            epilog='The placeholders {file}, {directory} and {output} '
+            'in the tool arguments are replaced by the values '
+            'of each compile command. '
+            'The argument {arguments} is replaced by the arguments '
+            'of the compile command.',
+            usage='%(prog)s [options] -- tool [tool arguments]')
+        parser.add_argument(
+            '-j',
+            '--jobs',
+            metavar='N',
+            type=int,
+            help='number of tools to run in parallel, '
+            'defaults to the number of CPUs')
+        parser.add_argument(
+            '--no-headers',
+            dest='headers',
+            action='store_false',
+            help='skip the header files without compile commands')
+        parser.add_argument(
+            '--history',
+            metavar='file',
+            help='file recording the duration of the jobs, '
+            'to start the longest ones first, defaults to '
+            'compdb-run-history.json in the build directory')
+        parser.add_argument(
+            '--cache-dir',
+            metavar='dir',
+            help='cache the tool results in a directory, '
+            'and replay them when the inputs did not change')
+        parser.add_argument(
+            '--cache-config',
+            metavar='name',
+            action='append',
+            default=[],
+            help='configuration file of the tool, '
+            'the files of this name in the directory of a file '
+            'and in its parents are inputs of the cached results, '
+            'in addition to .clang-tidy and .clang-format, '
+            'can be given multiple times')
+        parser.add_argument(
+            'template', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+        args = parser.parse_args(argv)
+        if args.template and args.template[0] == '--':
+            args.template = args.template[1:]
+        if not args.template:
+            parser.error('no tool specified')
+        if args.jobs is not None and args.jobs < 1:
+            parser.error('invalid number of jobs: {}'.format(args.jobs))
+
+        database = self._make_database(config)
+        compile_commands = list(database.get_all_compile_commands(unique=True))
+        included_by_graph = {}
+        # the result cache needs the include graph, even without headers
+        if args.headers or args.cache_dir:
+            builder = compdb.includedb.IncludeIndexBuilder()
+            included_by_database = builder.build(database)
+            included_by_graph = included_by_database.graph
+        if args.headers:
+            compile_commands.extend(
+                included_by_database.get_all_compile_commands())
+
+        history_path = args.history
+        if history_path is None and database.directories:
+            history_path = os.path.join(database.directories[0],
+                                        'compdb-run-history.json')
+        history = compdb.runner.RunHistory(history_path)
+        cache = None
+        if args.cache_dir:
+            cache = compdb.runner.ResultCache(
+                args.cache_dir,
+                args.template,
+                included_by_graph,
+                config_names=(compdb.runner.ResultCache.DEFAULT_CONFIG_NAMES +
+                              args.cache_config))
+        runner = compdb.runner.ToolRunner(args.template, jobs=args.jobs)
+        jobs = runner.make_jobs(compile_commands)
+        failed_count = 0
+        pending_jobs = []
+        for job in jobs:
+            if cache and cache.get(job):
+                # replay the cached result
+                compdb.runner.write_job_output(job)
+                if job.returncode != 0:
+                    failed_count += 1
+            else:
+                pending_jobs.append(job)
+        # the longest jobs first, not to end up waiting for them
+        pending_jobs = compdb.runner.schedule(
+            pending_jobs, history,
+            compdb.sharding.IncludeClosureCost(included_by_graph))
+        start = time.time()
+        for job in runner.run(pending_jobs):
+            compdb.runner.write_job_output(job)
+            history.record(job.key, job.duration)
+            if cache:
+                cache.put(job)
+            if job.returncode != 0:
+                failed_count += 1
+        makespan = time.time() - start
+        if history_path:
+            history.save()
+        summary = '{} {}: {} job(s) in {:.2f}s, ideal {:.2f}s'.format(
+            __prog__, self.name, len(pending_jobs), makespan,
+            compdb.runner.ideal_makespan(
+                [job.duration for job in pending_jobs], runner.jobs))
+        if cache:
+            summary += ', {} cached'.format(cache.hits)
+        print(summary, file=sys.stderr)
+        if failed_count:
+            print(
+                '{} {}: error: {} of {} job(s) failed'.format(
+                    __prog__, self.name, failed_count, len(jobs)),
+                file=sys.stderr)
+            sys.exit(1)
+
+
 class VersionCommand(Command):
     name = 'version'
     help_short = 'display this version of {}'.format(__prog__)
@@ -173,8 +638,12 @@ class CommandRegistry(object):
 
     def _builtins(self):
         return [
+            CoverageCommand,
+            DependentsCommand,
             HelpCommand,
             ListCommand,
+            MergeCommand,
+            RunCommand,
             VersionCommand,
         ]
 
@@ -213,6 +682,8 @@ class BackendRegistry(object):
         self.config = config
 
     def _builtins(self):
+        import compdb.backend.json
+
         return [
             compdb.backend.json.JSONCompilationDatabase,
         ]
@@ -261,6 +732,39 @@ def main(argv=None):
         action='store_const',
         const=logging.INFO,
         help='trace execution')
+    group.add_argument(
+        '--profile',
+        metavar='FILE',
+        help='write the time spent in each phase to FILE, '
+        'in the Chrome trace event format, and a summary to stderr')
+    group.add_argument(
+        '--memory-profile',
+        metavar='FILE',
+        help='write the memory used by the main phases to FILE, as JSON, '
+        'and a summary to stderr')
+    group.add_argument(
+        '--progress',
+        dest='progress',
+        action='store_true',
+        default=None,
+        help='report the progress of long operations on stderr, '
+        'the default when stderr is a terminal and stdout is not')
+    group.add_argument(
+        '--no-progress',
+        dest='progress',
+        action='store_false',
+        help='do not report the progress')
+    group.add_argument(
+        '--stats',
+        action='store_true',
+        help='count the file system and algorithmic operations, '
+        'and print the counts to stderr')
+    group.add_argument(
+        '--cache',
+        action='store_true',
+        help='share the parsed databases and the include scanning results '
+        'with other compdb processes, in the cache directory, '
+        'configured by the [cache] section of the configuration')
     group.add_argument(
         '-p',
         dest='build_paths',
@@ -278,6 +782,11 @@ def main(argv=None):
     for logger_name in args.loggers_to_debug:
         logging.getLogger(logger_name).setLevel(logging.DEBUG)
 
+    # the process is short-lived,
+    # the file system is not expected to change during its execution
+    import compdb.filesystem
+    compdb.filesystem.set_default(compdb.filesystem.SnapshotFileSystem())
+
     config = Config()
     config.build_directory_patterns.extend(args.build_paths)
 
@@ -297,8 +806,74 @@ def main(argv=None):
     except KeyError:
         parser.error('unrecognized command: {}'.format(args.command))
 
+    if args.progress is None:
+        # do not mix the progress with the output in a terminal
+        args.progress = sys.stderr.isatty() and not sys.stdout.isatty()
+    if args.progress:
+        import compdb.progress
+        compdb.progress.set_listener(compdb.progress.StderrRenderer())
+
     command = command_cls()
-    command.execute(config, args.args)
+    cache = None
+    if args.cache:
+        import compdb.cache
+        cache = compdb.cache.from_config(config.settings.cache)
+        compdb.cache.set_default(cache)
+    try:
+        _execute(parser, args, config, command)
+    finally:
+        if cache is not None:
+            compdb.cache.set_default(None)
+            # do not mask the outcome of the command
+            with utils.suppress(IOError, OSError):
+                cache.evict()
+
+
+def _execute(parser, args, config, command):
+    if not (args.profile or args.memory_profile or args.stats):
+        command.execute(config, args.args)
+        return
+
+    import compdb.profiling
+    import compdb.stats
+
+    profilers = []
+    profiler = None
+    if args.profile:
+        profiler = compdb.profiling.Profiler()
+        profilers.append(profiler)
+    memory_profiler = None
+    if args.memory_profile:
+        try:
+            memory_profiler = compdb.profiling.MemoryProfiler(
+                compdb.profiling.MEMORY_PHASES | {command.name})
+        except ImportError:
+            parser.error('--memory-profile requires tracemalloc')
+        profilers.append(memory_profiler)
+        memory_profiler.start()
+    if len(profilers) == 1:
+        compdb.profiling.set_profiler(profilers[0])
+    elif profilers:
+        compdb.profiling.set_profiler(
+            compdb.profiling.ProfilerGroup(profilers))
+    counters = None
+    if args.stats:
+        counters = compdb.stats.enable()
+    try:
+        with compdb.profiling.phase(command.name):
+            command.execute(config, args.args)
+    finally:
+        compdb.profiling.set_profiler(None)
+        compdb.stats.set_counters(None)
+        if profiler:
+            profiler.write_chrome_trace(args.profile)
+            sys.stderr.write(profiler.format_summary())
+        if memory_profiler:
+            memory_profiler.stop()
+            memory_profiler.write_json(args.memory_profile)
+            sys.stderr.write(memory_profiler.format_summary())
+        if counters is not None:
+            sys.stderr.write(compdb.stats.format_counters(counters))
 
 
 if __name__ == '__main__':
@@ -7,7 +7,7 @@ class ComplementerInterface(object):
     .. seealso:: complement()
     """
 
-    def complement(self, layers):
+    def complement(self, layers, jobs=1):
         """Compute the complements of multiple layers of databases.
 
         This method should provide compile commands of files not present in the
@@ -35,5 +35,36 @@ class ComplementerInterface(object):
         In this multi-project setup, the complementer should have
         the opportunity to complement project A's database with the headers
         over project B which uses the headers "more indirectly".
+
+        The jobs parameter is a hint for the number of processes to use,
+        None meaning the number of CPUs.
+        Complementers are free to ignore it.
         """
         raise compdb.NotImplementedError
+
+    def get_state(self):
+        """Return a JSON-serializable state of the last complement() call.
+
+        The state can be given to restore_state() in a later run,
+        for example to avoid rescanning unchanged files.
+        Return None if the complementer has no state to save.
+        """
+        return None
+
+    def restore_state(self, state):
+        """Restore a state previously returned by get_state().
+
+        Return True if the inputs recorded by the state are unchanged,
+        meaning that the complement of the same databases is unchanged too.
+        """
+        return False
+
+    def get_changed_databases(self):
+        """Return the indexes of the databases whose complement changed.
+
+        The complements of the last complement() call are compared
+        to the ones of the restored state.
+        The complements of the other databases do not need to be saved again.
+        Return None if unknown, the default.
+        """
+        return None
@@ -1,8 +1,17 @@
 from __future__ import print_function, unicode_literals, absolute_import
 
+import hashlib
+import heapq
+import json
 import os
 import re
 
+import compdb.cache
+import compdb.filesystem
+import compdb.profiling
+import compdb.progress
+import compdb.stats
+
 from compdb.backend.memory import InMemoryCompilationDatabase
 from compdb.complementer import ComplementerInterface
 from compdb.models import CompileCommand
@@ -13,7 +22,7 @@ def sanitize_compile_options(compile_command):
     file_norm = compile_command.normfile
     adjusted = []
     i = 0
-    arguments = compile_command.arguments
+    arguments = compile_command.expanded_arguments
     while i < len(arguments):
         # end of options, skip all positional arguments (source files)
         if arguments[i] == "--":
@@ -31,7 +40,7 @@ def sanitize_compile_options(compile_command):
             continue
         # skip input file
         if arguments[i].endswith(filename):
-            arg_norm = os.path.normpath(
+            arg_norm = compdb.stats.normpath(
                 os.path.join(compile_command.directory, arguments[i]))
             if file_norm == arg_norm:
                 i += 1
@@ -64,27 +73,58 @@ def derive_compile_command(header_file, reference):
         arguments=args)
 
 
-def get_file_includes(path):
-    """Returns a tuple of (quote, filename).
+def parse_includes(b_lines):
+    """Returns a list of (quote, filename) from an iterable of byte lines.
 
     Quote is one of double quote mark '\"' or opening angle bracket '<'.
     """
     includes = []
-    with open(path, "rb") as istream:
-        include_pattern = re.compile(
-            br'\s*#\s*include\s+(?P<quote>["<])(?P<filename>.+?)[">]')
-        for b_line in istream:
-            b_match = re.match(include_pattern, b_line)
-            if b_match:
-                u_quote = b_match.group('quote').decode('ascii')
-                try:
-                    u_filename = b_match.group('filename').decode('utf-8')
-                except UnicodeDecodeError:
-                    u_filename = b_match.group('filename').decode('latin-1')
-                includes.append((u_quote, u_filename))
+    include_pattern = re.compile(
+        br'\s*#\s*include\s+(?P<quote>["<])(?P<filename>.+?)[">]')
+    match_count = 0
+    for b_line in b_lines:
+        match_count += 1
+        b_match = re.match(include_pattern, b_line)
+        if b_match:
+            u_quote = b_match.group('quote').decode('ascii')
+            try:
+                u_filename = b_match.group('filename').decode('utf-8')
+            except UnicodeDecodeError:
+                u_filename = b_match.group('filename').decode('latin-1')
+            includes.append((u_quote, u_filename))
+    compdb.stats.add(compdb.stats.REGEX_MATCHES, match_count)
+    return includes
+
+
+def parse_content_includes(content, sha1=None):
+    """Returns a list of (quote, filename) from the content of a file.
+
+    When the cache is enabled, the includes are cached by content hash,
+    the SHA-1 hex digest of the content can be given if already known.
+    """
+    cache = compdb.cache.get_default()
+    if cache is None:
+        # split the same way as iterating over the lines of a file
+        return parse_includes(content.split(b'\n'))
+    key = sha1 or hashlib.sha1(content).hexdigest()
+    cached = cache.get('includes-v1', key)
+    if cached is not None:
+        return [(quote, filename)
+                for quote, filename in json.loads(cached.decode('utf-8'))]
+    includes = parse_includes(content.split(b'\n'))
+    cache.put('includes-v1', key, json.dumps(includes).encode('utf-8'))
     return includes
 
 
+def get_file_includes(path):
+    """Returns a list of (quote, filename).
+
+    Quote is one of double quote mark '\"' or opening angle bracket '<'.
+    """
+    with open(path, "rb") as istream:
+        return parse_includes(istream)
+
+
 def extract_include_dirs(compile_command):
     header_search_path = []
     i = 0
@@ -172,6 +212,7 @@ def score_other_file(a, b):
     Paths are expected absolute and normalized.
     Note that the score can be a negative value.
     """
+    compdb.stats.add(compdb.stats.SCORE_COMPUTATIONS)
     a_dir, a_filename = os.path.split(os.path.splitext(a)[0])
     a_subwords = subword_split(a_filename)
     b_dir, b_filename = os.path.split(os.path.splitext(b)[0])
@@ -213,45 +254,335 @@ class _Data(object):
         self.db_idx = db_idx
 
 
-def _make_headerdb1(compile_commands_iter, db_files, db_idx, header_mapping):
-    for compile_command in compile_commands_iter:
+def _stat_mtime(fs, path):
+    try:
+        return fs.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class IncludeCache(object):
+    """Cache the includes of files and their resolution to headers.
+
+    Each file is read at most once, each candidate header is checked at most
+    once. The reads and stats attributes count the files read and the
+    existence checks performed.
+
+    The cache records a fingerprint of the files it reads and of the
+    directories it looks into, this state can be saved and restored later on,
+    to avoid reading the files which did not change.
+    The existence checks and the resolved headers are saved too,
+    they are reused as long as the files and directories they depend on
+    are unchanged.
+
+    The files are accessed through the given file system,
+    or the default one.
+    """
+
+    def __init__(self, fs=None):
+        self.fs = fs or compdb.filesystem.get_default()
+        self._includes = {}
+        # (src_file, header_search_paths) -> headers
+        self._headers = {}
+        # (src_file, header_search_paths) -> directories looked into
+        self._probed = {}
+        self._isfile = {}
+        # path -> (mtime, size, sha1 hexdigest)
+        self._files = {}
+        # directory -> mtime, None if the directory does not exist
+        self._directories = {}
+        # the (key, headers) of the last restored state, in state order,
+        # including the ones which are out-of-date
+        self.restored_headers = []
+        self.reads = 0
+        self.stats = 0
+
+    def _read(self, path):
+        with compdb.profiling.phase('include scanning'):
+            st = self.fs.stat(path)
+            content = self.fs.read(path)
+            self.reads += 1
+            sha1 = hashlib.sha1(content).hexdigest()
+            self._files[path] = (st.st_mtime, st.st_size, sha1)
+            return parse_content_includes(content, sha1)
+
+    def get_file_includes(self, path):
+        try:
+            return self._includes[path]
+        except KeyError:
+            pass
+        includes = self._read(path)
+        self._includes[path] = includes
+        return includes
+
+    def isfile(self, path):
+        try:
+            return self._isfile[path]
+        except KeyError:
+            pass
+        isfile = self.fs.isfile(path)
+        self.stats += 1
+        self._isfile[path] = isfile
+        directory = os.path.dirname(path)
+        if directory not in self._directories:
+            self._directories[directory] = _stat_mtime(self.fs, directory)
+        return isfile
+
+    def get_state(self, key_indexes=None):
+        """Return a JSON-serializable fingerprint of the files seen so far.
+
+        The paths are stored once, in a table referenced by index.
+        If a dictionary is given as key_indexes,
+        it is filled with the index of each headers key in the state.
+        """
+        paths = []
+        path_indexes = {}
+
+        def index(path):
+            try:
+                return path_indexes[path]
+            except KeyError:
+                path_indexes[path] = len(paths)
+                paths.append(path)
+                return path_indexes[path]
+
+        headers = []
+        for key, key_headers in self._headers.items():
+            src_file, header_search_paths = key
+            if key_indexes is not None:
+                key_indexes[key] = len(headers)
+            headers.append([
+                index(src_file), [index(p) for p in header_search_paths],
+                [index(p) for p in key_headers],
+                [index(p) for p in self._probed[key]]
+            ])
+        return {
+            'paths': paths,
+            'files': {
+                path: [mtime, size, sha1, self._includes[path]]
+                for path, (mtime, size, sha1) in self._files.items()
+            },
+            'directories': self._directories,
+            'isfile': [[index(path), isfile]
+                       for path, isfile in self._isfile.items()],
+            'headers': headers,
+        }
+
+    def restore_state(self, state):
+        """Restore a state returned by get_state().
+
+        The includes of the unchanged files are reused,
+        so are the existence checks of the unchanged directories,
+        and the resolved headers which depend only on unchanged files and
+        directories.
+        Return True if none of the files and directories of the state changed.
+        """
+        unchanged = True
+        changed_directories = set()
+        for directory, mtime in state['directories'].items():
+            if _stat_mtime(self.fs, directory) != mtime:
+                unchanged = False
+                changed_directories.add(directory)
+            else:
+                self._directories[directory] = mtime
+        changed_files = set()
+        for path, (mtime, size, sha1, includes) in state['files'].items():
+            try:
+                st = self.fs.stat(path)
+            except OSError:
+                unchanged = False
+                changed_files.add(path)
+                continue
+            if (st.st_mtime, st.st_size) != (mtime, size):
+                # the file may have been touched without being modified
+                self._includes[path] = self._read(path)
+                if self._files[path][2] != sha1:
+                    unchanged = False
+                    changed_files.add(path)
+                continue
+            self._files[path] = (mtime, size, sha1)
+            self._includes[path] = [(quote, filename)
+                                    for quote, filename in includes]
+        paths = state.get('paths', [])
+        for path_idx, isfile in state.get('isfile', []):
+            path = paths[path_idx]
+            if os.path.dirname(path) in self._directories:
+                self._isfile[path] = isfile
+        self.restored_headers = []
+        for src_idx, search_path_idxs, header_idxs, probed_idxs in \
+                state.get('headers', []):
+            src_file = paths[src_idx]
+            key = (src_file, tuple(paths[i] for i in search_path_idxs))
+            headers = [paths[i] for i in header_idxs]
+            self.restored_headers.append((key, headers))
+            probed = [paths[i] for i in probed_idxs]
+            if src_file in changed_files or src_file not in self._files or \
+               not all(d in self._directories for d in probed):
+                continue
+            self._headers[key] = headers
+            self._probed[key] = probed
+        return unchanged
+
+    def _resolve(self, quote, filename, implicit_search_path,
+                 header_search_paths, probed):
+        if quote == '"':
+            candidate = compdb.stats.normpath(
+                os.path.join(implicit_search_path, filename))
+            probed.add(os.path.dirname(candidate))
+            if self.isfile(candidate):
+                return candidate
+        for search_path in header_search_paths:
+            candidate = compdb.stats.normpath(
+                os.path.join(search_path, filename))
+            probed.add(os.path.dirname(candidate))
+            if self.isfile(candidate):
+                return candidate
+        return None
+
+    def get_headers_key(self, compile_command):
+        """Return the key of the headers included by the compile command.
+
+        Two compile commands with the same key include the same headers.
+        """
+        return (compile_command.normfile,
+                tuple(extract_include_dirs(compile_command)))
+
+    def is_resolved(self, key, headers):
+        """Tell whether the headers of a key are resolved, and up-to-date.
+
+        Up-to-date resolutions are returned as the same list object.
+        """
+        return self._headers.get(key) is headers
+
+    def get_included_headers(self, compile_command, key=None):
+        """Return the normalized paths of the headers included by the file.
+
+        The headers are resolved with the header search paths of the compile
+        command, the key can be given if already known.
+        """
+        if key is None:
+            key = self.get_headers_key(compile_command)
+        try:
+            return self._headers[key]
+        except KeyError:
+            pass
+        src_file, header_search_paths = key
+        includes = self.get_file_includes(src_file)
         implicit_search_path = get_implicit_header_search_path(compile_command)
-        header_search_paths = extract_include_dirs(compile_command)
+        headers = []
+        probed = set()
+        with compdb.profiling.phase('header resolution'):
+            for quote, filename in includes:
+                header_abspath = self._resolve(quote, filename,
+                                               implicit_search_path,
+                                               header_search_paths, probed)
+                if header_abspath:
+                    headers.append(header_abspath)
+        self._headers[key] = headers
+        self._probed[key] = sorted(probed)
+        return headers
+
+
+def _make_headerdb1(compile_commands_iter, db_files, db_idx, header_mapping,
+                    include_cache):
+    """Find the best reference compile command for each included header.
+
+    The header mapping stores the compile command of the includer,
+    the header compile command is derived from it afterwards.
+    """
+    for compile_command in compile_commands_iter:
         src_file = compile_command.normfile
-        for quote, filename in get_file_includes(src_file):
-            header_abspath = None
-            if quote == '"':
-                candidate = os.path.normpath(
-                    os.path.join(implicit_search_path, filename))
-                if os.path.isfile(candidate):
-                    header_abspath = candidate
-            if not header_abspath:
-                for search_path in header_search_paths:
-                    candidate = os.path.normpath(
-                        os.path.join(search_path, filename))
-                    if os.path.isfile(candidate):
-                        header_abspath = candidate
-                        break
-                else:
+        headers = include_cache.get_included_headers(compile_command)
+        with compdb.profiling.phase('best-includer selection'):
+            for norm_abspath in headers:
+                # skip files already present in the database
+                if norm_abspath in db_files:
                     continue
-            norm_abspath = os.path.normpath(header_abspath)
-            # skip files already present in the database
-            if norm_abspath in db_files:
+                score = score_other_file(src_file, norm_abspath)
+                try:
+                    data = header_mapping[norm_abspath]
+                except KeyError:
+                    data = _Data(score=(score - 1))
+                    header_mapping[norm_abspath] = data
+                if score > data.score:
+                    data.score = score
+                    data.compile_command = compile_command
+                    data.db_idx = db_idx
+
+
+# the include cache of a worker process,
+# it lives as long as the process pool of a make_headerdb() run
+_worker_include_cache = None
+
+
+def _init_worker(fs):
+    global _worker_include_cache
+    _worker_include_cache = IncludeCache(fs)
+
+
+def _make_headerdb_shard(shard):
+    """Process a shard of (db_idx, compile_command) in a worker process.
+
+    Return a list of (header, score, compile_command, db_idx),
+    the best candidate of the shard for each header.
+    The database files are filtered out by the caller.
+    """
+    header_mapping = {}
+    for db_idx, compile_command in shard:
+        _make_headerdb1([compile_command], (), db_idx, header_mapping,
+                        _worker_include_cache)
+    return [(k, v.score, v.compile_command, v.db_idx)
+            for k, v in header_mapping.items()]
+
+
+def _make_shards(items, count):
+    size = max(1, -(-len(items) // count))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _make_headerdb_parallel(pool, jobs, layers, db_files, header_mapping,
+                            progress):
+    work = []
+    for layer in layers:
+        for db_idx, database in enumerate(layer):
+            work.extend((db_idx, compile_command)
+                        for compile_command in
+                        database.get_all_compile_commands())
+    # the shards are contiguous and merged in order,
+    # to reproduce the tie-breaking of the serial iteration:
+    # the first compile command with the best score wins
+    shards = _make_shards(work, jobs * 4)
+    for shard, shard_result in zip(shards,
+                                   pool.imap(_make_headerdb_shard, shards)):
+        progress.advance(len(shard))
+        for header, score, compile_command, db_idx in shard_result:
+            if header in db_files:
                 continue
-            score = score_other_file(src_file, norm_abspath)
-            try:
-                data = header_mapping[norm_abspath]
-            except KeyError:
-                data = _Data(score=(score - 1))
-                header_mapping[norm_abspath] = data
-            if score > data.score:
+            data = header_mapping.get(header)
+            if data is None:
+                header_mapping[header] = _Data(score, compile_command, db_idx)
+            elif score > data.score:
                 data.score = score
-                data.compile_command = derive_compile_command(
-                    norm_abspath, compile_command)
+                data.compile_command = compile_command
                 data.db_idx = db_idx
 
 
-def make_headerdb(layers):
+def make_headerdb(layers, jobs=1, include_cache=None):
+    """Compute the header compilation database of layers.
+
+    If jobs is greater than one, or None to use the number of CPUs,
+    each round of the computation is shared between a pool of processes.
+    The result is the same as the serial computation.
+
+    The include cache is shared by all the rounds of the computation,
+    a new one is created if none is given.
+    Worker processes use their own cache, on the file system of this one.
+    """
+    with compdb.profiling.phase('header derivation'):
+        return _make_headerdb(layers, jobs, include_cache)
+
+
+def _make_headerdb(layers, jobs, include_cache):
     databases_len = len(layers[0])
     complementary_databases = [
         InMemoryCompilationDatabase() for _ in range(databases_len)
@@ -262,28 +593,502 @@ def make_headerdb(layers):
         for database in layer:
             db_files.update(database.get_all_files())
 
-    # loop until there is nothing more to resolve
-    # we first get the files directly included by the compilation database
-    # then the files directly included by these files and so on
-    while True:
-        # mapping of <header normalized absolute path> -> _Data
-        db_update = {}
-        for layer in layers:
-            for db_idx, database in enumerate(layer):
-                _make_headerdb1(database.get_all_compile_commands(), db_files,
-                                db_idx, db_update)
-        if not db_update:
-            break
-        layers = [[
-            InMemoryCompilationDatabase() for _ in range(databases_len)
-        ]]
-        for k, v in db_update.items():
-            db_files.add(k)
-            for db_list in (layers[0], complementary_databases):
-                db_list[v.db_idx].compile_commands.append(v.compile_command)
+    if include_cache is None:
+        include_cache = IncludeCache()
+    pool = None
+    if jobs is None or jobs > 1:
+        # multiprocessing is slow to import, only import it when necessary
+        import multiprocessing
+
+        if jobs is None:
+            jobs = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(jobs, _init_worker, (include_cache.fs, ))
+
+    try:
+        # loop until there is nothing more to resolve
+        # we first get the files directly included by the compilation
+        # database then the files directly included by these files and so on
+        round_number = 0
+        while True:
+            round_number += 1
+            total = None
+            if compdb.progress.is_enabled():
+                total = sum(1 for layer in layers for database in layer
+                            for _ in database.get_all_files())
+            progress = compdb.progress.task(
+                'headerdb round {}'.format(round_number), total)
+            # mapping of <header normalized absolute path> -> _Data
+            db_update = {}
+            if pool:
+                _make_headerdb_parallel(pool, jobs, layers, db_files,
+                                        db_update, progress)
+            else:
+                for layer in layers:
+                    for db_idx, database in enumerate(layer):
+                        _make_headerdb1(
+                            progress.iterate(
+                                database.get_all_compile_commands()),
+                            db_files, db_idx, db_update, include_cache)
+            progress.finish()
+            if not db_update:
+                break
+            layers = [[
+                InMemoryCompilationDatabase() for _ in range(databases_len)
+            ]]
+            for k, v in db_update.items():
+                db_files.add(k)
+                compile_command = derive_compile_command(k, v.compile_command)
+                for db_list in (layers[0], complementary_databases):
+                    db_list[v.db_idx].compile_commands.append(compile_command)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
     return complementary_databases
 
 
+class _Member(object):
+    """A compile command of a round of the header database computation.
+
+    The order of a compile command of the databases is
+    (layer index, database index, position in the database).
+    The order of a derived compile command is
+    (database index, key of the discoverer, index of the header),
+    the discoverer is the first member of the previous round
+    including the header, the header is at this index of its headers.
+    """
+    __slots__ = ['order', 'db_idx', 'compile_command', 'key', 'headers',
+                 'scores', 'version']
+
+    def __init__(self, order, db_idx, compile_command):
+        self.order = order
+        self.db_idx = db_idx
+        self.compile_command = compile_command
+        self.key = None
+        self.headers = []
+        self.scores = []
+        self.version = 0
+
+
+class IncrementalHeaderDB(object):
+    """Compute the header database of layers, incrementally.
+
+    The result is the one of make_headerdb(),
+    each round of the computation is kept in memory, with its dependencies:
+    the compile commands of the round and the headers they include,
+    the candidate includers of each header,
+    and the includer chosen for each header.
+
+    On update, only what depends on the changes is recomputed:
+    the compile commands added to and removed from the databases,
+    the ones whose resolved headers are out-of-date in the include cache,
+    then, round by round, the headers whose best includer changed,
+    and the compile commands derived from them.
+
+    The members of the rounds are identified by
+    the id of the compile command for the databases,
+    see CompilationDatabaseInterface.get_all_compile_command_ids(),
+    the header path for the derived compile commands.
+
+    Like make_headerdb(), the ties are broken by the order of the members,
+    which follows the order in which the headers are discovered,
+    see _Member.
+    """
+
+    def __init__(self, include_cache):
+        self.include_cache = include_cache
+        self._reset(None)
+
+    def _reset(self, databases_len):
+        self._databases_len = databases_len
+        # (round, member id) -> _Member
+        self._members = {}
+        # header -> {(round, member id): score}
+        self._candidates = {}
+        # header -> (round, member id, member version) of its includer
+        self._assignments = {}
+        self._db_files = set()
+        self._version = 0
+        # round -> member ids to reconcile with their desired state
+        self._pending = {}
+        self._pending_rounds = []
+        # (round, member id) -> (order, db_idx, compile_command) or None
+        self._desired = {}
+        # the scheduled members whose discoverer moved,
+        # their position among the members of their round changes
+        self._moving = set()
+        # the members of the round being updated whose position changed
+        self._moved = set()
+        # the indexes of the databases whose complement changed,
+        # None if they all changed
+        self.changed_databases = None
+
+    def _schedule(self, round_number, member_id, spec):
+        self._desired[(round_number, member_id)] = spec
+        try:
+            self._pending[round_number].add(member_id)
+        except KeyError:
+            self._pending[round_number] = set([member_id])
+            heapq.heappush(self._pending_rounds, round_number)
+
+    def _reconcile(self, member_key):
+        """Bring a member to its desired state.
+
+        Return the headers whose candidates changed.
+        """
+        spec = self._desired.pop(member_key, None)
+        old = self._members.get(member_key)
+        moving = member_key in self._moving
+        self._moving.discard(member_key)
+        in_place = False
+        if old is not None and spec is not None:
+            order, db_idx, compile_command = spec
+            if old.db_idx == db_idx and \
+               old.compile_command == compile_command:
+                if old.order != order or moving:
+                    # the headers may be discovered in another order
+                    self._moved.add(member_key)
+                    self._add_changed_database(member_key, db_idx)
+                    old.order = order
+                    touched = set(old.headers)
+                else:
+                    # only the headers can change,
+                    # the compile command stays at the same place
+                    in_place = True
+                    touched = set()
+                old.compile_command = compile_command
+                if self.include_cache.is_resolved(old.key, old.headers):
+                    return touched
+                headers = self.include_cache.get_included_headers(
+                    compile_command, old.key)
+                if headers == old.headers:
+                    old.headers = headers
+                    return touched
+        touched = set()
+        if old is not None:
+            if not in_place:
+                self._add_changed_database(member_key, old.db_idx)
+            del self._members[member_key]
+            for header in old.headers:
+                candidates = self._candidates[header]
+                candidates.pop(member_key, None)
+                if not candidates:
+                    del self._candidates[header]
+            touched.update(old.headers)
+        if spec is not None:
+            member = _Member(*spec)
+            if not in_place:
+                self._moved.add(member_key)
+                self._add_changed_database(member_key, member.db_idx)
+            compile_command = member.compile_command
+            member.key = self.include_cache.get_headers_key(compile_command)
+            member.headers = self.include_cache.get_included_headers(
+                compile_command, member.key)
+            src_file = compile_command.normfile
+            member.scores = [
+                score_other_file(src_file, header) for header in member.headers
+            ]
+            self._version += 1
+            member.version = self._version
+            self._members[member_key] = member
+            self._add_candidates(member_key, member)
+            touched.update(member.headers)
+        return touched
+
+    def _add_changed_database(self, member_key, db_idx):
+        # the members of the first round are not part of the complement
+        if member_key[0] > 1 and self.changed_databases is not None:
+            self.changed_databases.add(db_idx)
+
+    def _add_candidates(self, member_key, member):
+        for header, score in zip(member.headers, member.scores):
+            try:
+                self._candidates[header][member_key] = score
+            except KeyError:
+                self._candidates[header] = {member_key: score}
+
+    def _sort_key(self, member_key, memo=None):
+        """Return a key sorting the members of a round in iteration order."""
+        if memo is not None and member_key in memo:
+            return memo[member_key]
+        order = self._members[member_key].order
+        if member_key[0] != 1:
+            db_idx, discoverer_key, index = order
+            order = (db_idx, self._sort_key(discoverer_key, memo), index)
+        if memo is not None:
+            memo[member_key] = order
+        return order
+
+    def _assign(self, header):
+        """Choose the includer of a header, schedule its derived command."""
+        best_key = None
+        candidates = self._candidates.get(header)
+        if candidates and header not in self._db_files:
+            # the headers are assigned in the first round including them
+            first_round = min(round_number for round_number, _ in candidates)
+            best_score = None
+            best_order = None
+            discoverer_key = None
+            first_order = None
+            for member_key, score in candidates.items():
+                if member_key[0] != first_round:
+                    continue
+                order = self._sort_key(member_key)
+                if best_key is None or score > best_score or \
+                   (score == best_score and order < best_order):
+                    best_key = member_key
+                    best_score = score
+                    best_order = order
+                if discoverer_key is None or order < first_order:
+                    discoverer_key = member_key
+                    first_order = order
+        old = self._assignments.get(header)
+        if best_key is None:
+            if old is not None:
+                del self._assignments[header]
+                self._schedule(old[0] + 1, header, None)
+            return
+        includer = self._members[best_key]
+        index = self._members[discoverer_key].headers.index(header)
+        assignment = best_key + (includer.version, discoverer_key, index)
+        if old == assignment and discoverer_key not in self._moved:
+            return
+        self._assignments[header] = assignment
+        if old is not None and old[0] != best_key[0]:
+            self._schedule(old[0] + 1, header, None)
+        if discoverer_key in self._moved:
+            # the header is discovered at another position
+            self._moving.add((best_key[0] + 1, header))
+        self._schedule(best_key[0] + 1, header,
+                       ((includer.db_idx, discoverer_key, index),
+                        includer.db_idx,
+                        derive_compile_command(header,
+                                               includer.compile_command)))
+
+    def _update_databases(self, layers):
+        """Schedule the changes of the databases, the first round."""
+        db_files = set()
+        primaries = {}
+        for layer_idx, layer in enumerate(layers):
+            for db_idx, database in enumerate(layer):
+                db_files.update(database.get_all_files())
+                for position, (compile_command_id, compile_command) in \
+                        enumerate(zip(database.get_all_compile_command_ids(),
+                                      database.get_all_compile_commands())):
+                    member_id = '{}:{}:{}'.format(layer_idx, db_idx,
+                                                  compile_command_id)
+                    # duplicated compile commands
+                    occurrence = 1
+                    while member_id in primaries:
+                        occurrence += 1
+                        member_id = '{}#{}'.format(member_id.split('#')[0],
+                                                   occurrence)
+                    primaries[member_id] = ((layer_idx, db_idx, position),
+                                            db_idx, compile_command)
+        if len(layers[0]) != self._databases_len or \
+           not self._is_order_preserved(primaries):
+            self._reset(len(layers[0]))
+        old_db_files = self._db_files
+        self._db_files = db_files
+        for member_key in list(self._members):
+            if member_key[0] == 1 and member_key[1] not in primaries:
+                self._schedule(1, member_key[1], None)
+        for member_id, spec in primaries.items():
+            member = self._members.get((1, member_id))
+            if member is None:
+                self._schedule(1, member_id, spec)
+            else:
+                # unchanged, the relative order of the members is the same
+                member.order = spec[0]
+                member.compile_command = spec[2]
+        # a header which becomes a database file, or stops being one
+        return db_files.symmetric_difference(old_db_files)
+
+    def _is_order_preserved(self, primaries):
+        old_order = sorted((member.order, member_key[1])
+                           for member_key, member in self._members.items()
+                           if member_key[0] == 1
+                           and member_key[1] in primaries)
+        new_order = sorted(
+            (primaries[member_id][0], member_id) for _, member_id in old_order)
+        return [member_id for _, member_id in old_order] == \
+            [member_id for _, member_id in new_order]
+
+    def update(self, layers):
+        """Update the computation to the given layers.
+
+        Return the complementary databases, like make_headerdb().
+        The changed_databases attribute tells which ones changed.
+        """
+        self.changed_databases = set()
+        touched = self._update_databases(layers)
+        for member_key, member in self._members.items():
+            if member_key not in self._desired and \
+               not self.include_cache.is_resolved(member.key, member.headers):
+                self._schedule(member_key[0], member_key[1],
+                               (member.order, member.db_idx,
+                                member.compile_command))
+        if touched and 1 not in self._pending:
+            self._pending[1] = set()
+            heapq.heappush(self._pending_rounds, 1)
+        while self._pending_rounds:
+            round_number = heapq.heappop(self._pending_rounds)
+            member_ids = self._pending.pop(round_number)
+            progress = compdb.progress.task(
+                'headerdb round {}'.format(round_number), len(member_ids))
+            for member_id in progress.iterate(sorted(member_ids)):
+                touched.update(self._reconcile((round_number, member_id)))
+            progress.finish()
+            for header in sorted(touched):
+                self._assign(header)
+            touched = set()
+            self._moved = set()
+        return self._get_databases()
+
+    def _get_databases(self):
+        complementary_databases = [
+            InMemoryCompilationDatabase()
+            for _ in range(self._databases_len)
+        ]
+        memo = {}
+        derived = sorted(
+            (member_key for member_key in self._members if member_key[0] > 1),
+            key=lambda member_key: (member_key[0],
+                                    self._sort_key(member_key, memo)))
+        for member_key in derived:
+            member = self._members[member_key]
+            complementary_databases[member.db_idx].compile_commands.append(
+                member.compile_command)
+        return complementary_databases
+
+    def get_state(self, key_indexes):
+        """Return a JSON-serializable state of the computation.
+
+        The included headers are stored by the include cache,
+        the members refer to them by the indexes of key_indexes,
+        filled by IncludeCache.get_state().
+        The derived compile commands share few distinct options,
+        they are stored once, in a table referenced by index.
+        """
+        options = []
+        options_indexes = {}
+        members = []
+        for (round_number, member_id), member in self._members.items():
+            if round_number == 1:
+                # restored from the databases
+                compile_command = None
+            else:
+                # the arguments end with '-c <file>',
+                # see derive_compile_command()
+                arguments = tuple(member.compile_command.arguments[:-2])
+                try:
+                    options_index = options_indexes[arguments]
+                except KeyError:
+                    options_index = len(options)
+                    options_indexes[arguments] = options_index
+                    options.append(arguments)
+                compile_command = [
+                    member.compile_command.directory,
+                    member.compile_command.file, options_index
+                ]
+            members.append([
+                round_number, member_id, member.order, member.db_idx,
+                key_indexes[member.key], member.scores, compile_command
+            ])
+        return {
+            'databases': self._databases_len,
+            'db_files': sorted(self._db_files),
+            'options': options,
+            'members': members,
+            # the (round, member id) of the includers
+            'assignments': [[header, assignment[0], assignment[1]]
+                            for header, assignment in
+                            self._assignments.items()],
+        }
+
+    def restore_state(self, state):
+        """Restore a state returned by get_state().
+
+        The include cache state must be restored beforehand.
+        """
+        self._reset(state['databases'])
+        self._db_files = set(state['db_files'])
+        restored_headers = self.include_cache.restored_headers
+        options = state['options']
+        for round_number, member_id, order, db_idx, key_idx, scores, \
+                compile_command in state['members']:
+            if compile_command is not None:
+                directory, filename, options_index = compile_command
+                compile_command = CompileCommand(
+                    directory, filename,
+                    list(options[options_index]) + ['-c', filename])
+            if round_number == 1:
+                order = tuple(order)
+            else:
+                order_db_idx, discoverer_key, index = order
+                order = (order_db_idx, tuple(discoverer_key), index)
+            member = _Member(order, db_idx, compile_command)
+            member.key, member.headers = restored_headers[key_idx]
+            member.scores = scores
+            member_key = (round_number, member_id)
+            self._members[member_key] = member
+            self._add_candidates(member_key, member)
+        for header, round_number, member_id in state['assignments']:
+            self._assignments[header] = (round_number, member_id, 0)
+
+
 class Complementer(ComplementerInterface):
-    def complement(self, layers):
-        return make_headerdb(layers)
+    STATE_VERSION = 4
+
+    def __init__(self, fs=None):
+        self.fs = fs
+        self._headerdb = None
+        self._restored = False
+
+    def complement(self, layers, jobs=1):
+        if self._headerdb is not None and not self._restored:
+            # the files may have changed since the previous computation
+            self.restore_state(self.get_state())
+        self._restored = False
+        if jobs != 1:
+            # the include cache is not filled by parallel runs,
+            # there is no state to save
+            include_cache = (self._headerdb.include_cache
+                             if self._headerdb else IncludeCache(self.fs))
+            self._headerdb = None
+            return make_headerdb(layers, jobs=jobs,
+                                 include_cache=include_cache)
+        if self._headerdb is None:
+            self._headerdb = IncrementalHeaderDB(IncludeCache(self.fs))
+        with compdb.profiling.phase('header derivation'):
+            return self._headerdb.update(layers)
+
+    def get_state(self):
+        if self._headerdb is None:
+            return None
+        key_indexes = {}
+        return {
+            'version': self.STATE_VERSION,
+            'include_cache':
+            self._headerdb.include_cache.get_state(key_indexes),
+            'headerdb': self._headerdb.get_state(key_indexes),
+        }
+
+    def get_changed_databases(self):
+        if self._headerdb is None or \
+           self._headerdb.changed_databases is None:
+            return None
+        return sorted(self._headerdb.changed_databases)
+
+    def restore_state(self, state):
+        self._headerdb = None
+        if state.get('version') != self.STATE_VERSION:
+            return False
+        include_cache = IncludeCache(self.fs)
+        unchanged = include_cache.restore_state(state['include_cache'])
+        self._headerdb = IncrementalHeaderDB(include_cache)
+        self._headerdb.restore_state(state['headerdb'])
+        # the out-of-date headers are no longer needed
+        include_cache.restored_headers = []
+        self._restored = True
+        return unchanged
@@ -7,56 +7,56 @@ import sys
 import compdb.utils
 
 
-def _xdg_config_home():
-    """Return a path under XDG_CONFIG_HOME directory (defaults to '~/.config').
+def _get_user_dir(xdg_variable, xdg_default, win32_variable):
+    """Return a user directory of the platform, for all the applications.
 
-    https://standards.freedesktop.org/basedir-spec/basedir-spec-latest.html
-    """
-    return os.getenv('XDG_CONFIG_HOME', os.path.expanduser('~/.config'))
-
-
-def _win32_config_dir():
-    """Return resource under APPDATA directory.
+    The configuration and the cache directories are both derived from this
+    function, so that they follow the same rules.
 
+    On Windows, the directory is given by an environment variable, e.g.
+    APPDATA:
     https://technet.microsoft.com/en-us/library/cc749104(v=ws.10).aspx
-    """
-    # Purposefully use a syntax that triggers an error
-    # if the APPDATA environment variable does not exists.
-    # It's not clear what should be the default.
-    return os.environ['APPDATA']
-
 
-def _macos_config_dir():
-    """Return path under macOS specific configuration directory.
+    Other platforms follow the XDG Base Directory Specification:
+    https://standards.freedesktop.org/basedir-spec/basedir-spec-latest.html
     """
-    # What should the directory be?
+    if sys.platform.startswith('win32'):
+        # Purposefully use a syntax that triggers an error
+        # if the environment variable does not exists.
+        # It's not clear what should be the default.
+        return os.environ[win32_variable]
+    # What should the directory be on macOS?
     # ~/Library/Application Support/
     #   https://developer.apple.com/library/content/documentation/General/Conceptual/MOSXAppProgrammingGuide/AppRuntime/AppRuntime.html#//apple_ref/doc/uid/TP40010543-CH2-SW13
     # ~/Library/Preferences/
     #   Someone said so stackoverflow.
     # ~/.config/:
-    #   Same as Linux when XDG_CONFIG_HOME is not defined.
+    #   Same as Linux.
     #
     # Choose the Linux way until someone with more knowledge complains.
-    return os.path.expanduser('~/.config')
+    #
+    # Assume Linux-like behavior for other platforms,
+    # platforms like FreeBSD should have the same behavior as Linux.
+    #
+    # A few platforms would be nice to test:
+    # - cygwin
+    # - msys2
+    return os.getenv(xdg_variable, os.path.expanduser(xdg_default))
 
 
 def get_user_conf():
-    if sys.platform.startswith('win32'):
-        config_dir = _win32_config_dir()
-    elif sys.platform.startswith('darwin'):
-        config_dir = _macos_config_dir()
-    else:
-        # Assume Linux-like behavior for other platforms,
-        # platforms like FreeBSD should have the same behavior as Linux.
-        #
-        # A few platforms would be nice to test:
-        # - cygwin
-        # - msys2
-        config_dir = _xdg_config_home()
+    config_dir = _get_user_dir('XDG_CONFIG_HOME', '~/.config', 'APPDATA')
     return os.path.join(config_dir, 'compdb', 'config')
 
 
+def get_user_cache_home():
+    """Return the directory where the applications put their user caches.
+
+    On Windows, this is LOCALAPPDATA, which is not roamed.
+    """
+    return _get_user_dir('XDG_CACHE_HOME', '~/.cache', 'LOCALAPPDATA')
+
+
 def get_local_conf():
     compdb_dir = compdb.utils.locate_dominating_file('.compdb')
     if compdb_dir:
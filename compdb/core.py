@@ -3,14 +3,18 @@ from __future__ import print_function, unicode_literals, absolute_import
 import glob
 import io
 import itertools
+import json
 import os
 
 import compdb
+import compdb.profiling
 from compdb.backend.json import (JSONCompilationDatabase,
                                  compile_commands_to_json)
 from compdb.backend.memory import InMemoryCompilationDatabase
-from compdb.models import (CompilationDatabaseInterface, ProbeError)
-from compdb.utils import (suppress, re_fullmatch, empty_iterator_wrap)
+from compdb.models import (ChangeSet, CompilationDatabaseInterface,
+                           ProbeError)
+from compdb.utils import (atomic_write, suppress, re_fullmatch,
+                          empty_iterator_wrap)
 
 
 class ComplementerError(compdb.CompdbError):
@@ -36,6 +40,33 @@ class ComplementerNameError(ComplementerError):
                 complementer.name))
 
 
+def _load_state(path):
+    try:
+        with open(path, 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _save_state(path, state):
+    # a crash while saving should not leave a truncated state behind
+    atomic_write(path, json.dumps(state).encode('utf-8'))
+
+
+def _write_if_changed(path, content):
+    """Write content to path, unless the file already has this content.
+
+    Return True if the file has been written.
+    """
+    with suppress(IOError, OSError):
+        with io.open(path, 'r', encoding='utf8') as f:
+            if f.read() == content:
+                return False
+    with io.open(path, 'w', encoding='utf8') as f:
+        f.write(content)
+    return True
+
+
 def _chain_get_compile_commands(databases, filepath):
     return itertools.chain.from_iterable((db.get_compile_commands(filepath)
                                           for db in databases))
@@ -66,8 +97,21 @@ class _ComplementerWrapper(object):
     def cache_filename(self):
         return self.name + '.json'
 
-    def complement(self, databases):
-        return self.complementer.complement(databases)
+    @property
+    def state_filename(self):
+        return self.name + '.state.json'
+
+    def complement(self, databases, jobs=1):
+        return self.complementer.complement(databases, jobs=jobs)
+
+    def get_state(self):
+        return self.complementer.get_state()
+
+    def restore_state(self, state):
+        return self.complementer.restore_state(state)
+
+    def get_changed_databases(self):
+        return self.complementer.get_changed_databases()
 
 
 class CompilationDatabase(object):
@@ -78,6 +122,11 @@ class CompilationDatabase(object):
         self._directories = []
         self.raise_on_missing_cache = True
 
+    @property
+    def directories(self):
+        """The directories of the databases, in order."""
+        return list(self._directories)
+
     def register_backend(self, db_cls):
         if db_cls not in self._registry:
             self._registry.append(db_cls)
@@ -119,7 +168,8 @@ class CompilationDatabase(object):
                 yield InMemoryCompilationDatabase()
 
     def _probe_dir(self, directory):
-        return (list(self._probe_dir1(directory)), directory)
+        with compdb.profiling.phase('probe'):
+            return (list(self._probe_dir1(directory)), directory)
 
     def add_directory(self, directory):
         self._add_database(self._probe_dir(directory))
@@ -156,23 +206,132 @@ class CompilationDatabase(object):
             databases.extend(self._add_directory_pattern1(path_pattern))
         self._add_databases(databases)
 
-    def update_complements(self):
+    def _get_inputs_fingerprint(self):
+        return {
+            'directories': self._directories,
+            'databases': [[db.get_fingerprint() for db in layer]
+                          for layer in self._layers],
+        }
+
+    def _has_caches(self, complementer, layer):
+        if len(layer) != len(self._directories):
+            return False
+        for directory in self._directories:
+            cache_path = os.path.join(directory, complementer.cache_filename)
+            if not os.path.exists(cache_path):
+                return False
+        return True
+
+    def update_complements(self, jobs=1):
+        """Compute the complements and save them to the cache files.
+
+        The complementer state is saved next to the cache file of the first
+        directory, along with a fingerprint of the complemented databases.
+        When the databases and the state are unchanged, the complement is
+        up-to-date and the cache files are kept as-is.
+        Otherwise, the complement is recomputed with the help of the state,
+        e.g. the header database recomputes only what depends on the changes,
+        and only the modified cache files are rewritten,
+        the complementer tells which ones are unchanged,
+        see ComplementerInterface.get_changed_databases().
+        """
+        previous_layers = self._layers[1:]
         # clear all complementary databases but keep the initial database
         del self._layers[1:]
         # incrementally compute the complements,
         # each complement depends on its predecesors
-        for complementer in self._complementers:
+        for complementer, previous_layer in zip(self._complementers,
+                                                previous_layers):
             yield ('begin', {'complementer': complementer.name})
-            layer = complementer.complement(self._layers)
+            inputs = self._get_inputs_fingerprint()
+            state_path = None
+            state = None
+            if self._directories:
+                state_path = os.path.join(self._directories[0],
+                                          complementer.state_filename)
+                state = _load_state(state_path)
+            layer = None
+            if state and state.get('complementer') is not None:
+                unchanged = complementer.restore_state(state['complementer'])
+                if unchanged and state.get('inputs') == inputs and \
+                   self._has_caches(complementer, previous_layer):
+                    layer = previous_layer
+            if layer is not None:
+                yield ('up-to-date', {'complementer': complementer.name})
+            else:
+                layer = complementer.complement(self._layers, jobs=jobs)
+                changed = None
+                if state and self._has_caches(complementer, previous_layer):
+                    # the caches are the complements of the restored state
+                    changed = complementer.get_changed_databases()
+                for i, (db, directory) in enumerate(
+                        zip(layer, self._directories)):
+                    if changed is not None and i not in changed:
+                        continue
+                    cache_path = os.path.join(directory,
+                                              complementer.cache_filename)
+                    output = io.StringIO()
+                    compile_commands_to_json(db.get_all_compile_commands(),
+                                             output)
+                    if _write_if_changed(cache_path, output.getvalue()):
+                        yield ('saving', {'file': cache_path})
+                complementer_state = complementer.get_state()
+                if state_path and complementer_state is not None:
+                    _save_state(state_path, {
+                        'inputs': inputs,
+                        'complementer': complementer_state,
+                    })
+                elif state:
+                    # the state is obsolete
+                    with suppress(OSError):
+                        os.remove(state_path)
             self._layers.append(layer)
-            for db, directory in zip(layer, self._directories):
-                cache_path = os.path.join(directory,
-                                          complementer.cache_filename)
-                yield ('saving', {'file': cache_path})
-                with io.open(cache_path, 'w', encoding='utf8') as f:
-                    compile_commands_to_json(db.get_all_compile_commands(), f)
             yield ('end', {'complementer': complementer.name})
 
+    def refresh(self):
+        """Reload the databases whose source changed since they were loaded.
+
+        This lets long-lived processes pick up regenerated databases,
+        without reloading the unchanged ones.
+        When the databases of a complementer changed,
+        its complement is computed again, in memory,
+        the cache files and the complementer state are left as-is,
+        update_complements() is the one saving them.
+        Return a ChangeSet of the compile commands changed in all databases,
+        the complements included,
+        the caller can use it to invalidate its own caches,
+        e.g. with IncludedByDatabase.update().
+        The response files which changed are read again,
+        when the expanded arguments are next accessed.
+        """
+        import compdb.responsefile
+
+        compdb.responsefile.revalidate()
+        changes = ChangeSet()
+        for i, layer in enumerate(self._layers):
+            if i > 0 and changes:
+                changes.update(self._recomplement(i))
+                continue
+            for db in layer:
+                changes.update(db.refresh())
+        return changes
+
+    def _recomplement(self, i):
+        complementer = self._complementers[i - 1]
+        if complementer.get_state() is None and self._directories:
+            # start from the state of the last update_complements()
+            state = _load_state(
+                os.path.join(self._directories[0],
+                             complementer.state_filename))
+            if state and state.get('complementer') is not None:
+                complementer.restore_state(state['complementer'])
+        layer = complementer.complement(self._layers[:i])
+        changes = ChangeSet.diff(
+            list(_chain_get_all_compile_commands(self._layers[i])),
+            list(_chain_get_all_compile_commands(layer)))
+        self._layers[i] = layer
+        return changes
+
     def get_compile_commands(self, filepath, **kwargs):
         def uniquify(compile_commands):
             for compile_command in compile_commands:
@@ -199,6 +358,18 @@ class CompilationDatabase(object):
         return itertools.chain.from_iterable((_chain_get_all_files(layer)
                                               for layer in self._layers))
 
+    def stream_compile_commands(self):
+        """Iterate over the compile commands of the databases, once.
+
+        The complementary databases are not included.
+        Each database is unloaded once iterated,
+        so that the memory does not grow with the number of databases.
+        """
+        for db in self._layers[0]:
+            for compile_command in db.get_all_compile_commands():
+                yield compile_command
+            db.unload()
+
     def get_all_compile_commands(self, **kwargs):
         def uniquify(compile_commands):
             serialized_files = set()
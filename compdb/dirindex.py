@@ -0,0 +1,132 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+
+import compdb.complementer.headerdb
+import compdb.stats
+
+
+def split_path(path):
+    """Split a path into a list of directory components.
+
+    The first component is the root of the path, e.g. '/' or 'C:\\'.
+    """
+    drive, path = os.path.splitdrive(compdb.stats.normpath(path))
+    components = [drive + os.sep]
+    components.extend(c for c in path.split(os.sep) if c)
+    return components
+
+
+class _TrieNode(object):
+    __slots__ = ['children', 'values']
+
+    def __init__(self):
+        self.children = {}
+        self.values = None
+
+
+class PathTrie(object):
+    """Map directories to sets of values, queryable by path prefix."""
+
+    def __init__(self):
+        self._root = _TrieNode()
+
+    def add(self, directory, value):
+        node = self._root
+        for component in split_path(directory):
+            try:
+                node = node.children[component]
+            except KeyError:
+                child = _TrieNode()
+                node.children[component] = child
+                node = child
+        if node.values is None:
+            node.values = set()
+        node.values.add(value)
+
+    def iter_prefixes(self, path):
+        """Iterate over the values of the directories containing path.
+
+        Yield tuples of (depth, values), from the shallowest directory to the
+        deepest one.
+        """
+        node = self._root
+        for depth, component in enumerate(split_path(path)):
+            node = node.children.get(component)
+            if node is None:
+                return
+            if node.values:
+                yield depth, node.values
+
+
+class IncludeDirectoryIndex(object):
+    """Reverse index of header search paths to the compile commands using them.
+
+    The header search paths of a compile command are its include directories,
+    as returned by extract_include_dirs(),
+    and the directory of the source file, for quoted includes.
+
+    For a given header, the index tells which compile commands could possibly
+    see the header, without reading any source file.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._compile_commands = []
+        self._trie = PathTrie()
+        for compile_command in database.get_all_compile_commands():
+            idx = len(self._compile_commands)
+            self._compile_commands.append(compile_command)
+            self._trie.add(
+                compdb.complementer.headerdb.get_implicit_header_search_path(
+                    compile_command), idx)
+            for include_dir in \
+                    compdb.complementer.headerdb.extract_include_dirs(
+                        compile_command):
+                self._trie.add(include_dir, idx)
+
+    def _iter_levels(self, path):
+        # a file cannot be in the search path it is a prefix of
+        return self._trie.iter_prefixes(os.path.dirname(path))
+
+    def get_candidates(self, path):
+        """Return the compile commands that could include the given path.
+
+        The compile commands are returned in database order.
+        """
+        return self.get_candidates_of_paths([path])
+
+    def get_candidates_of_paths(self, paths):
+        """Return the compile commands that could include any of the paths.
+
+        The compile commands are returned in database order.
+        """
+        indexes = set()
+        for path in paths:
+            for _, values in self._iter_levels(path):
+                indexes.update(values)
+        return [self._compile_commands[i] for i in sorted(indexes)]
+
+    def get_best(self, path):
+        """Return the compile command the most likely to include path.
+
+        The preferred compile commands are the ones with the most specific
+        search path, the deepest directory containing path.
+        Ties are resolved by file similarity, then by database order.
+        """
+        deepest = None
+        for _, values in self._iter_levels(path):
+            deepest = values
+        if not deepest:
+            return None
+        path = compdb.stats.normpath(path)
+        best = None
+        best_score = None
+        for i in sorted(deepest):
+            compile_command = self._compile_commands[i]
+            score = compdb.complementer.headerdb.score_other_file(
+                path, compile_command.normfile)
+            if best_score is None or score > best_score:
+                best_score = score
+                best = compile_command
+        return best
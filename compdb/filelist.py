@@ -1,32 +1,123 @@
 from __future__ import print_function, unicode_literals, absolute_import
 
-import fnmatch
+import io
 import itertools
 import os
+import re
+import struct
+
+import compdb
+import compdb.filesystem
+import compdb.utils
+
+
+SOURCE_EXTENSIONS = [
+    '.c',
+    '.C',
+    '.cc',
+    '.c++',
+    '.C++',
+    '.cxx',
+    '.cpp',
+]
+
+HEADER_EXTENSIONS = [
+    '.h',
+    '.H',
+    '.hh',
+    '.h++',
+    '.H++',
+    '.hxx',
+    '.hpp',
+]
+
+
+def glob_to_regex(pattern):
+    """Translate a fnmatch pattern to a regex string.
+
+    The translation matches the semantic of fnmatch.fnmatchcase(),
+    '*' matches any string, including path separators.
+    """
+    i = 0
+    n = len(pattern)
+    res = ''
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            res += '.*'
+        elif c == '?':
+            res += '.'
+        elif c == '[':
+            j = i
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                res += r'\['
+            else:
+                stuff = pattern[i:j].replace('\\', r'\\')
+                i = j + 1
+                if stuff[0] == '!':
+                    stuff = '^' + stuff[1:]
+                elif stuff[0] == '^':
+                    stuff = '\\' + stuff
+                res += '[{}]'.format(stuff)
+        else:
+            res += re.escape(c)
+    return res
+
+
+def compile_suppressions(patterns):
+    """Compile suppression patterns to a single regex matching paths.
+
+    A path is suppressed if it matches '*/<pattern>'.
+    Return None if there is no pattern.
+    """
+    if not patterns:
+        return None
+    return re.compile(r'(?s)(?:{})\Z'.format('|'.join(
+        '(?:.*/{})'.format(glob_to_regex(p)) for p in patterns)))
+
+
+def compile_directory_suppressions(patterns):
+    """Compile the patterns suppressing whole directories.
+
+    The returned regex matches a directory path, with a trailing separator,
+    if all the files under this directory are suppressed.
+    This is the case of the patterns ending with '*',
+    e.g. 'foo/*' suppresses the directories named 'foo'.
+    Return None if there is no such pattern.
+    """
+    return compile_suppressions([p[:-1] for p in patterns if p.endswith('*')])
+
+
+def read_suppressions_file(path):
+    """Return the patterns of a suppressions file.
+
+    Each line is a pattern, '#' starts a comment.
+    """
+    patterns = []
+    with io.open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            pattern = line.partition('#')[0].rstrip()
+            if pattern:
+                patterns.append(pattern)
+    return patterns
 
 
 class FileScanner(object):
-    def __init__(self):
+    def __init__(self, fs=None):
+        self.fs = fs or compdb.filesystem.get_default()
+        # number of threads walking the top-level subtrees
+        self.jobs = 1
         self.extensions = []
         self.suppressions = []
-        self.source_exts = [
-            '.c',
-            '.C',
-            '.cc',
-            '.c++',
-            '.C++',
-            '.cxx',
-            '.cpp',
-        ]
-        self.header_exts = [
-            '.h',
-            '.H',
-            '.hh',
-            '.h++',
-            '.H++',
-            '.hxx',
-            '.hpp',
-        ]
+        self.source_exts = list(SOURCE_EXTENSIONS)
+        self.header_exts = list(HEADER_EXTENSIONS)
 
     def enable_group(self, group):
         if group == 'source':
@@ -35,27 +126,251 @@ class FileScanner(object):
             self.extensions += self.header_exts
 
     def add_suppressions(self, suppressions):
-        # filter out suppressions
-        # could convert the fnmatch expression to regex
-        # and use re.search() instead of prefixing */ pattern
-        self.suppressions.extend(
-            ['*/{}'.format(supp) for supp in suppressions])
-
-    def _accept_path(self, path):
-        if os.path.splitext(path)[1] not in self.extensions:
-            return False
-        for suppression in self.suppressions:
-            if fnmatch.fnmatchcase(path, suppression):
-                return False
-        return True
+        self.suppressions.extend(suppressions)
+
+    def _scan_tree(self, top, extensions, suppressions_re,
+                   dir_suppressions_re):
+        """Top-down walk, the suppressed directories are not descended."""
+        listdir = self.fs.listdir
+        splitext = os.path.splitext
+        DIRECTORY = compdb.filesystem.DIRECTORY
+        DIRECTORY_LINK = compdb.filesystem.DIRECTORY_LINK
+        stack = [top]
+        while stack:
+            root = stack.pop()
+            try:
+                entries = listdir(root)
+            except OSError:
+                continue
+            subdirs = []
+            for name, kind in sorted(entries.items()):
+                path = os.path.join(root, name)
+                if kind == DIRECTORY:
+                    if dir_suppressions_re and \
+                       dir_suppressions_re.match(os.path.join(path, '')):
+                        continue
+                    subdirs.append(path)
+                elif kind == DIRECTORY_LINK:
+                    # like os.walk(), do not follow symbolic links
+                    continue
+                elif splitext(name)[1] in extensions:
+                    if suppressions_re and suppressions_re.match(path):
+                        continue
+                    yield path
+            stack.extend(reversed(subdirs))
 
     def scan(self, path):
-        for root, dirnames, filenames in os.walk(os.path.abspath(path)):
-            for filename in filenames:
-                out_path = os.path.join(root, filename)
-                if self._accept_path(out_path):
+        """Iterate over the files of a tree, top-down.
+
+        When more than one job is specified,
+        the top-level subtrees are walked in parallel.
+        """
+        top = os.path.abspath(path)
+        extensions = frozenset(self.extensions)
+        suppressions_re = compile_suppressions(self.suppressions)
+        dir_suppressions_re = compile_directory_suppressions(self.suppressions)
+        if self.jobs <= 1:
+            for out_path in self._scan_tree(top, extensions, suppressions_re,
+                                            dir_suppressions_re):
+                yield out_path
+            return
+
+        try:
+            entries = self.fs.listdir(top)
+        except OSError:
+            return
+        subtrees = []
+        for name, kind in sorted(entries.items()):
+            out_path = os.path.join(top, name)
+            if kind == compdb.filesystem.DIRECTORY:
+                if not (dir_suppressions_re and dir_suppressions_re.match(
+                        os.path.join(out_path, ''))):
+                    subtrees.append(out_path)
+            elif kind != compdb.filesystem.DIRECTORY_LINK and \
+                    os.path.splitext(name)[1] in extensions and \
+                    not (suppressions_re and suppressions_re.match(out_path)):
+                yield out_path
+
+        def scan_subtree(subtree):
+            return list(
+                self._scan_tree(subtree, extensions, suppressions_re,
+                                dir_suppressions_re))
+
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(self.jobs)
+        try:
+            for out_paths in pool.imap(scan_subtree, subtrees):
+                for out_path in out_paths:
                     yield out_path
+        finally:
+            pool.close()
+            pool.join()
 
     def scan_many(self, paths):
         return itertools.chain.from_iterable((self.scan(path)
                                               for path in paths))
+
+
+class GitIndexError(compdb.CompdbError):
+    '''Raised when a git index cannot be read'''
+    pass
+
+
+_GIT_INDEX_HEADER = struct.Struct('>4sLL')
+# ctime, mtime, dev, ino, mode, uid, gid, size, then the object name
+_GIT_INDEX_ENTRY_STAT = struct.Struct('>LLLLLLLLLL')
+_GIT_INDEX_FLAG_EXTENDED = 0x4000
+_GIT_INDEX_FLAG_STAGE = 0x3000
+_GIT_INDEX_FLAG_NAME_MASK = 0xfff
+_GIT_INDEX_EXT_FLAG_SKIP_WORKTREE = 0x4000
+_GIT_MODE_TYPE_MASK = 0o170000
+_GIT_MODE_REGULAR = 0o100000
+_GIT_MODE_SYMLINK = 0o120000
+
+
+def _decode_git_path(b_path):
+    try:
+        return b_path.decode('utf-8')
+    except UnicodeDecodeError:
+        return b_path.decode('latin-1')
+
+
+def _read_varint(data, pos):
+    """Read a git offset varint, return (value, new position)."""
+    byte = bytearray(data[pos:pos + 1])[0]
+    pos += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = bytearray(data[pos:pos + 1])[0]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, pos
+
+
+def _parse_git_index(data, hash_size):
+    signature, version, count = _GIT_INDEX_HEADER.unpack_from(data, 0)
+    if signature != b'DIRC' or version not in (2, 3, 4):
+        raise ValueError('unsupported git index')
+    pos = _GIT_INDEX_HEADER.size
+    path = b''
+    for _ in range(count):
+        entry_start = pos
+        mode = _GIT_INDEX_ENTRY_STAT.unpack_from(data, pos)[6]
+        pos += _GIT_INDEX_ENTRY_STAT.size + hash_size
+        flags, = struct.unpack_from('>H', data, pos)
+        pos += 2
+        ext_flags = 0
+        if version >= 3 and flags & _GIT_INDEX_FLAG_EXTENDED:
+            ext_flags, = struct.unpack_from('>H', data, pos)
+            pos += 2
+        if version == 4:
+            strip_len, pos = _read_varint(data, pos)
+            end = data.index(b'\0', pos)
+            path = path[:len(path) - strip_len] + data[pos:end]
+            pos = end + 1
+        else:
+            end = data.index(b'\0', pos)
+            path = data[pos:end]
+            # entries are padded with 1-8 NUL bytes
+            # to a multiple of eight bytes
+            pos = entry_start + ((end - entry_start) // 8 + 1) * 8
+        if flags & _GIT_INDEX_FLAG_STAGE:
+            continue
+        if ext_flags & _GIT_INDEX_EXT_FLAG_SKIP_WORKTREE:
+            continue
+        if mode & _GIT_MODE_TYPE_MASK not in (_GIT_MODE_REGULAR,
+                                              _GIT_MODE_SYMLINK):
+            continue
+        yield _decode_git_path(path)
+
+
+def iter_git_index(index_path, hash_size=20):
+    """Iterate over the paths of the files tracked in a git index file.
+
+    Support index versions 2, 3 and 4, the format is documented in
+    git's Documentation/technical/index-format.txt.
+    The paths are relative to the work tree and use '/' as a separator.
+    Submodules, unmerged entries and files excluded by a sparse checkout
+    are skipped.
+    """
+    try:
+        with io.open(index_path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError) as exc:
+        raise GitIndexError('{}: cannot read git index'.format(index_path),
+                            exc)
+    try:
+        for path in _parse_git_index(data, hash_size):
+            yield path
+    except (struct.error, ValueError, IndexError) as exc:
+        raise GitIndexError(
+            '{}: invalid git index: {}'.format(index_path, exc), exc)
+
+
+def locate_git_index(path):
+    """Find the work tree containing path and its index file.
+
+    Return a tuple (work tree, index path, hash size),
+    or None if path is not in a git work tree.
+    """
+    work_tree = compdb.utils.locate_dominating_file('.git', path)
+    if not work_tree:
+        return None
+    git_dir = os.path.join(work_tree, '.git')
+    if os.path.isfile(git_dir):
+        # work trees and submodules use a file pointing to the git directory
+        with io.open(git_dir, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        if not content.startswith('gitdir:'):
+            return None
+        git_dir = os.path.join(work_tree, content[len('gitdir:'):].strip())
+    hash_size = 20
+    config_path = os.path.join(git_dir, 'config')
+    if not os.path.isfile(config_path):
+        # linked work trees share the configuration of the main repository
+        with compdb.utils.suppress(IOError, OSError):
+            with io.open(os.path.join(git_dir, 'commondir'), 'r') as f:
+                config_path = os.path.join(git_dir, f.read().strip(),
+                                           'config')
+    with compdb.utils.suppress(IOError, OSError):
+        with io.open(config_path, 'r', encoding='utf-8') as f:
+            if re.search(r'^\s*objectformat\s*=\s*sha256\s*$', f.read(),
+                         re.IGNORECASE | re.MULTILINE):
+                hash_size = 32
+    return work_tree, os.path.join(git_dir, 'index'), hash_size
+
+
+class GitIndexScanner(FileScanner):
+    """A FileScanner listing the files tracked by git.
+
+    The git index is parsed directly, without spawning git,
+    which is much faster than walking the work tree.
+    The extension groups and the suppressions work like FileScanner's.
+    Paths which are not in a git work tree are walked normally.
+    """
+
+    def scan(self, path):
+        top = os.path.abspath(path)
+        location = locate_git_index(top)
+        if location is None:
+            for out_path in super(GitIndexScanner, self).scan(path):
+                yield out_path
+            return
+        work_tree, index_path, hash_size = location
+        prefix = os.path.relpath(top, work_tree).replace(os.sep, '/')
+        if prefix == '.':
+            prefix = ''
+        else:
+            prefix += '/'
+        extensions = frozenset(self.extensions)
+        suppressions_re = compile_suppressions(self.suppressions)
+        for rel_path in iter_git_index(index_path, hash_size):
+            if not rel_path.startswith(prefix):
+                continue
+            if os.path.splitext(rel_path)[1] not in extensions:
+                continue
+            out_path = os.path.join(work_tree, *rel_path.split('/'))
+            if suppressions_re and suppressions_re.match(out_path):
+                continue
+            yield out_path
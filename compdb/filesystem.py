@@ -0,0 +1,349 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import errno
+import os
+
+import compdb
+import compdb.stats
+
+try:
+    from os import scandir
+except ImportError:
+    # py2
+    scandir = None
+
+# kinds of directory entries
+FILE = 'file'
+DIRECTORY = 'directory'
+# a symbolic link to a directory, walkers do not descend into these
+DIRECTORY_LINK = 'directory-link'
+OTHER = 'other'
+
+
+def _not_found(path):
+    return OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+
+class FileSystemInterface(object):
+    """Access to the files of the file system.
+
+    The subsystems which query the file system extensively take an optional
+    file system object, the default one is returned by get_default().
+    """
+
+    def listdir(self, path):
+        """Return a dict mapping the entries of a directory to their kind.
+
+        Raise OSError if the directory cannot be listed.
+        """
+        raise compdb.NotImplementedError
+
+    def isfile(self, path):
+        raise compdb.NotImplementedError
+
+    def isdir(self, path):
+        raise compdb.NotImplementedError
+
+    def exists(self, path):
+        raise compdb.NotImplementedError
+
+    def stat(self, path):
+        """Return an object with the st_mtime and st_size attributes.
+
+        Raise OSError if the file does not exists.
+        """
+        raise compdb.NotImplementedError
+
+    def read(self, path):
+        """Return the content of a file, as bytes."""
+        raise compdb.NotImplementedError
+
+
+def _entry_kind(entry):
+    if entry.is_dir():
+        if entry.is_symlink():
+            return DIRECTORY_LINK
+        return DIRECTORY
+    if entry.is_file():
+        return FILE
+    if entry.is_symlink() and not os.path.exists(entry.path):
+        # dangling symlink
+        return None
+    return OTHER
+
+
+def _path_kind(path):
+    if os.path.isdir(path):
+        if os.path.islink(path):
+            return DIRECTORY_LINK
+        return DIRECTORY
+    if os.path.isfile(path):
+        return FILE
+    if os.path.exists(path):
+        return OTHER
+    return None
+
+
+class RealFileSystem(FileSystemInterface):
+    """The file system of the operating system, without caching."""
+
+    def listdir(self, path):
+        compdb.stats.add(compdb.stats.DIRECTORY_LISTINGS)
+        entries = {}
+        if scandir is not None:
+            for entry in scandir(path):
+                kind = _entry_kind(entry)
+                if kind:
+                    entries[entry.name] = kind
+        else:
+            for name in os.listdir(path):
+                kind = _path_kind(os.path.join(path, name))
+                if kind:
+                    entries[name] = kind
+        return entries
+
+    def isfile(self, path):
+        compdb.stats.add(compdb.stats.STAT_CALLS)
+        return os.path.isfile(path)
+
+    def isdir(self, path):
+        compdb.stats.add(compdb.stats.STAT_CALLS)
+        return os.path.isdir(path)
+
+    def exists(self, path):
+        compdb.stats.add(compdb.stats.STAT_CALLS)
+        return os.path.exists(path)
+
+    def stat(self, path):
+        compdb.stats.add(compdb.stats.STAT_CALLS)
+        return os.stat(path)
+
+    def read(self, path):
+        compdb.stats.add(compdb.stats.FILE_OPENS)
+        with open(path, 'rb') as f:
+            content = f.read()
+        compdb.stats.add(compdb.stats.BYTES_READ, len(content))
+        return content
+
+
+class SnapshotFileSystem(RealFileSystem):
+    """A file system answering existence queries from cached listings.
+
+    Each directory is listed at most once, subsequent queries for the files
+    of this directory do not touch the file system.
+    This makes a difference on slow file systems, such as NFS.
+
+    The cache is a snapshot, it does not see the changes made after
+    a directory has been listed, unless invalidate() is called.
+    Paths are made absolute and normalized before lookup.
+    A name missing from a listing,
+    but matching one of its entries with another case,
+    is checked on the file system,
+    which finds it if the file system is case-insensitive.
+    """
+
+    # directory that exists, but cannot be listed, e.g. no read permission
+    _UNLISTABLE = object()
+
+    def __init__(self):
+        self._listings = {}
+        # directory -> lowercase names of the listing
+        self._lowercase_names = {}
+        # path -> kind, for the names found with another case
+        self._case_mismatches = {}
+
+    def __reduce__(self):
+        # e.g. for the worker processes, which take their own snapshot
+        return self.__class__, ()
+
+    def invalidate(self, directory=None):
+        """Forget the listing of a directory, or of all directories."""
+        if directory is None:
+            self._listings.clear()
+            self._lowercase_names.clear()
+            self._case_mismatches.clear()
+        else:
+            directory = os.path.abspath(directory)
+            self._listings.pop(directory, None)
+            self._lowercase_names.pop(directory, None)
+            for path in list(self._case_mismatches):
+                if os.path.dirname(path) == directory:
+                    del self._case_mismatches[path]
+
+    def _get_listing(self, directory):
+        try:
+            return self._listings[directory]
+        except KeyError:
+            pass
+        try:
+            listing = super(SnapshotFileSystem, self).listdir(directory)
+        except OSError as exc:
+            if exc.errno in (errno.EACCES, errno.EPERM):
+                listing = self._UNLISTABLE
+            else:
+                listing = None
+        self._listings[directory] = listing
+        return listing
+
+    def _kind(self, path):
+        path = os.path.abspath(path)
+        directory, name = os.path.split(path)
+        if not name:
+            # root directory
+            if self._get_listing(path) is None:
+                return None
+            return DIRECTORY
+        listing = self._get_listing(directory)
+        if listing is self._UNLISTABLE:
+            return _path_kind(path)
+        if listing is None:
+            return None
+        kind = listing.get(name)
+        if kind is None:
+            kind = self._case_mismatch_kind(directory, name, listing)
+        return kind
+
+    def _case_mismatch_kind(self, directory, name, listing):
+        try:
+            lowercase_names = self._lowercase_names[directory]
+        except KeyError:
+            lowercase_names = set(entry.lower() for entry in listing)
+            self._lowercase_names[directory] = lowercase_names
+        if name.lower() not in lowercase_names:
+            return None
+        path = os.path.join(directory, name)
+        try:
+            return self._case_mismatches[path]
+        except KeyError:
+            pass
+        compdb.stats.add(compdb.stats.STAT_CALLS)
+        kind = _path_kind(path)
+        self._case_mismatches[path] = kind
+        return kind
+
+    def listdir(self, path):
+        listing = self._get_listing(os.path.abspath(path))
+        if listing is None:
+            raise _not_found(path)
+        if listing is self._UNLISTABLE:
+            raise OSError(errno.EACCES, os.strerror(errno.EACCES), path)
+        return listing
+
+    def isfile(self, path):
+        return self._kind(path) == FILE
+
+    def isdir(self, path):
+        return self._kind(path) in (DIRECTORY, DIRECTORY_LINK)
+
+    def exists(self, path):
+        return self._kind(path) is not None
+
+
+class _InMemoryStat(object):
+    def __init__(self, st_mtime, st_size):
+        self.st_mtime = st_mtime
+        self.st_size = st_size
+
+
+# the operations of the real file system, counted by the in-memory one
+_STATS_OPERATIONS = {
+    'listdir': compdb.stats.DIRECTORY_LISTINGS,
+    'isfile': compdb.stats.STAT_CALLS,
+    'isdir': compdb.stats.STAT_CALLS,
+    'exists': compdb.stats.STAT_CALLS,
+    'stat': compdb.stats.STAT_CALLS,
+    'read': compdb.stats.FILE_OPENS,
+}
+
+
+class InMemoryFileSystem(FileSystemInterface):
+    """A file system made of a dict of absolute paths to bytes.
+
+    The directories are implied by the paths of the files.
+    The number of calls to each method is recorded in the calls dict,
+    which is convenient for tests and benchmarks.
+    """
+
+    def __init__(self, files=None, mtime=0):
+        self._files = {}
+        self._directories = {}
+        self.mtime = mtime
+        self.calls = {}
+        for path, content in (files or {}).items():
+            self.add_file(path, content)
+
+    def add_file(self, path, content):
+        path = compdb.stats.normpath(path)
+        self._files[path] = content
+        directory, name = os.path.split(path)
+        while name:
+            self._directories.setdefault(directory, set()).add(name)
+            directory, name = os.path.split(directory)
+
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        compdb.stats.add(_STATS_OPERATIONS[method])
+
+    def listdir(self, path):
+        self._count('listdir')
+        path = compdb.stats.normpath(path)
+        try:
+            names = self._directories[path]
+        except KeyError:
+            raise _not_found(path)
+        return {
+            name: FILE if os.path.join(path, name) in self._files
+            else DIRECTORY
+            for name in names
+        }
+
+    def isfile(self, path):
+        self._count('isfile')
+        return compdb.stats.normpath(path) in self._files
+
+    def isdir(self, path):
+        self._count('isdir')
+        return compdb.stats.normpath(path) in self._directories
+
+    def exists(self, path):
+        self._count('exists')
+        path = compdb.stats.normpath(path)
+        return path in self._files or path in self._directories
+
+    def stat(self, path):
+        self._count('stat')
+        path = compdb.stats.normpath(path)
+        if path in self._directories:
+            return _InMemoryStat(self.mtime, 0)
+        try:
+            content = self._files[path]
+        except KeyError:
+            raise _not_found(path)
+        return _InMemoryStat(self.mtime, len(content))
+
+    def read(self, path):
+        self._count('read')
+        try:
+            content = self._files[compdb.stats.normpath(path)]
+        except KeyError:
+            raise _not_found(path)
+        compdb.stats.add(compdb.stats.BYTES_READ, len(content))
+        return content
+
+
+_default = RealFileSystem()
+
+
+def get_default():
+    """Return the file system used when none is specified."""
+    return _default
+
+
+def set_default(fs):
+    """Set the file system used when none is specified.
+
+    Short-lived processes, like the command line tool,
+    can set a SnapshotFileSystem here.
+    """
+    global _default
+    _default = fs
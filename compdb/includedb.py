@@ -2,15 +2,28 @@ from __future__ import print_function, unicode_literals, absolute_import
 
 import logging
 import os
-import re
+import sys
+import threading
 
 from collections import deque
 
 import compdb.complementer.headerdb
+import compdb.dirindex
+import compdb.filelist
+import compdb.filesystem
+import compdb.profiling
+import compdb.progress
+import compdb.stats
 import compdb.utils
 
 from compdb.models import CompilationDatabaseInterface
 
+try:
+    import queue
+except ImportError:
+    # py2
+    import Queue as queue
+
 try:
     FileNotFoundError
 except NameError:
@@ -19,6 +32,8 @@ except NameError:
 
 logger = logging.getLogger(__name__)
 
+_HEADER_EXTENSIONS = frozenset(compdb.filelist.HEADER_EXTENSIONS)
+
 
 class IncludeDirective(object):
     __slots__ = [
@@ -36,9 +51,14 @@ class IncludeDirective(object):
 
 
 class Preprocessor(object):
-    def __init__(self):
+    def __init__(self, fs=None):
+        self.fs = fs or compdb.filesystem.get_default()
         self.callbacks = []
         self._processed = set()
+        # scanned file -> (search paths, resolved includes),
+        # the includes of a file are resolved with the search paths
+        # of the first compile command reaching it
+        self.scans = {}
 
     def register_include_callback(self, cb):
         self.callbacks.append(cb)
@@ -51,17 +71,34 @@ class Preprocessor(object):
             return
 
         self._processed.add(includer_stack[0])
-        iter_stack = [self._iter_includes(includer_stack[0])]
+        iter_stack = [
+            self._iter_resolved_includes(includer_stack[0], search_paths,
+                                         True)
+        ]
 
         while iter_stack:
             try:
-                quote, header_name = next(iter_stack[-1])
+                includee = next(iter_stack[-1])
             except StopIteration:
                 iter_stack.pop()
                 includer_stack.pop()
                 continue
 
-            includer = includer_stack[-1]
+            if includee in self._processed:
+                continue
+            self._processed.add(includee)
+            includer_stack.append(includee)
+            iter_stack.append(
+                self._iter_resolved_includes(includee, search_paths, False))
+
+    def _iter_resolved_includes(self, includer, search_paths,
+                                source_is_main_file):
+        """Iterate over the paths of the headers included by includer.
+
+        The include callbacks are called for each resolved header.
+        """
+        resolved = []
+        for quote, header_name in self._iter_includes(includer):
             is_angled = quote == "<"
             search_path = self._resolve_search_path(header_name, is_angled,
                                                     search_paths, includer)
@@ -82,39 +119,28 @@ class Preprocessor(object):
                          header_name, is_angled and '>' or '"')
 
             if self.callbacks:
-                source_is_main_file = len(includer_stack) == 1
                 include_directive = IncludeDirective(header_name, is_angled,
                                                      search_path, includer,
                                                      source_is_main_file)
                 for cb in self.callbacks:
                     cb(include_directive)
 
-            includee = os.path.normpath(os.path.join(search_path, header_name))
-            if includee in self._processed:
-                continue
-            self._processed.add(includee)
-            includer_stack.append(includee)
-            iter_stack.append(self._iter_includes(includer_stack[-1]))
+            includee = compdb.stats.normpath(
+                os.path.join(search_path, header_name))
+            resolved.append(includee)
+            yield includee
+        self.scans[includer] = (search_paths, resolved)
 
     def _iter_includes(self, path):
-        try:
-            with open(path, "rb") as istream:
-                include_pattern = re.compile(
-                    br'\s*#\s*include\s+(?P<quote>["<])(?P<filename>.+?)[">]')
-                for b_line in istream:
-                    b_match = re.match(include_pattern, b_line)
-                    if not b_match:
-                        continue
-                    u_quote = b_match.group('quote').decode('ascii')
-                    b_filename = b_match.group('filename')
-                    try:
-                        u_filename = b_filename.decode('utf-8')
-                    except UnicodeDecodeError:
-                        u_filename = b_filename.decode('latin-1')
-                    yield (u_quote, u_filename)
-        except FileNotFoundError as exc:
-            # tolerate, but log, missing files [GH-4]
-            logger.warning("%s", exc)
+        with compdb.profiling.phase('include scanning'):
+            try:
+                content = self.fs.read(path)
+            except FileNotFoundError as exc:
+                # tolerate, but log, missing files [GH-4]
+                logger.warning("%s", exc)
+                return iter(())
+            return iter(
+                compdb.complementer.headerdb.parse_content_includes(content))
 
     def _iter_search_paths(self, is_angled, search_paths, includer):
         if not is_angled:
@@ -124,10 +150,40 @@ class Preprocessor(object):
 
     def _resolve_search_path(self, header_name, is_angled, search_paths,
                              includer):
-        for search_path in self._iter_search_paths(is_angled, search_paths,
-                                                   includer):
-            if os.path.isfile(os.path.join(search_path, header_name)):
-                return search_path
+        with compdb.profiling.phase('header resolution'):
+            for search_path in self._iter_search_paths(
+                    is_angled, search_paths, includer):
+                if self.fs.isfile(os.path.join(search_path, header_name)):
+                    return search_path
+
+
+class _Replayer(Preprocessor):
+    """A Preprocessor reusing the scans of a previous preprocessing.
+
+    A file is scanned again only if the search paths it is reached with
+    changed, otherwise its previous includes are replayed,
+    without reading nor resolving anything.
+    The included-by graph is filled in the order of a full preprocessing.
+    """
+
+    def __init__(self, fs, filler, previous_scans):
+        super(_Replayer, self).__init__(fs)
+        self._filler = filler
+        self._previous_scans = previous_scans
+
+    def _iter_resolved_includes(self, includer, search_paths,
+                                source_is_main_file):
+        scan = self._previous_scans.get(includer)
+        if scan is None or scan[0] != search_paths:
+            return super(_Replayer, self)._iter_resolved_includes(
+                includer, search_paths, source_is_main_file)
+        self.scans[includer] = (search_paths, scan[1])
+        return self._replay(includer, scan[1])
+
+    def _replay(self, includer, includees):
+        for includee in includees:
+            self._filler.add_include(includee, includer)
+            yield includee
 
 
 class IncludedByDatabase(CompilationDatabaseInterface):
@@ -138,10 +194,15 @@ A graph represented implemented as an adjacent list.
 See also https://www.python.org/doc/essays/graphs/
 """
 
-    def __init__(self, graph, database):
+    def __init__(self, graph, database, include_dir_index=None, scans=None):
         self.graph = graph
         self.database = database
+        # the scans of the preprocessing which built the graph,
+        # reused by update()
+        self.scans = scans or {}
         self.__db_index = None
+        self.__include_dir_index = include_dir_index
+        self.__reachability = None
 
     def __repr__(self):
         return '<IncludedByGraph: graph = {}, database = {}>'.format(
@@ -162,6 +223,7 @@ See also https://www.python.org/doc/essays/graphs/
                 node = to_visit.popleft()
             except IndexError:
                 return
+            compdb.stats.add(compdb.stats.BFS_NODES_VISITED)
 
             if node == depth_checkpoint:
                 depth_checkpoint = None
@@ -178,10 +240,25 @@ See also https://www.python.org/doc/essays/graphs/
 
     @property
     def _db_index(self):
+        """Map the files of the database to their first compile command.
+
+        Querying the database for each header would scan the database
+        each time, which is quadratic.
+        """
         if self.__db_index is None:
-            self.__db_index = frozenset(self.database.get_all_files())
+            db_index = {}
+            for compile_command in self.database.get_all_compile_commands():
+                db_index.setdefault(compile_command.normfile, compile_command)
+            self.__db_index = db_index
         return self.__db_index
 
+    @property
+    def _include_dir_index(self):
+        if self.__include_dir_index is None:
+            self.__include_dir_index = \
+                compdb.dirindex.IncludeDirectoryIndex(self.database)
+        return self.__include_dir_index
+
     def _find_best(self, path):
         best = None
         best_score = None
@@ -203,13 +280,23 @@ See also https://www.python.org/doc/essays/graphs/
         return best
 
     def get_compile_commands(self, path):
-        best = self._find_best(path)
+        with compdb.profiling.phase('best-includer selection'):
+            best = self._find_best(path)
         if best:
-            for compile_command in self.database.get_compile_commands(best):
-                yield compdb.complementer.headerdb.derive_compile_command(
-                    path, compile_command)
-                # stop after one compile command
-                break
+            yield compdb.complementer.headerdb.derive_compile_command(
+                path, self._db_index[best])
+            return
+        # the file is not included by any file of the database,
+        # guess the compile command from the header search paths instead,
+        # only for existing headers, not for mistyped or unknown files
+        if os.path.splitext(path)[1] not in _HEADER_EXTENSIONS or \
+           not compdb.filesystem.get_default().isfile(path):
+            return
+        with compdb.profiling.phase('best-includer selection'):
+            compile_command = self._include_dir_index.get_best(path)
+        if compile_command:
+            yield compdb.complementer.headerdb.derive_compile_command(
+                path, compile_command)
 
     def get_all_files(self):
         return iter(self.graph.keys())
@@ -217,6 +304,58 @@ See also https://www.python.org/doc/essays/graphs/
     def all_files_unique(self):
         return True
 
+    def update(self, changes, fs=None):
+        """Patch the index with the ChangeSet of a database refresh.
+
+        The database is preprocessed again, in database order,
+        the files reached with the same search paths as before
+        are not scanned again, their previous includes are replayed.
+        The result is the same as a full build of the index,
+        including the order of the includers, which breaks the ties
+        when choosing the best includer of a header.
+        """
+        if not changes:
+            return
+        with compdb.profiling.phase('include index update'):
+            graph = {}
+            filler = IncludedByGraphFiller(graph, self.database)
+            pp = _Replayer(fs, filler, self.scans)
+            pp.register_include_callback(filler.include_callback)
+            for compile_command in self.database.get_all_compile_commands():
+                pp.preprocess(compile_command)
+            # the caller may hold a reference to the graph
+            self.graph.clear()
+            self.graph.update(graph)
+            self.scans = pp.scans
+        self.__db_index = None
+        self.__include_dir_index = None
+        self.__reachability = None
+
+    @property
+    def _reachability(self):
+        if self.__reachability is None:
+            self.__reachability = IncludedByReachability(
+                self.graph, self._db_index)
+        return self.__reachability
+
+    def get_dependents(self, paths):
+        """Return the set of database files including one of the paths.
+
+        The files are included transitively,
+        a path which is a file of the database is its own dependent.
+        """
+        return self._reachability.get_dependents(
+            [compdb.utils.logical_abspath(path) for path in paths])
+
+    def get_dependent_compile_commands(self, paths):
+        """Return the compile commands of the dependents of the paths."""
+        dependents = self.get_dependents(paths)
+        if not dependents:
+            return
+        for compile_command in self.database.get_all_compile_commands():
+            if compile_command.normfile in dependents:
+                yield compile_command
+
     def get_all_compile_commands(self):
         for file in self.get_all_files():
             for compile_command in self.get_compile_commands(file):
@@ -228,12 +367,27 @@ class IncludedByGraphFiller(object):
         self.included_by_graph = included_by_graph
         self.database = database
         self.db_files = None
+        # the (includee, includer) edges of the graph,
+        # a header can have thousands of includers,
+        # looking them up in the lists would be quadratic
+        self._edges = set((includee, includer)
+                          for includee, includers in included_by_graph.items()
+                          for includer in includers)
 
     def include_callback(self, include_directive):
-        includee = os.path.normpath(
+        includee = compdb.stats.normpath(
             os.path.join(include_directive.search_path,
                          include_directive.header_name))
-        if includee == include_directive.source_file:
+        # is this useful information at this point?
+        # has_compile_command = False
+        # if include_directive.source_is_main_file or \
+        #    include_directive.source_file in self.db_files:
+        #     has_compile_command = True
+        self.add_include(includee, include_directive.source_file)
+
+    def add_include(self, includee, includer):
+        """Add the edge of an include directive, if it belongs to the graph."""
+        if includee == includer:
             # self include are technically possible,
             # however, we don't want to store them for now
             return
@@ -242,32 +396,221 @@ class IncludedByGraphFiller(object):
         if includee in self.db_files:
             # don't store files which are in the database
             return
-        # is this useful information at this point?
-        # has_compile_command = False
-        # if include_directive.source_is_main_file or \
-        #    include_directive.source_file in self.db_files:
-        #     has_compile_command = True
-        self.add(includee, include_directive.source_file)
+        self.add(includee, includer)
 
     def add(self, includee, includer):
-        try:
-            lst = self.included_by_graph[includee]
-            if includer not in lst:
-                lst.append(includer)
-        except KeyError:
-            self.included_by_graph[includee] = [includer]
+        edge = (includee, includer)
+        if edge in self._edges:
+            return
+        self._edges.add(edge)
+        self.included_by_graph.setdefault(includee, []).append(includer)
+
+
+class IncludeClosure(object):
+    """Compute the headers included by a file, transitively.
+
+    The includes are derived from an included-by graph.
+    """
+
+    def __init__(self, included_by_graph):
+        self._includes = {}
+        for includee, includers in included_by_graph.items():
+            for includer in includers:
+                self._includes.setdefault(includer, []).append(includee)
+
+    def __call__(self, path):
+        """Return the set of files reachable from path, path included."""
+        visited = {path}
+        stack = [path]
+        while stack:
+            node = stack.pop()
+            for includee in self._includes.get(node, ()):
+                if includee not in visited:
+                    visited.add(includee)
+                    stack.append(includee)
+        return visited
+
+
+class IncludedByReachability(object):
+    """Precomputed answers to: which files include a file, transitively?
+
+    Only some files can be answered, the roots,
+    e.g. the translation units of a database.
+    The roots get an integer ID,
+    each node of the graph gets the bitset of the roots including it,
+    a Python integer where the bit N is set for the root of ID N.
+    A query is a bitwise OR of the bitsets of the queried files.
+
+    The bitsets are computed on the graph of the strongly connected components,
+    so include cycles are supported.
+    """
+
+    def __init__(self, included_by_graph, roots):
+        self._roots = sorted(roots)
+        root_ids = {root: i for i, root in enumerate(self._roots)}
+        with compdb.profiling.phase('reachability build'):
+            self._bitsets = self._compute_bitsets(included_by_graph, root_ids)
+
+    @staticmethod
+    def _compute_bitsets(graph, root_ids):
+        # Tarjan's algorithm, iterative to support deep include chains.
+        # A component is complete once all the components it reaches are,
+        # so the bitsets can be computed as the components are found.
+        bitsets = {}
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        nodes = set(graph)
+        nodes.update(root_ids)
+        for start in sorted(nodes):
+            if start in index:
+                continue
+            index[start] = lowlink[start] = len(index)
+            stack.append(start)
+            on_stack.add(start)
+            work = [(start, iter(graph.get(start, ())))]
+            while work:
+                node, successors = work[-1]
+                for successor in successors:
+                    if successor not in index:
+                        index[successor] = lowlink[successor] = len(index)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append(
+                            (successor, iter(graph.get(successor, ()))))
+                        break
+                    if successor in on_stack:
+                        lowlink[node] = min(lowlink[node], index[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] != index[node]:
+                        continue
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    bitset = 0
+                    for member in component:
+                        if member in root_ids:
+                            bitset |= 1 << root_ids[member]
+                        for successor in graph.get(member, ()):
+                            # the members of the component have no bitset yet
+                            bitset |= bitsets.get(successor, 0)
+                    for member in component:
+                        bitsets[member] = bitset
+        return bitsets
+
+    def get_dependents(self, paths):
+        """Return the set of roots including one of the paths."""
+        bitset = 0
+        for path in paths:
+            bitset |= self._bitsets.get(path, 0)
+        dependents = set()
+        while bitset:
+            low_bit = bitset & -bitset
+            dependents.add(self._roots[low_bit.bit_length() - 1])
+            bitset ^= low_bit
+        return dependents
 
 
 class IncludeIndexBuilder(object):
+    def __init__(self, fs=None):
+        self.fs = fs
+
     # return included-by relationship of headers
-    def build(self, database):
+    #
+    # The compile commands to preprocess default to the compile commands
+    # of the database.
+    def build(self, database, compile_commands=None, include_dir_index=None):
+        total = None
+        if compile_commands is None:
+            compile_commands = database.get_all_compile_commands()
+            if compdb.progress.is_enabled():
+                total = sum(1 for _ in database.get_all_files())
+        elif hasattr(compile_commands, '__len__'):
+            total = len(compile_commands)
+        return self._build(database, compile_commands,
+                           compdb.progress.task('include scanning', total),
+                           include_dir_index)
+
+    def _build(self, database, compile_commands, progress,
+               include_dir_index=None):
         # Represent included-by relationship of headers
         #
         # The graph is a dict representing an adjacency list
         included_by_graph = {}
-        pp = Preprocessor()
+        pp = Preprocessor(self.fs)
         filler = IncludedByGraphFiller(included_by_graph, database)
         pp.register_include_callback(filler.include_callback)
-        for compile_command in database.get_all_compile_commands():
-            pp.preprocess(compile_command)
-        return IncludedByDatabase(included_by_graph, database)
+        with compdb.profiling.phase('include index build'):
+            for compile_command in progress.iterate(compile_commands):
+                pp.preprocess(compile_command)
+        progress.finish()
+        return IncludedByDatabase(included_by_graph, database,
+                                  include_dir_index, pp.scans)
+
+
+class BackgroundIncludeIndexBuilder(object):
+    """Build the include index in a thread, from a stream of compile commands.
+
+    This is a producer/consumer pipeline,
+    the caller feeds the compile commands as it reads them,
+    which overlaps the scanning of the includes with the caller's work,
+    e.g. the serialization of the compile commands.
+    """
+
+    _SENTINEL = None
+
+    def __init__(self, database, fs=None, maxsize=1024):
+        self._queue = queue.Queue(maxsize)
+        self._result = None
+        self._exc_info = None
+        self._fed_count = 0
+        # the total is known once all the compile commands are fed
+        self._progress = compdb.progress.task(
+            'include scanning', queue_size=self._queue.qsize)
+        self._thread = threading.Thread(
+            target=self._run, args=(IncludeIndexBuilder(fs), database))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _iter_queue(self):
+        while True:
+            compile_command = self._queue.get()
+            if compile_command is self._SENTINEL:
+                return
+            yield compile_command
+
+    def _run(self, builder, database):
+        try:
+            self._result = builder._build(database, self._iter_queue(),
+                                          self._progress)
+        except Exception:
+            self._exc_info = sys.exc_info()
+            # drain the queue, so that the producer is not blocked
+            for _ in self._iter_queue():
+                pass
+
+    def feed(self, compile_command):
+        self._fed_count += 1
+        self._queue.put(compile_command)
+
+    def close(self):
+        """Signal the end of the compile commands."""
+        self._progress.total = self._fed_count
+        self._queue.put(self._SENTINEL)
+
+    def result(self):
+        """Wait for the include index and return it."""
+        self._thread.join()
+        if self._exc_info:
+            exc_info, self._exc_info = self._exc_info, None
+            raise exc_info[1]
+        return self._result
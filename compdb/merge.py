@@ -0,0 +1,62 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import sys
+
+from compdb.models import CompileCommand
+
+# how to choose the entry of a file present in several databases
+POLICIES = ['first', 'last', 'most-flags']
+
+try:
+    _intern = sys.intern
+except AttributeError:
+    # py2: intern() does not accept unicode strings
+    _interned = {}
+
+    def _intern(s):
+        return _interned.setdefault(s, s)
+
+
+def merge_compile_commands(compile_commands, policy='first'):
+    """Merge a stream of compile commands, keeping one entry per file.
+
+    The files are identified by their normalized path.
+    The policy picks the entry to keep, it is one of:
+    - first: the first entry of the file,
+      each entry is yielded as soon as it is read
+    - last: the last entry of the file
+    - most-flags: the entry with the most arguments, the first one on ties
+
+    The files are yielded in the order they are first seen.
+    The memory grows with the number of files, not with the number of entries,
+    the paths are interned, so that the duplicates share the same string.
+    """
+    if policy not in POLICIES:
+        raise ValueError('invalid merge policy: {}'.format(policy))
+    if policy == 'first':
+        seen = set()
+        for compile_command in compile_commands:
+            key = _intern(compile_command.normfile)
+            if key in seen:
+                continue
+            seen.add(key)
+            yield compile_command
+        return
+
+    keys = []
+    selected = {}
+    for compile_command in compile_commands:
+        key = _intern(compile_command.normfile)
+        current = selected.get(key)
+        if current is None:
+            keys.append(key)
+        elif policy == 'most-flags' and \
+                len(compile_command.arguments) <= len(current.arguments):
+            continue
+        # entries from the same database share the same directory,
+        # the entry is copied, the input may be kept by the caller
+        selected[key] = CompileCommand(
+            _intern(compile_command.directory), compile_command.file,
+            compile_command.arguments, compile_command.output)
+    for key in keys:
+        yield selected[key]
@@ -1,9 +1,11 @@
 from __future__ import print_function, unicode_literals, absolute_import
 
+import collections
+import hashlib
 import os
-import pprint
 
 import compdb
+import compdb.stats
 
 
 class ProbeError(LookupError, compdb.CompdbError):
@@ -23,9 +25,34 @@ class CompileCommand:
 
     @property
     def normfile(self):
-        return os.path.normpath(os.path.join(self.directory, self.file))
+        return compdb.stats.normpath(os.path.join(self.directory, self.file))
+
+    @property
+    def expanded_arguments(self):
+        """The arguments, with the @file response files expanded.
+
+        The expansion is computed once,
+        until the arguments or the response files change.
+        """
+        if not any(argument.startswith('@') for argument in self.arguments):
+            return self.arguments
+        import compdb.responsefile
+
+        generation = compdb.responsefile.get_generation()
+        cached = getattr(self, '_expanded', None)
+        if cached is not None and cached[0] is self.arguments and \
+           cached[1] == generation:
+            return cached[2]
+        expanded = compdb.responsefile.expand_arguments(
+            self.arguments, self.directory)
+        # the expansion may have noticed a changed response file
+        self._expanded = (self.arguments,
+                          compdb.responsefile.get_generation(), expanded)
+        return expanded
 
     def __repr__(self):
+        import pprint
+
         return "{{directory: {}, file: {}, arguments: {}, output: {}}}".format(
             repr(self.directory),
             repr(self.file), pprint.pformat(self.arguments), repr(self.output))
@@ -45,6 +72,72 @@ class CompileCommand:
         return not self == other
 
 
+def diff_entries(old_entries, new_entries, key):
+    """Return the (removed, added) entries, compared by key.
+
+    The entries are returned in their original order,
+    a duplicated entry is matched as many times as it appears.
+    """
+    old_keys = [key(entry) for entry in old_entries]
+    new_keys = [key(entry) for entry in new_entries]
+    unmatched = collections.Counter(old_keys)
+    unmatched.subtract(new_keys)
+    removed = []
+    for entry, entry_key in zip(old_entries, old_keys):
+        if unmatched[entry_key] > 0:
+            unmatched[entry_key] -= 1
+            removed.append(entry)
+    added = []
+    for entry, entry_key in zip(new_entries, new_keys):
+        if unmatched[entry_key] < 0:
+            unmatched[entry_key] += 1
+            added.append(entry)
+    return removed, added
+
+
+class ChangeSet(object):
+    """The compile commands changed by a refresh of a database.
+
+    A modified compile command is both removed, in its old version,
+    and added, in its new version.
+    """
+
+    def __init__(self, removed=None, added=None):
+        self.removed = list(removed or [])
+        self.added = list(added or [])
+
+    @classmethod
+    def diff(cls, old_compile_commands, new_compile_commands):
+        """Return the ChangeSet between two lists of compile commands."""
+        def key(compile_command):
+            return (compile_command.directory, compile_command.file,
+                    tuple(compile_command.arguments), compile_command.output)
+
+        removed, added = diff_entries(old_compile_commands,
+                                      new_compile_commands, key)
+        return cls(removed, added)
+
+    def update(self, other):
+        self.removed.extend(other.removed)
+        self.added.extend(other.added)
+
+    @property
+    def files(self):
+        """The normalized paths of the files whose entries changed."""
+        return set(compile_command.normfile
+                   for compile_command in self.removed + self.added)
+
+    def __bool__(self):
+        return bool(self.removed or self.added)
+
+    # py2
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<ChangeSet: {} removed, {} added>'.format(
+            len(self.removed), len(self.added))
+
+
 class CompilationDatabaseInterface(object):
     @classmethod
     def probe_directory(cls, directory):
@@ -84,3 +177,44 @@ class CompilationDatabaseInterface(object):
     def get_all_compile_commands(self):
         """Return an iterable of CompileCommand."""
         raise compdb.NotImplementedError
+
+    def unload(self):
+        """Release the memory used by the loaded compile commands.
+
+        The database is loaded again when needed.
+        """
+        pass
+
+    def refresh(self):
+        """Reload the compile commands if the source of the database changed.
+
+        Return a ChangeSet, empty if the database is unchanged.
+        A database which is not loaded has nothing to refresh,
+        it is up-to-date once loaded.
+        The default implementation never detects changes.
+        """
+        return ChangeSet()
+
+    def get_fingerprint(self):
+        """Return a string identifying the content of the database.
+
+        The default implementation hashes all the compile commands,
+        override this if the backend can do it more efficiently.
+        """
+        h = hashlib.sha1()
+        for compile_command in self.get_all_compile_commands():
+            h.update(repr(compile_command._as_tuple()).encode('utf-8'))
+        return h.hexdigest()
+
+    def get_all_compile_command_ids(self):
+        """Return an iterable of strings identifying the compile commands.
+
+        The ids are in the order of get_all_compile_commands(),
+        the id of a compile command changes when the compile command changes.
+        The default implementation hashes all the compile commands,
+        override this if the backend can do it more efficiently,
+        e.g. without tokenizing the command lines.
+        """
+        for compile_command in self.get_all_compile_commands():
+            yield hashlib.sha1(repr(compile_command._as_tuple()).encode(
+                'utf-8')).hexdigest()
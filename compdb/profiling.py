@@ -0,0 +1,417 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import io
+import os
+import sys
+import threading
+import time
+
+try:
+    _wall_clock = time.perf_counter
+except AttributeError:
+    _wall_clock = time.time
+
+# the CPU time of the current thread, when available,
+# so that background threads are not accounted to the foreground phases
+if hasattr(time, 'thread_time'):
+    _cpu_clock = time.thread_time
+elif hasattr(time, 'process_time'):
+    _cpu_clock = time.process_time
+else:
+    _cpu_clock = time.clock
+
+
+def _format_table(rows):
+    """Format rows of strings, the first column is left-aligned."""
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = []
+    for row in rows:
+        lines.append('  '.join([row[0].ljust(widths[0])] + [
+            cell.rjust(width) for cell, width in zip(row[1:], widths[1:])
+        ]))
+    return '\n'.join(lines) + '\n'
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    __slots__ = ['profiler', 'name', 'wall_start', 'cpu_start']
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall_start = _wall_clock()
+        self.cpu_start = _cpu_clock()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        cpu = _cpu_clock() - self.cpu_start
+        wall = _wall_clock() - self.wall_start
+        self.profiler.events.append((self.name, self.wall_start, wall, cpu,
+                                     threading.current_thread().ident))
+        return False
+
+
+class _AggregatedPhase(object):
+    __slots__ = ['profiler', 'name', 'wall_start', 'cpu_start']
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall_start = _wall_clock()
+        self.cpu_start = _cpu_clock()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        cpu = _cpu_clock() - self.cpu_start
+        wall = _wall_clock() - self.wall_start
+        totals = self.profiler.totals
+        with self.profiler._lock:
+            count, total_wall, total_cpu = totals.get(self.name,
+                                                      (0, 0.0, 0.0))
+            totals[self.name] = (count + 1, total_wall + wall,
+                                 total_cpu + cpu)
+        return False
+
+
+# the phases entered once per file or per compile command,
+# they are too many to be recorded as events
+FINE_PHASES = frozenset([
+    'command tokenizing',
+    'serialization',
+    'include scanning',
+    'header resolution',
+    'best-includer selection',
+])
+
+
+class Profiler(object):
+    """Record the wall and CPU time of the phases of an execution.
+
+    The phases can be nested, the time of a phase includes its sub-phases.
+    Each coarse phase is recorded as an event,
+    the fine phases are only aggregated, by name,
+    into totals of (count, wall, cpu).
+    """
+
+    def __init__(self, fine_phases=FINE_PHASES):
+        self.events = []
+        self.totals = {}
+        self.fine_phases = frozenset(fine_phases)
+        self._lock = threading.Lock()
+        self._origin = _wall_clock()
+
+    def phase(self, name):
+        if name in self.fine_phases:
+            return _AggregatedPhase(self, name)
+        return _Phase(self, name)
+
+    def summary(self):
+        """Return a list of (name, count, wall, cpu), longest first."""
+        totals = dict(self.totals)
+        for name, _, wall, cpu, _ in self.events:
+            count, total_wall, total_cpu = totals.get(name, (0, 0.0, 0.0))
+            totals[name] = (count + 1, total_wall + wall, total_cpu + cpu)
+        return sorted(
+            ((name, ) + total for name, total in totals.items()),
+            key=lambda row: (-row[2], row[0]))
+
+    def format_summary(self):
+        rows = [('phase', 'count', 'wall (s)', 'cpu (s)')]
+        for name, count, wall, cpu in self.summary():
+            rows.append((name, str(count), '{:.3f}'.format(wall),
+                         '{:.3f}'.format(cpu)))
+        return _format_table(rows)
+
+    def to_chrome_trace(self):
+        """Return the events in the Chrome trace event format.
+
+        The result can be loaded in chrome://tracing or Perfetto.
+        The totals of the fine phases are given as metadata.
+        """
+        pid = os.getpid()
+        trace_events = []
+        for name, wall_start, wall, cpu, tid in self.events:
+            trace_events.append({
+                'name': name,
+                'cat': 'compdb',
+                'ph': 'X',
+                'ts': (wall_start - self._origin) * 1e6,
+                'dur': wall * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': {
+                    'cpu_ms': cpu * 1e3
+                },
+            })
+        return {
+            'traceEvents': trace_events,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                name: {
+                    'count': count,
+                    'wall_ms': wall * 1e3,
+                    'cpu_ms': cpu * 1e3
+                }
+                for name, (count, wall, cpu) in self.totals.items()
+            },
+        }
+
+    def write_chrome_trace(self, path):
+        import json
+
+        with io.open(path, 'wb') as f:
+            f.write(json.dumps(self.to_chrome_trace()).encode('utf-8'))
+
+
+class _PhaseGroup(object):
+    __slots__ = ['phases']
+
+    def __init__(self, phases):
+        self.phases = phases
+
+    def __enter__(self):
+        for phase in self.phases:
+            phase.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for phase in reversed(self.phases):
+            phase.__exit__(exc_type, exc_val, exc_tb)
+        return False
+
+
+class ProfilerGroup(object):
+    """Dispatch the phases to several profilers."""
+
+    def __init__(self, profilers):
+        self.profilers = profilers
+
+    def phase(self, name):
+        return _PhaseGroup([p.phase(name) for p in self.profilers])
+
+
+def _current_rss():
+    """Return the resident set size of the process, in bytes, or None."""
+    try:
+        with io.open('/proc/self/statm', 'rb') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf(str('SC_PAGE_SIZE'))
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _peak_rss():
+    """Return the peak resident set size of the process, in bytes, or None."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+def _max(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+# the phases which allocate the bulk of the memory
+MEMORY_PHASES = frozenset([
+    'json load',
+    'include index build',
+    'header derivation',
+])
+
+
+class _MemoryPhase(object):
+    __slots__ = ['profiler', 'name', 'record', 'snapshot']
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.record, self.snapshot = self.profiler._begin(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler._end(self.record, self.snapshot)
+        return False
+
+
+class MemoryProfiler(object):
+    """Record the memory used by the coarse phases of an execution.
+
+    The Python allocations are traced with tracemalloc,
+    the resident set size is sampled by a background thread.
+    For each phase, the following is recorded, in bytes:
+    - traced_peak: the peak of the traced memory during the phase
+    - retained: the traced memory allocated by the phase, and not freed
+    - rss_start, rss_end, rss_peak: the resident set size
+    - top: the call sites retaining the most memory
+
+    Without tracemalloc.reset_peak(), i.e. before Python 3.9,
+    the traced peak is the peak since the start of the profiling.
+    The finer phases are ignored, snapshots are too costly for them.
+    """
+
+    def __init__(self, phases=MEMORY_PHASES, top_count=10,
+                 sampling_interval=0.01):
+        import tracemalloc
+
+        self._tracemalloc = tracemalloc
+        self.phases = frozenset(phases)
+        self.top_count = top_count
+        self.sampling_interval = sampling_interval
+        self.records = []
+        self._open_records = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._tracemalloc.start()
+        self._sampler = threading.Thread(target=self._sample_rss)
+        self._sampler.daemon = True
+        self._sampler.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._sampler.join()
+        self._tracemalloc.stop()
+
+    def phase(self, name):
+        if name not in self.phases:
+            return _NULL_PHASE
+        return _MemoryPhase(self, name)
+
+    def _sample_rss(self):
+        while not self._stop_event.wait(self.sampling_interval):
+            rss = _current_rss()
+            with self._lock:
+                for record in self._open_records:
+                    record['rss_peak'] = _max(record['rss_peak'], rss)
+
+    def _fold_traced_peak(self):
+        """Account the traced peak so far to the open phases."""
+        _, peak = self._tracemalloc.get_traced_memory()
+        for record in self._open_records:
+            record['traced_peak'] = max(record['traced_peak'], peak)
+        if hasattr(self._tracemalloc, 'reset_peak'):
+            self._tracemalloc.reset_peak()
+
+    def _take_snapshot(self):
+        tracemalloc = self._tracemalloc
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+    def _begin(self, name):
+        snapshot = self._take_snapshot()
+        rss = _current_rss()
+        with self._lock:
+            self._fold_traced_peak()
+            current, _ = self._tracemalloc.get_traced_memory()
+            record = {
+                'name': name,
+                'traced_start': current,
+                'traced_peak': current,
+                'rss_start': rss,
+                'rss_peak': rss,
+            }
+            self._open_records.append(record)
+        return record, snapshot
+
+    def _end(self, record, snapshot):
+        rss = _current_rss()
+        with self._lock:
+            self._fold_traced_peak()
+            current, _ = self._tracemalloc.get_traced_memory()
+            self._open_records.remove(record)
+        record['traced_end'] = current
+        record['retained'] = current - record['traced_start']
+        record['rss_end'] = rss
+        record['rss_peak'] = _max(record['rss_peak'], rss)
+        top = []
+        for stat in self._take_snapshot().compare_to(snapshot, 'lineno'):
+            if len(top) >= self.top_count or stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            top.append({
+                'file': frame.filename,
+                'line': frame.lineno,
+                'size': stat.size_diff,
+                'count': stat.count_diff,
+            })
+        record['top'] = top
+        with self._lock:
+            self.records.append(record)
+
+    def to_dict(self):
+        return {
+            'peak_rss': _peak_rss(),
+            'phases': self.records,
+        }
+
+    def write_json(self, path):
+        import json
+
+        with io.open(path, 'wb') as f:
+            f.write(
+                json.dumps(self.to_dict(), indent=2,
+                           sort_keys=True).encode('utf-8'))
+
+    def format_summary(self):
+        def mib(size):
+            if size is None:
+                return '-'
+            return '{:.1f}'.format(size / (1024.0 * 1024.0))
+
+        rows = [('phase', 'peak (MiB)', 'retained (MiB)', 'rss peak (MiB)')]
+        for record in self.records:
+            rows.append((record['name'], mib(record['traced_peak']),
+                         mib(record['retained']), mib(record['rss_peak'])))
+        return _format_table(rows)
+
+
+_profiler = None
+
+
+def get_profiler():
+    """Return the active profiler, None if profiling is disabled."""
+    return _profiler
+
+
+def set_profiler(profiler):
+    global _profiler
+    _profiler = profiler
+
+
+def phase(name):
+    """Return a context manager timing a phase of the active profiler.
+
+    When profiling is disabled, the context manager does nothing.
+    """
+    if _profiler is None:
+        return _NULL_PHASE
+    return _profiler.phase(name)
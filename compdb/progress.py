@@ -0,0 +1,180 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import sys
+import threading
+import time
+
+# kinds of events
+BEGIN = 'begin'
+UPDATE = 'update'
+END = 'end'
+
+
+class ProgressEvent(object):
+    __slots__ = ['kind', 'task', 'done', 'total', 'queued', 'elapsed']
+
+    def __init__(self, kind, task, done, total, queued, elapsed):
+        self.kind = kind
+        # the name of the task
+        self.task = task
+        self.done = done
+        # None when unknown
+        self.total = total
+        # the number of items waiting to be processed, None when unknown
+        self.queued = queued
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        """The number of items processed per second, None when unknown."""
+        if self.elapsed <= 0:
+            return None
+        return self.done / self.elapsed
+
+    @property
+    def eta(self):
+        """The estimated number of seconds left, None when unknown."""
+        throughput = self.throughput
+        if self.total is None or not throughput:
+            return None
+        return max(0, self.total - self.done) / throughput
+
+
+class Task(object):
+    """Report the progress of a task to a listener.
+
+    The total can be updated while the task is in progress,
+    e.g. when the number of items becomes known.
+    """
+
+    def __init__(self, listener, name, total=None, queue_size=None):
+        self.listener = listener
+        self.name = name
+        self.total = total
+        self.done = 0
+        # a function returning the number of items waiting to be processed
+        self.queue_size = queue_size
+        self._start = time.time()
+        self._emit(BEGIN)
+
+    def _emit(self, kind):
+        queued = None
+        if self.queue_size is not None:
+            queued = self.queue_size()
+        self.listener(
+            ProgressEvent(kind, self.name, self.done, self.total, queued,
+                          time.time() - self._start))
+
+    def advance(self, count=1):
+        self.done += count
+        self._emit(UPDATE)
+
+    def iterate(self, iterable):
+        """Iterate over the items, each item is accounted once processed."""
+        for item in iterable:
+            yield item
+            self.advance()
+
+    def finish(self):
+        self._emit(END)
+
+
+class _NullTask(object):
+    total = None
+    done = 0
+
+    def advance(self, count=1):
+        pass
+
+    def iterate(self, iterable):
+        return iterable
+
+    def finish(self):
+        pass
+
+
+_NULL_TASK = _NullTask()
+
+_listener = None
+
+
+def get_listener():
+    """Return the progress listener, None if progress is not reported."""
+    return _listener
+
+
+def set_listener(listener):
+    """Set the function called with each ProgressEvent, None to disable."""
+    global _listener
+    _listener = listener
+
+
+def is_enabled():
+    return _listener is not None
+
+
+def task(name, total=None, queue_size=None):
+    """Start a task reporting its progress to the listener.
+
+    Without listener, a task doing nothing is returned,
+    and iterate() returns the iterable as-is.
+    """
+    if _listener is None:
+        return _NULL_TASK
+    return Task(_listener, name, total, queue_size)
+
+
+def _format_duration(seconds):
+    seconds = int(seconds + 0.5)
+    if seconds < 60:
+        return '{}s'.format(seconds)
+    if seconds < 3600:
+        return '{}m{:02}s'.format(seconds // 60, seconds % 60)
+    return '{}h{:02}m'.format(seconds // 3600, seconds % 3600 // 60)
+
+
+def format_event(event):
+    if event.total is None:
+        parts = ['{} files'.format(event.done)]
+    else:
+        parts = ['{}/{} files'.format(event.done, event.total)]
+    throughput = event.throughput
+    if throughput is not None:
+        parts.append('{:.0f}/s'.format(throughput))
+    if event.queued is not None:
+        parts.append('queue {}'.format(event.queued))
+    eta = event.eta
+    if eta is not None:
+        parts.append('ETA {}'.format(_format_duration(eta)))
+    return '{}: {}'.format(event.task, ', '.join(parts))
+
+
+class StderrRenderer(object):
+    """Render the progress on a single terminal line.
+
+    The updates are throttled, the line is rewritten at most once per interval.
+    The line is cleared when a task ends.
+    """
+
+    def __init__(self, stream=None, interval=0.2):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self._last_render = 0
+        self._width = 0
+        # tasks can run in background threads
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        now = time.time()
+        with self._lock:
+            if event.kind == UPDATE and \
+               now - self._last_render < self.interval:
+                return
+            self._last_render = now
+            if event.kind == END:
+                line = ''
+            else:
+                line = format_event(event)
+            self.stream.write('\r' + line.ljust(self._width) + '\r')
+            self.stream.flush()
+            self._width = len(line)
@@ -0,0 +1,301 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import codecs
+import hashlib
+import io
+import os
+import re
+import shlex
+import tempfile
+
+import compdb.filesystem
+import compdb.stats
+from compdb.models import CompileCommand
+
+# options followed by a value specific to the compiled file,
+# e.g. "-o foo.o" or "-ofoo.o"
+_FILE_SPECIFIC_OPTIONS = ['-o', '-MF', '-MT', '-MQ']
+
+# below this number of arguments, the flags are kept inline
+DEFAULT_MIN_ARGUMENTS = 4
+
+_NEEDS_QUOTING = re.compile(r'[\s"\'\\]')
+
+# the options forming the blocks of flags shared by many compile commands,
+# a block is a run of options of the same kind
+_BLOCK_OPTIONS = [
+    ('include', ['-I', '-isystem', '-iquote', '-idirafter']),
+    ('define', ['-D', '-U']),
+]
+
+
+def quote_argument(argument):
+    """Quote an argument for a response file, the GNU way."""
+    if argument and not _NEEDS_QUOTING.search(argument):
+        return argument
+    return '"{}"'.format(argument.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+# path of a response file -> (stamps, expanded arguments),
+# the stamps are the (path, (mtime, size)) of the file and its nested files,
+# the arguments are None if the file cannot be read
+_expanded_files = {}
+
+# incremented when the cached response files are dropped,
+# the expansions computed before are out of date
+_generation = 0
+
+
+def _decode(content):
+    # MSBuild writes UTF-16 response files
+    if content.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return content.decode('utf-16', 'replace')
+    return content.decode('utf-8-sig', 'replace')
+
+
+def _stamp(fs, path):
+    try:
+        st = fs.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+def _is_fresh(fs, stamps):
+    return all(_stamp(fs, path) == stamp for path, stamp in stamps)
+
+
+def _read_file(fs, path, parents):
+    stamps = [(path, _stamp(fs, path))]
+    try:
+        content = fs.read(path)
+    except (IOError, OSError):
+        return tuple(stamps), None
+    arguments = shlex.split(_decode(content), posix=os.name == "posix")
+    # like Clang, the nested response files are relative to their parent
+    expanded = tuple(
+        _expand(arguments, os.path.dirname(path), parents | frozenset([path]),
+                stamps))
+    return tuple(stamps), expanded
+
+
+def _expand_file(path, parents, stamps):
+    global _generation
+    fs = compdb.filesystem.get_default()
+    entry = _expanded_files.get(path)
+    if entry is None or not _is_fresh(fs, entry[0]):
+        if entry is not None:
+            _generation += 1
+        entry = _read_file(fs, path, parents)
+        _expanded_files[path] = entry
+    stamps.extend(entry[0])
+    return entry[1]
+
+
+def _expand(arguments, directory, parents, stamps):
+    for argument in arguments:
+        if argument.startswith('@') and len(argument) > 1:
+            path = compdb.stats.normpath(os.path.join(directory, argument[1:]))
+            if path not in parents:
+                expanded = _expand_file(path, parents, stamps)
+                if expanded is not None:
+                    for expanded_argument in expanded:
+                        yield expanded_argument
+                    continue
+        yield argument
+
+
+def expand_arguments(arguments, directory):
+    """Replace the @file arguments by the content of the response files.
+
+    The response files are resolved relative to the directory,
+    nested response files are expanded too.
+    A response file which cannot be read is kept as-is.
+    Each response file is read once per process, or again when it changes,
+    according to its modification time and size,
+    the resulting tuple is shared by the commands referring to it.
+    """
+    return list(_expand(arguments, directory, frozenset(), []))
+
+
+def get_generation():
+    """Return a number which changes when the response files change.
+
+    The expansions made with another generation may be out of date.
+    """
+    return _generation
+
+
+def revalidate():
+    """Forget the response files which changed since they were read."""
+    global _generation
+    fs = compdb.filesystem.get_default()
+    stale = [
+        path for path, (stamps, _) in _expanded_files.items()
+        if not _is_fresh(fs, stamps)
+    ]
+    if stale:
+        for path in stale:
+            del _expanded_files[path]
+        _generation += 1
+
+
+def clear_cache():
+    """Forget the response files read so far."""
+    global _generation
+    _expanded_files.clear()
+    _generation += 1
+
+
+def split_arguments(compile_command):
+    """Split the arguments of a compile command in 3 parts.
+
+    Return a tuple (compiler, flags, specifics),
+    where specifics are the arguments specific to the compiled file,
+    such as the file itself and the output options,
+    and flags are the remaining arguments, in their original order.
+    Flags are likely to be shared by other compile commands.
+    """
+    arguments = compile_command.arguments
+    if not arguments:
+        return None, [], []
+    normfile = compile_command.normfile
+    flags = []
+    specifics = []
+    i = 1
+    while i < len(arguments):
+        argument = arguments[i]
+        if argument in _FILE_SPECIFIC_OPTIONS and i + 1 < len(arguments):
+            specifics.extend(arguments[i:i + 2])
+            i += 2
+            continue
+        if any(argument.startswith(option)
+               for option in _FILE_SPECIFIC_OPTIONS) or \
+           compdb.stats.normpath(
+               os.path.join(compile_command.directory, argument)) == normfile:
+            specifics.append(argument)
+        else:
+            flags.append(argument)
+        i += 1
+    return arguments[0], flags, specifics
+
+
+def _option_kind(argument):
+    for kind, options in _BLOCK_OPTIONS:
+        for option in options:
+            if argument.startswith(option):
+                return kind, argument == option
+    return None, False
+
+
+def iter_blocks(flags):
+    """Iterate over the runs of flags, as (kind, flags) tuples.
+
+    The kind is 'include' for a run of header search path options,
+    'define' for a run of macro definitions,
+    None for the other flags.
+    An option and its separate value, e.g. "-I dir", are in the same run.
+    """
+    kind = None
+    run = []
+    i = 0
+    while i < len(flags):
+        option_kind, separate_value = _option_kind(flags[i])
+        length = 2 if separate_value and i + 1 < len(flags) else 1
+        if option_kind != kind and run:
+            yield kind, run
+            run = []
+        kind = option_kind
+        run.extend(flags[i:i + length])
+        i += length
+    if run:
+        yield kind, run
+
+
+class ResponseFileWriter(object):
+    """Write the shared flags of compile commands into response files.
+
+    Each distinct list of flags is written once,
+    in a file named flags-<hash>.rsp in the given directory,
+    the compile commands refer to it as @<path>,
+    which is understood by GCC and the Clang tools.
+
+    The blocks of include directories and of macro definitions
+    are written in their own response files, referred to by the flags,
+    so that compile commands with slightly different flags
+    still share their largest blocks.
+    """
+
+    def __init__(self, directory, min_arguments=DEFAULT_MIN_ARGUMENTS):
+        self.directory = os.path.abspath(directory)
+        self.min_arguments = min_arguments
+        # hash of the flags -> path of the response file
+        self._paths = {}
+
+    def _response_file(self, flags):
+        content = ''.join(quote_argument(flag) + '\n' for flag in flags)
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+        path = self._paths.get(digest)
+        if path is not None:
+            return path
+        path = os.path.join(self.directory, 'flags-{}.rsp'.format(digest))
+        # the file is named after its content,
+        # an existing file, e.g. from a previous run, can be kept as-is
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self.directory, prefix='.flags-')
+            with io.open(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            getattr(os, 'replace', os.rename)(tmp_path, path)
+        self._paths[digest] = path
+        return path
+
+    def _factor_blocks(self, flags):
+        factored = []
+        for kind, block in iter_blocks(flags):
+            if kind is not None and len(block) >= self.min_arguments:
+                factored.append('@' + self._response_file(block))
+            else:
+                factored.extend(block)
+        return factored
+
+    def factor(self, compile_command):
+        """Return a compile command whose flags are in response files.
+
+        The compile command is returned as-is
+        when it has less than min_arguments flags,
+        the same goes for the blocks of flags and the remaining flags.
+        """
+        compiler, flags, specifics = split_arguments(compile_command)
+        if len(flags) < self.min_arguments:
+            return compile_command
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        flags = self._factor_blocks(flags)
+        if len(flags) >= self.min_arguments:
+            flags = ['@' + self._response_file(flags)]
+        arguments = [compiler] + flags + specifics
+        return CompileCommand(compile_command.directory, compile_command.file,
+                              arguments, compile_command.output)
+
+    @property
+    def response_file_count(self):
+        return len(self._paths)
+
+
+class ResponseFileSerializer(object):
+    """Wrap a serializer to factor the flags into response files."""
+
+    def __init__(self, serializer, writer):
+        self.serializer = serializer
+        self.writer = writer
+
+    def __enter__(self):
+        self.serializer.__enter__()
+        return self
+
+    def serialize(self, compile_command):
+        self.serializer.serialize(self.writer.factor(compile_command))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.serializer.__exit__(exc_type, exc_val, exc_tb)
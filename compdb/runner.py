@@ -0,0 +1,409 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import base64
+import errno
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+import compdb.complementer.headerdb
+import compdb.filesystem
+import compdb.includedb
+import compdb.stats
+import compdb.utils
+
+# placeholders substituted inside the arguments of the template
+PLACEHOLDERS = ['{file}', '{directory}', '{output}']
+# placeholder replaced by the arguments of the compile command,
+# it must be a template argument on its own
+ARGUMENTS_PLACEHOLDER = '{arguments}'
+
+
+def substitute(template, compile_command):
+    """Make a command line from a template and a compile command.
+
+    - {file}: the normalized absolute path of the file
+    - {directory}: the directory of the compile command
+    - {output}: the output of the compile command, empty if none
+    - {arguments}: as a standalone argument,
+      the arguments of the compile command
+    """
+    values = {
+        '{file}': compile_command.normfile,
+        '{directory}': compile_command.directory,
+        '{output}': compile_command.output or '',
+    }
+    args = []
+    for arg in template:
+        if arg == ARGUMENTS_PLACEHOLDER:
+            args.extend(compile_command.arguments)
+            continue
+        for placeholder in PLACEHOLDERS:
+            if placeholder in arg:
+                arg = arg.replace(placeholder, values[placeholder])
+        args.append(arg)
+    return args
+
+
+def command_key(template, compile_command):
+    """Return a key identifying the run of a tool on a compile command."""
+    h = hashlib.sha1()
+    for part in [
+            '\0'.join(template),
+            compdb.stats.normpath(compile_command.directory),
+            compile_command.normfile,
+            '\0'.join(compile_command.arguments),
+    ]:
+        h.update(part.encode('utf-8'))
+        h.update(b'\1')
+    return h.hexdigest()
+
+
+class Job(object):
+    __slots__ = [
+        'compile_command', 'args', 'key', 'estimate', 'returncode', 'stdout',
+        'stderr', 'duration', 'cached'
+    ]
+
+    def __init__(self, compile_command, args, key=None):
+        self.compile_command = compile_command
+        self.args = args
+        self.key = key
+        self.estimate = None
+        self.returncode = None
+        self.stdout = b''
+        self.stderr = b''
+        self.duration = 0.0
+        # True if the result comes from the result cache
+        self.cached = False
+
+
+class ToolRunner(object):
+    """Run a tool over compile commands, with a bounded number of processes.
+
+    The output of a job is captured and returned with the job,
+    so that the output of concurrent jobs do not interleave.
+    Each tool runs in the directory of its compile command,
+    where the relative paths of the compile command are valid.
+    """
+
+    def __init__(self, template, jobs=1):
+        self.template = template
+        # None means one job per CPU
+        self.jobs = jobs or multiprocessing.cpu_count()
+        # the running processes, killed when the run is interrupted
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def make_jobs(self, compile_commands):
+        return [
+            Job(compile_command, substitute(self.template, compile_command),
+                command_key(self.template, compile_command))
+            for compile_command in compile_commands
+        ]
+
+    def _run_job(self, job):
+        start = time.time()
+        try:
+            with self._lock:
+                if self._stopped:
+                    job.returncode = -1
+                    return job
+                proc = subprocess.Popen(
+                    job.args,
+                    cwd=job.compile_command.directory,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE)
+                self._processes.add(proc)
+        except OSError as exc:
+            job.returncode = 127
+            job.stderr = '{}: {}\n'.format(job.args[0], exc).encode('utf-8')
+        else:
+            try:
+                job.stdout, job.stderr = proc.communicate()
+            finally:
+                with self._lock:
+                    self._processes.discard(proc)
+            job.returncode = proc.returncode
+        job.duration = time.time() - start
+        return job
+
+    def _kill_processes(self):
+        with self._lock:
+            self._stopped = True
+            for proc in self._processes:
+                with compdb.utils.suppress(OSError):
+                    proc.kill()
+
+    def run(self, jobs):
+        """Run the jobs, yield each job as soon as it is finished.
+
+        The jobs are started in order.
+        If the iteration is interrupted, the running tools are killed.
+        """
+        self._stopped = False
+        pool = ThreadPool(self.jobs)
+        try:
+            for job in pool.imap_unordered(self._run_job, jobs):
+                yield job
+        finally:
+            self._kill_processes()
+            pool.terminate()
+            pool.join()
+
+
+class RunHistory(object):
+    """The durations of the previous runs, keyed by command key."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.durations = {}
+        if path:
+            self._load()
+
+    def _load(self):
+        with compdb.utils.suppress(IOError, OSError, ValueError):
+            with io.open(self.path, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+            if data.get('version') == 1:
+                self.durations = data['durations']
+
+    def get(self, key):
+        return self.durations.get(key)
+
+    def record(self, key, duration):
+        self.durations[key] = duration
+
+    def save(self):
+        """Write the history, atomically."""
+        data = {
+            'version': 1,
+            'durations': self.durations,
+        }
+        compdb.utils.atomic_write(
+            self.path,
+            json.dumps(data, sort_keys=True).encode('utf-8'))
+
+
+class ResultCache(object):
+    """A cache of the tool results, stored in a directory.
+
+    The key of a job covers:
+    - the tool template
+    - the tool executable, identified by its path, size and modification time
+    - the configuration files of the tool,
+      the files named like one of config_names
+      in the directory of the file and in its parents,
+      e.g. the .clang-tidy files
+    - the directory, the file,
+      and the compile options which may affect the tool,
+      as returned by headerdb.sanitize_compile_options()
+    - the content of the file and of the headers it includes, transitively,
+      according to an included-by graph
+
+    Headers found outside of the include graph, e.g. system headers,
+    are not part of the key.
+    """
+
+    DEFAULT_CONFIG_NAMES = ['.clang-tidy', '.clang-format']
+
+    def __init__(self,
+                 directory,
+                 template,
+                 included_by_graph,
+                 fs=None,
+                 config_names=None):
+        self.directory = directory
+        self.template = template
+        self.fs = fs or compdb.filesystem.get_default()
+        if config_names is None:
+            config_names = self.DEFAULT_CONFIG_NAMES
+        self.config_names = config_names
+        self._sanitize = compdb.complementer.headerdb.sanitize_compile_options
+        self._closure = compdb.includedb.IncludeClosure(included_by_graph)
+        self._content_hashes = {}
+        # tool path -> identity
+        self._tool_ids = {}
+        # directory -> configuration files of the directory and its parents
+        self._config_files = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _content_hash(self, path):
+        try:
+            return self._content_hashes[path]
+        except KeyError:
+            pass
+        try:
+            digest = hashlib.sha1(self.fs.read(path)).hexdigest()
+        except (IOError, OSError):
+            digest = 'missing'
+        self._content_hashes[path] = digest
+        return digest
+
+    def _find_tool(self, directory):
+        """Return the path of the tool, run from directory.
+
+        Like the shell, a tool name without directory is looked up in PATH.
+        """
+        tool = self.template[0]
+        if os.path.dirname(tool):
+            return compdb.stats.normpath(os.path.join(directory, tool))
+        for search_path in os.environ.get('PATH', os.defpath).split(
+                os.pathsep):
+            candidate = os.path.join(search_path or os.curdir, tool)
+            if self.fs.isfile(candidate):
+                return candidate
+        return None
+
+    def _tool_id(self, directory):
+        path = self._find_tool(directory)
+        try:
+            return self._tool_ids[path]
+        except KeyError:
+            pass
+        tool_id = 'missing'
+        if path is not None:
+            with compdb.utils.suppress(OSError):
+                st = self.fs.stat(path)
+                tool_id = '{}\0{!r}\0{}'.format(
+                    path, st.st_mtime, st.st_size)
+        self._tool_ids[path] = tool_id
+        return tool_id
+
+    def _get_config_files(self, directory):
+        try:
+            return self._config_files[directory]
+        except KeyError:
+            pass
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            config_files = []
+        else:
+            config_files = list(self._get_config_files(parent))
+        for name in self.config_names:
+            path = os.path.join(directory, name)
+            if self.fs.isfile(path):
+                config_files.append(path)
+        self._config_files[directory] = config_files
+        return config_files
+
+    def key(self, compile_command):
+        h = hashlib.sha1()
+        directory = compdb.stats.normpath(compile_command.directory)
+        parts = [
+            '\0'.join(self.template),
+            self._tool_id(directory),
+            directory,
+            compile_command.normfile,
+            '\0'.join(self._sanitize(compile_command)),
+        ]
+        if any('{output}' in arg for arg in self.template):
+            parts.append(compile_command.output or '')
+        for path in self._get_config_files(
+                os.path.dirname(compile_command.normfile)):
+            parts.append(path)
+            parts.append(self._content_hash(path))
+        for path in sorted(self._closure(compile_command.normfile)):
+            parts.append(path)
+            parts.append(self._content_hash(path))
+        for part in parts:
+            h.update(part.encode('utf-8'))
+            h.update(b'\1')
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + '.json')
+
+    def get(self, job):
+        """Fill the result of a job from the cache, return True on a hit."""
+        try:
+            with io.open(self._path(self.key(job.compile_command)),
+                         'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+            job.returncode = data['returncode']
+            job.stdout = base64.b64decode(data['stdout'])
+            job.stderr = base64.b64decode(data['stderr'])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            self.misses += 1
+            return False
+        job.duration = 0.0
+        job.cached = True
+        self.hits += 1
+        return True
+
+    def put(self, job):
+        """Store the result of a job.
+
+        The tools which could not be started are not cached.
+        """
+        if job.returncode == 127:
+            return
+        path = self._path(self.key(job.compile_command))
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        compdb.utils.atomic_write(
+            path,
+            json.dumps({
+                'returncode': job.returncode,
+                'stdout': base64.b64encode(job.stdout).decode('ascii'),
+                'stderr': base64.b64encode(job.stderr).decode('ascii'),
+            }).encode('utf-8'))
+
+
+def schedule(jobs, history, cost):
+    """Sort the jobs longest first, return the sorted list.
+
+    The duration of a job is estimated from the history.
+    Jobs without history are estimated from their cost,
+    converted to seconds using the jobs with both a duration and a cost.
+    """
+    costs = [cost(job.compile_command) for job in jobs]
+    known_duration = 0.0
+    known_cost = 0
+    for job, job_cost in zip(jobs, costs):
+        duration = history.get(job.key)
+        if duration is not None:
+            known_duration += duration
+            known_cost += job_cost
+    if known_cost:
+        seconds_per_cost = known_duration / known_cost
+    else:
+        seconds_per_cost = 1.0
+    for job, job_cost in zip(jobs, costs):
+        duration = history.get(job.key)
+        if duration is None:
+            duration = job_cost * seconds_per_cost
+        job.estimate = duration
+    return sorted(jobs, key=lambda job: -job.estimate)
+
+
+def ideal_makespan(durations, workers):
+    """A lower bound of the makespan of jobs of the given durations."""
+    if not durations:
+        return 0.0
+    return max(max(durations), sum(durations) / workers)
+
+
+def write_job_output(job, stdout=None, stderr=None):
+    """Write the captured output of a job to binary streams."""
+    stdout = stdout or getattr(sys.stdout, 'buffer', sys.stdout)
+    stderr = stderr or getattr(sys.stderr, 'buffer', sys.stderr)
+    if job.stdout:
+        stdout.write(job.stdout)
+        stdout.flush()
+    if job.stderr:
+        stderr.write(job.stderr)
+        stderr.flush()
@@ -0,0 +1,96 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import heapq
+import zlib
+
+import compdb.filesystem
+import compdb.includedb
+
+
+def parse_shard(spec):
+    """Parse a shard specification of the form 'K/N', 1 <= K <= N.
+
+    Return the tuple (K, N), raise ValueError if the specification is invalid.
+    """
+    index, sep, count = spec.partition('/')
+    if not sep:
+        raise ValueError('invalid shard, should be of the form K/N')
+    index = int(index)
+    count = int(count)
+    if not 1 <= index <= count:
+        raise ValueError('invalid shard, should verify 1 <= K <= N')
+    return index, count
+
+
+def shard_of(compile_command, count):
+    """Return the shard of a compile command, between 1 and count.
+
+    The shard is a stable hash of the file path, the same file always ends up
+    in the same shard, whatever the other entries are.
+    """
+    key = compile_command.normfile.encode('utf-8')
+    return (zlib.crc32(key) & 0xffffffff) % count + 1
+
+
+def split_by_hash(compile_commands, index, count):
+    """Iterate over the compile commands of one shard, lazily."""
+    for compile_command in compile_commands:
+        if shard_of(compile_command, count) == index:
+            yield compile_command
+
+
+def split_by_cost(compile_commands, index, count, cost):
+    """Return the compile commands of one shard, balanced by cost.
+
+    The compile commands are assigned, from the most to the least expensive,
+    to the least loaded shard (LPT scheduling).
+    Each shard computes the same assignment,
+    so shards are computed independently from each other.
+    The compile commands keep their relative order in the shard.
+    """
+    compile_commands = list(compile_commands)
+    costs = [cost(c) for c in compile_commands]
+    order = sorted(range(len(compile_commands)), key=lambda i: -costs[i])
+    # heap of (load, shard), ties are resolved by the lowest shard
+    loads = [(0, shard) for shard in range(1, count + 1)]
+    selected = []
+    for i in order:
+        load, shard = heapq.heappop(loads)
+        heapq.heappush(loads, (load + costs[i], shard))
+        if shard == index:
+            selected.append(i)
+    return [compile_commands[i] for i in sorted(selected)]
+
+
+class IncludeClosureCost(object):
+    """Estimate the cost of a compile command from its file size.
+
+    The cost of a file is its size
+    plus the size of the headers it includes, transitively,
+    according to the included-by graph of an IncludedByDatabase.
+    A fixed overhead, in bytes, accounts for the startup of the tool,
+    it also spreads evenly the entries of similar sizes.
+    """
+
+    def __init__(self, included_by_graph, fs=None, entry_overhead=1024):
+        self.fs = fs or compdb.filesystem.get_default()
+        self.entry_overhead = entry_overhead
+        self._closure = compdb.includedb.IncludeClosure(included_by_graph)
+        self._sizes = {}
+
+    def _size(self, path):
+        try:
+            return self._sizes[path]
+        except KeyError:
+            pass
+        try:
+            size = self.fs.stat(path).st_size
+        except OSError:
+            size = 0
+        self._sizes[path] = size
+        return size
+
+    def __call__(self, compile_command):
+        return self.entry_overhead + sum(
+            self._size(path)
+            for path in self._closure(compile_command.normfile))
@@ -0,0 +1,59 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import collections
+import os
+
+# the counted operations
+STAT_CALLS = 'stat calls'
+FILE_OPENS = 'file opens'
+BYTES_READ = 'bytes read'
+DIRECTORY_LISTINGS = 'directory listings'
+REGEX_MATCHES = 'regex matches'
+NORMPATH_CALLS = 'normpath calls'
+BFS_NODES_VISITED = 'bfs nodes visited'
+SCORE_COMPUTATIONS = 'score computations'
+
+_counters = None
+
+
+def get_counters():
+    """Return the active counters, None if counting is disabled.
+
+    The counters are a collections.Counter mapping operations to counts.
+    """
+    return _counters
+
+
+def set_counters(counters):
+    """Set the counters to increment, None to disable counting."""
+    global _counters
+    _counters = counters
+
+
+def enable():
+    """Start counting with fresh counters, return them."""
+    set_counters(collections.Counter())
+    return _counters
+
+
+def add(operation, count=1):
+    """Count operations, this does nothing when counting is disabled."""
+    if _counters is not None:
+        _counters[operation] += count
+
+
+def normpath(path):
+    """Return os.path.normpath(path), counted as a NORMPATH_CALLS operation."""
+    add(NORMPATH_CALLS)
+    return os.path.normpath(path)
+
+
+def format_counters(counters):
+    rows = sorted(counters.items())
+    if not rows:
+        return ''
+    name_width = max(len(name) for name, _ in rows)
+    count_width = max(len(str(count)) for _, count in rows)
+    return ''.join('{}  {}\n'.format(
+        name.ljust(name_width),
+        str(count).rjust(count_width)) for name, count in rows)
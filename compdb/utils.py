@@ -6,6 +6,9 @@ import itertools
 import os
 import re
 import sys
+import tempfile
+
+import compdb.stats
 
 try:
     from StringIO import StringIO
@@ -69,7 +72,7 @@ def stdout_unicode_writer():
 
 
 def get_friendly_path(path):
-    full_path = os.path.normpath(path)
+    full_path = compdb.stats.normpath(path)
     try:
         rel_path = os.path.relpath(full_path)
     except ValueError:
@@ -90,10 +93,10 @@ def logical_abspath(p):
     but use the logical current working to expand relative paths.
     """
     if os.path.isabs(p):
-        return os.path.normpath(p)
+        return compdb.stats.normpath(p)
     cwd = os.getenv('PWD')
     if cwd and os.path.isabs(cwd) and os.path.samefile(cwd, '.'):
-        return os.path.normpath(os.path.join(cwd, p))
+        return compdb.stats.normpath(os.path.join(cwd, p))
     return os.path.abspath(p)
 
 
@@ -106,3 +109,29 @@ def locate_dominating_file(name, start_dir=os.curdir):
         olddir = curdir
         curdir = os.path.dirname(curdir)
     return None
+
+
+def get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def atomic_write(path, content):
+    """Write bytes to a file, readers never see a partial file.
+
+    The content is written to a temporary file of the same directory,
+    renamed over path once complete.
+    Like a file created with open(), the file mode honors the umask.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.compdb-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o666 & ~get_umask())
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,8 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import sys
+
+from tests.benchmark.suite import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import argparse
+import bisect
+import io
+import json
+import os
+import random
+import sys
+
+
+class ProjectSpec(object):
+    """The shape of a synthetic C++ project."""
+
+    def __init__(self,
+                 tu_count=200,
+                 header_count=400,
+                 include_depth=4,
+                 includes_per_file=4,
+                 fan_in_skew=1.0,
+                 include_dir_count=8,
+                 targets_per_directory=2,
+                 tus_per_directory=10,
+                 local_headers=True,
+                 lines_per_file=20,
+                 seed=0):
+        self.tu_count = tu_count
+        self.header_count = header_count
+        # the headers are organized in levels,
+        # a header includes headers of the next level only
+        self.include_depth = include_depth
+        self.includes_per_file = includes_per_file
+        # 0 picks the included headers uniformly,
+        # the higher, the more the includes go to a few popular headers
+        self.fan_in_skew = fan_in_skew
+        # the number of -I options of each compile command
+        self.include_dir_count = include_dir_count
+        self.targets_per_directory = targets_per_directory
+        self.tus_per_directory = tus_per_directory
+        # give each translation unit a private header, e.g. foo.cpp/foo.h
+        self.local_headers = local_headers
+        self.lines_per_file = lines_per_file
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+
+class _WeightedChoice(object):
+    """Zipf-like choice, item i has the weight 1 / (i + 1) ** skew."""
+
+    def __init__(self, items, skew, rng):
+        self.items = items
+        self.rng = rng
+        self.cumulative_weights = []
+        total = 0.0
+        for i in range(len(items)):
+            total += 1.0 / (i + 1)**skew
+            self.cumulative_weights.append(total)
+
+    def sample(self, count):
+        """Return up to count distinct items."""
+        count = min(count, len(self.items))
+        chosen = []
+        while len(chosen) < count:
+            x = self.rng.random() * self.cumulative_weights[-1]
+            item = self.items[bisect.bisect(self.cumulative_weights, x)]
+            if item not in chosen:
+                chosen.append(item)
+        return chosen
+
+
+def _write(path, lines):
+    with io.open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+
+
+def _filler(name, count):
+    return ['int {}_{}(void);'.format(name, i) for i in range(count)]
+
+
+def generate_project(out_dir, spec):
+    """Generate the sources and the compile_commands.json of a project.
+
+    The layout is:
+    - out_dir/include/libK/hdrN.h: the shared headers,
+      included as <hdrN.h> through one -I per include directory
+    - out_dir/src/dirD/tuN.cpp: the translation units,
+      with their private header tuN.h
+    - out_dir/build/compile_commands.json
+
+    Return the path of the compile_commands.json.
+    """
+    rng = random.Random(spec.seed)
+    out_dir = os.path.abspath(out_dir)
+    include_dirs = [
+        os.path.join(out_dir, 'include', 'lib{}'.format(k))
+        for k in range(spec.include_dir_count)
+    ]
+    for include_dir in include_dirs:
+        os.makedirs(include_dir)
+
+    # the levels of the include hierarchy
+    levels = [[] for _ in range(max(1, spec.include_depth))]
+    for n in range(spec.header_count):
+        levels[n % len(levels)].append('hdr{}.h'.format(n))
+    choosers = [_WeightedChoice(level, spec.fan_in_skew, rng)
+                for level in levels]
+    for depth, level in enumerate(levels):
+        for n, header in enumerate(level):
+            includes = []
+            if depth + 1 < len(levels):
+                includes = choosers[depth + 1].sample(spec.includes_per_file)
+            include_dir = include_dirs[rng.randrange(len(include_dirs))]
+            lines = ['#pragma once']
+            lines.extend('#include <{}>'.format(h) for h in includes)
+            lines.extend(_filler(header[:-2], spec.lines_per_file))
+            _write(os.path.join(include_dir, header), lines)
+
+    build_dir = os.path.join(out_dir, 'build')
+    os.makedirs(build_dir)
+    include_options = ' '.join('-I' + d for d in include_dirs)
+    compile_commands = []
+    for n in range(spec.tu_count):
+        directory_index = n // spec.tus_per_directory
+        src_dir = os.path.join(out_dir, 'src', 'dir{}'.format(directory_index))
+        if n % spec.tus_per_directory == 0:
+            os.makedirs(src_dir)
+        name = 'tu{}'.format(n)
+        lines = []
+        if spec.local_headers:
+            lines.append('#include "{}.h"'.format(name))
+            _write(
+                os.path.join(src_dir, name + '.h'),
+                ['#pragma once'] + _filler(name + '_h', spec.lines_per_file))
+        if levels[0]:
+            lines.extend('#include <{}>'.format(h)
+                         for h in choosers[0].sample(spec.includes_per_file))
+        lines.extend(_filler(name, spec.lines_per_file))
+        source = os.path.join(src_dir, name + '.cpp')
+        _write(source, lines)
+        target = 'target{}_{}'.format(directory_index,
+                                      n % spec.targets_per_directory)
+        obj = os.path.join('CMakeFiles', target + '.dir', name + '.cpp.o')
+        compile_commands.append({
+            'directory': build_dir,
+            'command': 'c++ -DTARGET={} {} -O2 -o {} -c {}'.format(
+                target, include_options, obj, source),
+            'file': source,
+        })
+
+    db_path = os.path.join(build_dir, 'compile_commands.json')
+    with io.open(db_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(compile_commands, indent=2))
+    return db_path
+
+
+def add_spec_arguments(parser):
+    default = ProjectSpec()
+    for name, value in sorted(default.to_dict().items()):
+        option = '--' + name.replace('_', '-')
+        if isinstance(value, bool):
+            parser.add_argument(
+                '--no-' + name.replace('_', '-'),
+                dest=name,
+                action='store_false',
+                help='disable ' + name.replace('_', ' '))
+        else:
+            parser.add_argument(
+                option,
+                dest=name,
+                type=type(value),
+                default=value,
+                help='default: %(default)s')
+
+
+def spec_from_args(args):
+    return ProjectSpec.from_dict({
+        name: getattr(args, name)
+        for name in ProjectSpec().to_dict()
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='generate a synthetic C++ project '
+        'and its compilation database')
+    parser.add_argument('out_dir', help='output directory, must not exist')
+    add_spec_arguments(parser)
+    args = parser.parse_args(argv)
+    print(generate_project(args.out_dir, spec_from_args(args)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+import compdb.filesystem
+from compdb.backend.json import (JSONCompilationDatabase,
+                                 compile_commands_to_json)
+from compdb.complementer.headerdb import make_headerdb
+from compdb.includedb import (IncludedByDatabase, IncludeIndexBuilder)
+
+from tests.benchmark.generate import (add_spec_arguments, generate_project,
+                                      spec_from_args)
+
+# number of files looked up by the per-file lookup benchmark
+LOOKUP_SAMPLE_SIZE = 100
+
+
+class Benchmark(object):
+    """The benchmarks of a generated project.
+
+    Each benchmark is a method, named after the benchmark,
+    which returns a function to time, the setup is not timed.
+    """
+
+    names = [
+        'json_load',
+        'file_lookup',
+        'include_index_build',
+        'make_headerdb',
+        'find_best',
+        'serialization',
+    ]
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # the database is loaded once, the loading is timed separately
+        self.database = JSONCompilationDatabase(db_path)
+        self.database._data
+        self.compile_commands = list(self.database.get_all_compile_commands())
+        self.__included_by_database = None
+
+    @property
+    def _included_by_database(self):
+        if self.__included_by_database is None:
+            self.__included_by_database = IncludeIndexBuilder().build(
+                self.database)
+        return self.__included_by_database
+
+    def json_load(self):
+        def run():
+            JSONCompilationDatabase(self.db_path)._data
+
+        return run
+
+    def file_lookup(self):
+        files = list(self.database.get_all_files())
+        step = max(1, len(files) // LOOKUP_SAMPLE_SIZE)
+        sample = files[::step][:LOOKUP_SAMPLE_SIZE]
+
+        def run():
+            for path in sample:
+                list(self.database.get_compile_commands(path))
+
+        return run
+
+    def include_index_build(self):
+        def run():
+            IncludeIndexBuilder().build(self.database)
+
+        return run
+
+    def make_headerdb(self):
+        def run():
+            make_headerdb([[self.database]])
+
+        return run
+
+    def find_best(self):
+        graph = self._included_by_database.graph
+        headers = sorted(graph)
+
+        def run():
+            included_by_database = IncludedByDatabase(graph, self.database)
+            for header in headers:
+                included_by_database._find_best(header)
+
+        return run
+
+    def serialization(self):
+        compile_commands = self.compile_commands + list(
+            self._included_by_database.get_all_compile_commands())
+
+        def run():
+            compile_commands_to_json(compile_commands, io.StringIO())
+
+        return run
+
+
+def _fresh_file_system():
+    # like the command line, but each run starts with an empty snapshot
+    compdb.filesystem.set_default(compdb.filesystem.SnapshotFileSystem())
+
+
+def run_benchmarks(db_path, names, repeat):
+    """Return a dict of benchmark name to the best time, in seconds."""
+    benchmark = Benchmark(db_path)
+    results = {}
+    for name in names:
+        func = getattr(benchmark, name)()
+        results[name] = min(
+            timeit.repeat(func, setup=_fresh_file_system, repeat=repeat,
+                          number=1))
+    return results
+
+
+def format_comparison(baseline, results, threshold):
+    """Return the comparison table and the names of the regressions."""
+    lines = ['{:<20} {:>12} {:>12} {:>8}'.format('benchmark', 'baseline (s)',
+                                                 'current (s)', 'ratio')]
+    regressions = []
+    for name in sorted(results):
+        current = results[name]
+        if name not in baseline:
+            lines.append('{:<20} {:>12} {:>12.4f}'.format(name, '-', current))
+            continue
+        ratio = current / baseline[name] if baseline[name] else float('inf')
+        mark = ''
+        if ratio > threshold:
+            regressions.append(name)
+            mark = '  regression'
+        lines.append('{:<20} {:>12.4f} {:>12.4f} {:>8.2f}{}'.format(
+            name, baseline[name], current, ratio, mark))
+    return '\n'.join(lines) + '\n', regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m tests.benchmark',
+        description='benchmark compdb on a synthetic project')
+    parser.add_argument(
+        '--project',
+        metavar='DIR',
+        help='reuse the project generated in DIR, '
+        'generate it if DIR does not exist')
+    parser.add_argument(
+        '--benchmark',
+        dest='names',
+        choices=Benchmark.names,
+        action='append',
+        help='run only this benchmark')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='the best time of N runs is kept, default: %(default)s')
+    parser.add_argument(
+        '--save', metavar='FILE', help='save the results as a baseline')
+    parser.add_argument(
+        '--compare', metavar='FILE', help='compare the results to a baseline')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=1.2,
+        help='the current/baseline ratio above which a benchmark regressed, '
+        'default: %(default)s')
+    add_spec_arguments(parser)
+    args = parser.parse_args(argv)
+    spec = spec_from_args(args)
+
+    tmpdir = None
+    project_dir = args.project
+    if not project_dir:
+        tmpdir = tempfile.mkdtemp(prefix='compdb-benchmark-')
+        project_dir = os.path.join(tmpdir, 'project')
+    try:
+        db_path = os.path.join(project_dir, 'build', 'compile_commands.json')
+        if not os.path.exists(db_path):
+            generate_project(project_dir, spec)
+        results = run_benchmarks(db_path, args.names or Benchmark.names,
+                                 args.repeat)
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+    report = {
+        'spec': spec.to_dict(),
+        'python': platform.python_version(),
+        'results': results,
+    }
+    if args.save:
+        with io.open(args.save, 'wb') as f:
+            f.write(
+                json.dumps(report, indent=2, sort_keys=True).encode('utf-8'))
+    if not args.compare:
+        for name in Benchmark.names:
+            if name in results:
+                print('{:<20} {:>10.4f}s'.format(name, results[name]))
+        return 0
+    with io.open(args.compare, 'rb') as f:
+        baseline = json.loads(f.read().decode('utf-8'))
+    if baseline['spec'] != report['spec']:
+        print('warning: the baseline was made with a different project',
+              file=sys.stderr)
+    table, regressions = format_comparison(baseline['results'], results,
+                                           args.threshold)
+    sys.stdout.write(table)
+    return 1 if regressions else 0
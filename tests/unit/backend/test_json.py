@@ -57,3 +57,11 @@ class JSONCompilationDatabaseTest(unittest.TestCase):
                 '/tmp/c.cpp',
                 '/tmp/d.cpp',
             ])
+
+    def test_get_all_compile_command_ids(self):
+        ids = list(self.db.get_all_compile_command_ids())
+        self.assertEqual(len(list(self.db.get_all_compile_commands())),
+                         len(ids))
+        self.assertEqual(len(ids), len(set(ids)))
+        other = JSONCompilationDatabase.probe_directory(self.TEST_DIR)
+        self.assertEqual(ids, list(other.get_all_compile_command_ids()))
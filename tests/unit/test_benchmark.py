@@ -0,0 +1,64 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import compdb.filesystem
+from compdb.backend.json import JSONCompilationDatabase
+from compdb.includedb import IncludeIndexBuilder
+
+from tests.benchmark.generate import (ProjectSpec, generate_project)
+from tests.benchmark.suite import (Benchmark, format_comparison,
+                                   run_benchmarks)
+
+
+class GenerateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.spec = ProjectSpec(
+            tu_count=12,
+            header_count=20,
+            include_depth=3,
+            include_dir_count=3,
+            tus_per_directory=5)
+
+    def tearDown(self):
+        compdb.filesystem.set_default(compdb.filesystem.RealFileSystem())
+        shutil.rmtree(self.tmpdir)
+
+    def generate(self, name):
+        return generate_project(os.path.join(self.tmpdir, name), self.spec)
+
+    def test_project(self):
+        database = JSONCompilationDatabase(self.generate('project'))
+        compile_commands = list(database.get_all_compile_commands())
+        self.assertEqual(12, len(compile_commands))
+        self.assertEqual(
+            3, sum(1 for arg in compile_commands[0].arguments
+                   if arg.startswith('-I')))
+        # all the includes resolve: the private headers and the shared ones
+        graph = IncludeIndexBuilder().build(database).graph
+        self.assertEqual(12 + 20, len(graph))
+
+    def test_deterministic(self):
+        def read(path):
+            with open(path, 'rb') as f:
+                return f.read().replace(os.path.dirname(
+                    os.path.dirname(path)).encode('utf-8'), b'')
+
+        self.assertEqual(read(self.generate('a')), read(self.generate('b')))
+
+    def test_benchmarks(self):
+        results = run_benchmarks(self.generate('project'), Benchmark.names, 1)
+        self.assertEqual(sorted(Benchmark.names), sorted(results))
+        table, regressions = format_comparison(
+            dict(results, serialization=results['serialization'] / 10),
+            results, 1.2)
+        self.assertEqual(['serialization'], regressions)
+        self.assertIn('json_load', table)
+
+
+if __name__ == "__main__":
+    unittest.main()
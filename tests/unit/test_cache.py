@@ -0,0 +1,186 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import compdb.cache
+from compdb.backend.json import JSONCompilationDatabase
+from compdb.cache import ContentCache, _try_lock
+from compdb.config import (ConfigSchema, LazyTypedConfig, get_user_conf)
+from compdb.models import CompileCommand
+
+
+class ContentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='compdb-test-cache-')
+        self.cache = ContentCache(self.tmpdir, max_size=10, ttl=3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def age(self, key, seconds):
+        path = self.cache._path('ns', key)
+        mtime = time.time() - seconds
+        os.utime(path, (mtime, mtime))
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get('ns', 'abcdef'))
+        self.cache.put('ns', 'abcdef', b'data')
+        self.cache.put('ns', 'abcdef', b'data')
+        self.assertEqual(b'data', self.cache.get('ns', 'abcdef'))
+        self.assertIsNone(self.cache.get('other', 'abcdef'))
+        self.assertEqual((1, 2), (self.cache.hits, self.cache.misses))
+
+    def test_put_unwritable(self):
+        # the entry directory cannot be created
+        not_a_dir = os.path.join(self.tmpdir, 'file')
+        with open(not_a_dir, 'wb'):
+            pass
+        cache = ContentCache(not_a_dir)
+        cache.put('ns', 'abcdef', b'data')
+        self.assertIsNone(cache.get('ns', 'abcdef'))
+        # the entry directory exists, but the entry cannot be written in it
+        os.makedirs(os.path.join(self.tmpdir, 'ns'))
+        with open(os.path.join(self.tmpdir, 'ns', 'ab'), 'wb'):
+            pass
+        self.cache.put('ns', 'abcdef', b'data')
+        self.assertIsNone(self.cache.get('ns', 'abcdef'))
+
+    def test_evict_lru(self):
+        for i, key in enumerate(['aa01', 'aa02', 'aa03']):
+            self.cache.put('ns', key, b'12345')
+            self.age(key, 100 - i)
+        # reading an entry makes it the most recently used
+        self.cache.get('ns', 'aa01')
+        self.assertEqual(1, self.cache.evict(force=True))
+        self.assertIsNone(self.cache.get('ns', 'aa02'))
+        self.assertIsNotNone(self.cache.get('ns', 'aa01'))
+        self.assertIsNotNone(self.cache.get('ns', 'aa03'))
+
+    def test_evict_ttl(self):
+        self.cache.put('ns', 'aa01', b'1')
+        self.cache.put('ns', 'aa02', b'2')
+        self.age('aa01', 7200)
+        self.assertEqual(1, self.cache.evict(force=True))
+        self.assertIsNone(self.cache.get('ns', 'aa01'))
+
+    def test_evict_interval(self):
+        self.cache.put('ns', 'aa01', b'1')
+        self.age('aa01', 7200)
+        self.assertEqual(1, self.cache.evict())
+        self.cache.put('ns', 'aa02', b'2')
+        self.age('aa02', 7200)
+        self.assertEqual(0, self.cache.evict())
+        self.assertIsNotNone(self.cache.get('ns', 'aa02'))
+
+    @unittest.skipUnless(compdb.cache.fcntl, 'requires fcntl')
+    def test_evict_locked(self):
+        with _try_lock(os.path.join(self.tmpdir, 'lock')) as locked:
+            self.assertTrue(locked)
+            # flock() locks are per open file, even in the same process
+            self.assertIsNone(self.cache.evict(force=True))
+
+
+class ConfigTest(unittest.TestCase):
+    def make_config(self, overrides):
+        schema = ConfigSchema()
+        compdb.cache.register_config(schema.get_section_schema('cache'))
+        config = LazyTypedConfig(schema)
+        config.set_overrides(overrides)
+        return config
+
+    def test_defaults(self):
+        cache = compdb.cache.from_config(self.make_config([]).cache)
+        self.assertEqual(compdb.cache.get_user_cache_dir(), cache.directory)
+        self.assertEqual(512 * 1024 * 1024, cache.max_size)
+
+    def test_overrides(self):
+        cache = compdb.cache.from_config(
+            self.make_config([('cache.max_size', '2'), ('cache.ttl', '1'),
+                              ('cache.directory', 'foo')]).cache)
+        self.assertEqual('foo', cache.directory)
+        self.assertEqual(2 * 1024 * 1024, cache.max_size)
+        self.assertEqual(24 * 3600, cache.ttl)
+
+    @unittest.skipIf(sys.platform.startswith('win32'), 'XDG is not used')
+    def test_xdg_cache_home(self):
+        old = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = '/xdg/cache'
+        try:
+            self.assertEqual(
+                os.path.join('/xdg/cache', 'compdb'),
+                compdb.cache.get_user_cache_dir())
+        finally:
+            if old is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = old
+
+    def test_same_rules_as_config(self):
+        old_platform = sys.platform
+        old_environ = dict(os.environ)
+        os.environ.update({
+            'XDG_CONFIG_HOME': '/xdg/config',
+            'XDG_CACHE_HOME': '/xdg/cache',
+            'APPDATA': 'C:\\roaming',
+            'LOCALAPPDATA': 'C:\\local',
+        })
+        try:
+            for platform, config_home, cache_home in [
+                ('linux', '/xdg/config', '/xdg/cache'),
+                ('darwin', '/xdg/config', '/xdg/cache'),
+                ('win32', 'C:\\roaming', 'C:\\local'),
+            ]:
+                sys.platform = platform
+                self.assertEqual(
+                    os.path.join(config_home, 'compdb', 'config'),
+                    get_user_conf(), platform)
+                self.assertEqual(
+                    os.path.join(cache_home, 'compdb'),
+                    compdb.cache.get_user_cache_dir(), platform)
+        finally:
+            sys.platform = old_platform
+            os.environ.clear()
+            os.environ.update(old_environ)
+
+
+class CachedDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='compdb-test-cache-')
+        self.cache = ContentCache(os.path.join(self.tmpdir, 'cache'))
+        compdb.cache.set_default(self.cache)
+
+    def tearDown(self):
+        compdb.cache.set_default(None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_json_database(self):
+        db_path = os.path.join(self.tmpdir, 'compile_commands.json')
+        with io.open(db_path, 'w', encoding='utf-8') as f:
+            f.write(
+                json.dumps([{
+                    'directory': '/build',
+                    'file': 'a.c',
+                    'command': 'cc -DFOO="a b" -c a.c',
+                    'output': 'a.o',
+                }]))
+        expected = [
+            CompileCommand('/build', 'a.c', ['cc', '-DFOO=a b', '-c', 'a.c'],
+                           'a.o')
+        ]
+        for _ in range(2):
+            self.assertEqual(
+                expected,
+                list(JSONCompilationDatabase(db_path)
+                     .get_all_compile_commands()))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+TOP_LEVEL = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# modules that should not be imported for commands which do not need them
+HEAVY_MODULES = [
+    'compdb.backend.json',
+    'compdb.complementer.headerdb',
+    'compdb.core',
+    'compdb.filelist',
+    'compdb.includedb',
+    'json',
+    'multiprocessing',
+    'pprint',
+]
+
+
+def _imported_modules(code):
+    """Return the modules imported by code, according to -X importtime."""
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=TOP_LEVEL,
+        stderr=subprocess.STDOUT)
+    modules = set()
+    for line in output.decode('utf-8').splitlines():
+        if line.startswith('import time:'):
+            modules.add(line.rpartition('|')[2].strip())
+    return modules
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime requires 3.7')
+class StartupTest(unittest.TestCase):
+    def assertNotImported(self, modules):
+        self.assertEqual([], sorted(set(HEAVY_MODULES) & modules))
+
+    def test_import(self):
+        modules = _imported_modules('import compdb.cli')
+        self.assertIn('compdb.cli', modules)
+        self.assertNotImported(modules)
+
+    def test_version(self):
+        modules = _imported_modules(
+            'import compdb.cli; compdb.cli.main(["version"])')
+        self.assertNotImported(modules)
+
+    def test_help(self):
+        modules = _imported_modules(
+            'import compdb.cli; compdb.cli.main(["help"])')
+        self.assertNotImported(modules)
+
+
+class CoverageTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.build_dir = os.path.join(self.root, 'build')
+        self.src_dir = os.path.join(self.root, 'src')
+        for path in ['src/a.cpp', 'src/a.h', 'src/b.cpp', 'src/c.h',
+                     'src/third_party/d.h', 'build/compile_commands.json']:
+            path = os.path.join(self.root, *path.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                if path.endswith('a.cpp'):
+                    f.write('#include "a.h"\n')
+        with open(os.path.join(self.build_dir, 'compile_commands.json'),
+                  'w') as f:
+            json.dump([{
+                'directory': self.build_dir,
+                'file': os.path.join(self.src_dir, 'a.cpp'),
+                'arguments': ['clang++', '-c', '../src/a.cpp'],
+            }], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def coverage(self, *args):
+        env = dict(os.environ, XDG_CONFIG_HOME=self.root)
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'compdb', '-p', self.build_dir,
+             'coverage'] + list(args) + [self.src_dir],
+            cwd=TOP_LEVEL,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        missing = sorted(
+            os.path.relpath(path, self.src_dir).replace(os.sep, '/')
+            for path in out.decode('utf-8').splitlines())
+        return process.returncode, missing, err.decode('utf-8')
+
+    def test_uncovered(self):
+        returncode, missing, err = self.coverage()
+        self.assertEqual(1, returncode)
+        # a.h is included by a.cpp
+        self.assertEqual(['b.cpp', 'c.h', 'third_party/d.h'], missing)
+        self.assertIn('3 file(s) without compile commands', err)
+
+    def test_groups_and_suppressions(self):
+        suppressions = os.path.join(self.root, 'suppressions.txt')
+        with open(suppressions, 'w') as f:
+            f.write('# vendored code\nthird_party/*\nc.h  # generated\n')
+        returncode, missing, _ = self.coverage('--group', 'header',
+                                               '--suppressions', suppressions)
+        self.assertEqual((0, []), (returncode, missing))
+        returncode, missing, _ = self.coverage('--group', 'source',
+                                               '--suppressions', suppressions)
+        self.assertEqual((1, ['b.cpp']), (returncode, missing))
+
+
+class ListTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        files = {
+            # reaches lib/y.h through a relative include,
+            # its search paths do not cover lib/
+            'src/y.cpp': '#include "../lib/y.h"\n',
+            'lib/a_b_c_d.cpp': '#include "y.h"\n#include <z.h>\n',
+            'lib/y.h': '',
+            'lib/include/z.h': '',
+        }
+        for path, content in files.items():
+            path = os.path.join(self.root, *path.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(content)
+        with open(os.path.join(self.root, 'compile_commands.json'), 'w') as f:
+            json.dump([{
+                'directory': self.root,
+                'file': 'src/y.cpp',
+                'arguments': ['c++', '-DTEST', '-c', 'src/y.cpp'],
+            }, {
+                'directory': self.root,
+                'file': 'lib/a_b_c_d.cpp',
+                'arguments': [
+                    'c++', '-DLIB', '-Ilib/include', '-c', 'lib/a_b_c_d.cpp'
+                ],
+            }], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def list_output(self, *args):
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'compdb', '-p', self.root, 'list'] +
+            list(args),
+            cwd=TOP_LEVEL)
+        return output.decode('utf-8')
+
+    def list(self, *args):
+        return json.loads(self.list_output(*args))
+
+    def test_file_parity(self):
+        entries = self.list()
+        self.assertEqual(4, len(entries))
+        for entry in entries:
+            path = os.path.join(self.root, entry['file'])
+            self.assertEqual([entry], self.list(path), entry['file'])
+        y_entry, = self.list(os.path.join(self.root, 'lib', 'y.h'))
+        self.assertIn('-DTEST', y_entry['command'])
+
+    def test_ndjson(self):
+        lines = self.list_output('--format', 'ndjson').splitlines()
+        self.assertEqual(self.list(), [json.loads(line) for line in lines])
+
+    def test_shards(self):
+        def key(entry):
+            return json.dumps(entry, sort_keys=True)
+
+        expected = sorted(map(key, self.list()))
+        for shard_by in ['hash', 'cost']:
+            entries = []
+            for k in range(1, 4):
+                entries.extend(
+                    self.list('--shard', '{}/3'.format(k), '--shard-by',
+                              shard_by))
+            # each entry is in exactly one shard
+            self.assertEqual(expected, sorted(map(key, entries)), shard_by)
+
+    def test_shard_files(self):
+        proc = subprocess.Popen(
+            [
+                sys.executable, '-m', 'compdb', '-p', self.root, 'list',
+                '--shard', '1/2',
+                os.path.join(self.root, 'src', 'y.cpp')
+            ],
+            cwd=TOP_LEVEL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        self.assertEqual(2, proc.returncode)
+        self.assertEqual(b'', stdout)
+        self.assertIn(b'--shard cannot be used with a list of files', stderr)
+
+
+@unittest.skipIf(os.name != 'posix', 'requires POSIX file modes')
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, 'compile_commands.json'),
+                  'w') as f:
+            json.dump([{
+                'directory': self.tmpdir,
+                'file': 'a.c',
+                'arguments': ['cc', '-c', 'a.c'],
+            }], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_output_mode(self):
+        output = os.path.join(self.tmpdir, 'merged.json')
+        subprocess.check_call(
+            [sys.executable, '-c',
+             'import os, sys, compdb.cli; os.umask(0o022); '
+             'compdb.cli.main(sys.argv[1:])',
+             'merge', '-o', output, self.tmpdir],
+            cwd=TOP_LEVEL)
+        self.assertEqual(0o644, os.stat(output).st_mode & 0o777)
+
+
+if __name__ == "__main__":
+    unittest.main()
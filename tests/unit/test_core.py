@@ -0,0 +1,226 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from compdb.backend.json import (JSONCompilationDatabase,
+                                 compile_commands_to_json)
+from compdb.complementer.headerdb import Complementer
+from compdb.core import CompilationDatabase
+from compdb.includedb import IncludeIndexBuilder
+from compdb.models import CompileCommand
+
+
+class UpdateComplementsTest(unittest.TestCase):
+    LOCAL_PATH = os.path.abspath(os.path.dirname(__file__))
+    TEST_DIR = os.path.join(LOCAL_PATH, 'headerdb', 'test_03')
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.tmpdir, 'src')
+        shutil.copytree(self.TEST_DIR, self.srcdir)
+        with io.open(
+                os.path.join(self.tmpdir, 'compile_commands.json'),
+                'w',
+                encoding='utf8') as f:
+            compile_commands_to_json([
+                CompileCommand(self.srcdir, 'a_b.cpp', ['clang++', '-DAB=1']),
+                CompileCommand(self.srcdir, 'a.cpp', ['clang++', '-DA=1']),
+                CompileCommand(self.srcdir, 'b.cpp', ['clang++', '-DB=1']),
+            ], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def update(self):
+        database = CompilationDatabase()
+        database.register_backend(JSONCompilationDatabase)
+        database.add_complementer('headerdb', Complementer())
+        database.raise_on_missing_cache = False
+        database.add_directory(self.tmpdir)
+        events = [event for event, _ in database.update_complements()]
+        files = sorted(c.file for c in database.get_all_compile_commands())
+        return events, files
+
+    def test_incremental(self):
+        events, files = self.update()
+        self.assertEqual(['begin', 'saving', 'end'], events)
+        self.assertEqual([
+            'a.cpp', 'a.hpp', 'a_b.cpp', 'a_private.hpp', 'b.cpp', 'b.hpp',
+            'b_private.hpp'
+        ], files)
+
+        # nothing changed
+        self.assertEqual((['begin', 'up-to-date', 'end'], files),
+                         self.update())
+
+        # touch without modification
+        header = os.path.join(self.srcdir, 'a.hpp')
+        st = os.stat(header)
+        os.utime(header, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual((['begin', 'up-to-date', 'end'], files),
+                         self.update())
+
+        # modification which does not change the result
+        with io.open(header, 'a', encoding='utf8') as f:
+            f.write('// comment\n')
+        self.assertEqual((['begin', 'end'], files), self.update())
+        self.assertEqual((['begin', 'up-to-date', 'end'], files),
+                         self.update())
+
+        # modification which changes the result
+        os.remove(os.path.join(self.srcdir, 'b_private.hpp'))
+        events, new_files = self.update()
+        self.assertEqual(['begin', 'saving', 'end'], events)
+        self.assertNotIn('b_private.hpp', new_files)
+
+    def test_unchanged_caches(self):
+        # one database per source file
+        directories = []
+        for name in ['a', 'b']:
+            directory = os.path.join(self.tmpdir, name)
+            os.mkdir(directory)
+            with io.open(
+                    os.path.join(directory, 'compile_commands.json'),
+                    'w',
+                    encoding='utf8') as f:
+                compile_commands_to_json([
+                    CompileCommand(self.srcdir, name + '.cpp', ['clang++'])
+                ], f)
+            directories.append(directory)
+
+        def update():
+            database = CompilationDatabase()
+            database.register_backend(JSONCompilationDatabase)
+            database.add_complementer('headerdb', Complementer())
+            database.raise_on_missing_cache = False
+            database.add_directories(directories)
+            return [
+                data['file'] for event, data in database.update_complements()
+                if event == 'saving'
+            ]
+
+        cache_paths = [os.path.join(d, 'headerdb.json') for d in directories]
+        self.assertEqual(cache_paths, update())
+        os.remove(os.path.join(self.srcdir, 'b_private.hpp'))
+        self.assertEqual(cache_paths[1:], update())
+        self.assertEqual([], update())
+
+
+class RefreshTest(unittest.TestCase):
+    LOCAL_PATH = os.path.abspath(os.path.dirname(__file__))
+    TEST_DIR = os.path.join(LOCAL_PATH, 'headerdb', 'test_03')
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.tmpdir, 'src')
+        shutil.copytree(self.TEST_DIR, self.srcdir)
+        self.db_path = os.path.join(self.tmpdir, 'compile_commands.json')
+        self.mtime = 1000000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, compile_commands):
+        with io.open(self.db_path, 'w', encoding='utf8') as f:
+            compile_commands_to_json(compile_commands, f)
+        # make sure the modification time changes
+        self.mtime += 10
+        os.utime(self.db_path, (self.mtime, self.mtime))
+
+    def make_database(self, complementer=None):
+        database = CompilationDatabase()
+        database.register_backend(JSONCompilationDatabase)
+        if complementer:
+            database.add_complementer('headerdb', complementer)
+            database.raise_on_missing_cache = False
+        database.add_directory(self.tmpdir)
+        return database
+
+    def test_refresh(self):
+        a = CompileCommand(self.srcdir, 'a.cpp', ['clang++', '-DA=1'])
+        b = CompileCommand(self.srcdir, 'b.cpp', ['clang++', '-DB=1'])
+        self.write([a, b])
+        database = self.make_database()
+        included_by_database = IncludeIndexBuilder().build(database)
+        included_by_database.get_compile_commands(
+            os.path.join(self.srcdir, 'b.hpp'))
+
+        self.assertFalse(database.refresh())
+
+        a2 = CompileCommand(self.srcdir, 'a.cpp', ['clang++', '-DA=2'])
+        a_b = CompileCommand(self.srcdir, 'a_b.cpp', ['clang++', '-DAB=1'])
+        self.write([a_b, a2])
+        changes = database.refresh()
+        self.assertEqual([a, b], changes.removed)
+        self.assertEqual([a_b, a2], changes.added)
+        self.assertEqual(
+            set(
+                os.path.join(self.srcdir, f)
+                for f in ['a.cpp', 'b.cpp', 'a_b.cpp']), changes.files)
+        self.assertEqual([a_b, a2], list(database.get_all_compile_commands()))
+        self.assertFalse(database.refresh())
+
+        included_by_database.update(changes)
+        expected = IncludeIndexBuilder().build(self.make_database())
+        self.assertEqual(
+            {k: sorted(v)
+             for k, v in expected.graph.items()},
+            {k: sorted(v)
+             for k, v in included_by_database.graph.items()})
+        self.assertEqual(
+            list(
+                expected.get_compile_commands(
+                    os.path.join(self.srcdir, 'b.hpp'))),
+            list(
+                included_by_database.get_compile_commands(
+                    os.path.join(self.srcdir, 'b.hpp'))))
+
+    def test_partial_write(self):
+        a = CompileCommand(self.srcdir, 'a.cpp', ['clang++', '-DA=1'])
+        self.write([a])
+        database = self.make_database()
+        self.assertEqual([a], list(database.get_all_compile_commands()))
+
+        # the database is being rewritten
+        with io.open(self.db_path, 'w', encoding='utf8') as f:
+            f.write('[{"directory": ')
+        self.assertFalse(database.refresh())
+        self.assertEqual([a], list(database.get_all_compile_commands()))
+
+        b = CompileCommand(self.srcdir, 'b.cpp', ['clang++', '-DB=1'])
+        self.write([a, b])
+        changes = database.refresh()
+        self.assertEqual([], changes.removed)
+        self.assertEqual([b], changes.added)
+
+    def test_refresh_complements(self):
+        a = CompileCommand(self.srcdir, 'a.cpp', ['clang++', '-DA=1'])
+        b = CompileCommand(self.srcdir, 'b.cpp', ['clang++', '-DB=1'])
+        self.write([a, b])
+        for _ in self.make_database(Complementer()).update_complements():
+            pass
+        database = self.make_database(Complementer())
+        a_hpp = os.path.join(self.srcdir, 'a.hpp')
+        self.assertEqual(['clang++', '-DA=1', '-c', 'a.hpp'],
+                         next(database.get_compile_commands(a_hpp)).arguments)
+
+        a2 = CompileCommand(self.srcdir, 'a.cpp', ['clang++', '-DA=2'])
+        self.write([a2, b])
+        changes = database.refresh()
+        self.assertEqual([a2], changes.added[:1])
+        # the headers of a.cpp
+        self.assertEqual(
+            set(
+                os.path.join(self.srcdir, f)
+                for f in ['a.cpp', 'a.hpp', 'a_private.hpp']), changes.files)
+        self.assertEqual(['clang++', '-DA=2', '-c', 'a.hpp'],
+                         next(database.get_compile_commands(a_hpp)).arguments)
+        self.assertFalse(database.refresh())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import unittest
+
+from compdb.backend.memory import InMemoryCompilationDatabase
+from compdb.dirindex import (IncludeDirectoryIndex, PathTrie)
+from compdb.models import CompileCommand
+
+
+class PathTrieTest(unittest.TestCase):
+    def test_iter_prefixes(self):
+        trie = PathTrie()
+        trie.add('/a', 1)
+        trie.add('/a/b/', 2)
+        trie.add('/a/b/c/../', 3)
+        trie.add('/a/bc', 4)
+        self.assertEqual([(1, {1}), (2, {2, 3})],
+                         list(trie.iter_prefixes('/a/b/foo.h')))
+        self.assertEqual([(1, {1})], list(trie.iter_prefixes('/a/foo.h')))
+        self.assertEqual([], list(trie.iter_prefixes('/b/foo.h')))
+
+
+class IncludeDirectoryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.a = CompileCommand('/build', '/src/a/a.cpp',
+                                ['clang++', '-I/src/include'])
+        self.b = CompileCommand('/build', '/src/b/b.cpp',
+                                ['clang++', '-I', '/src/include',
+                                 '-isystem', '../src/include/b'])
+        self.c = CompileCommand('/build', '/src/c/c.cpp', ['clang++'])
+        self.index = IncludeDirectoryIndex(
+            InMemoryCompilationDatabase([self.a, self.b, self.c]))
+
+    def test_get_candidates(self):
+        self.assertEqual([self.a, self.b],
+                         self.index.get_candidates('/src/include/a/a.h'))
+        self.assertEqual([self.a, self.b],
+                         self.index.get_candidates('/src/include/b/b.h'))
+        self.assertEqual([self.c],
+                         self.index.get_candidates('/src/c/c.h'))
+        self.assertEqual([], self.index.get_candidates('/src/d/d.h'))
+
+    def test_get_best(self):
+        self.assertEqual(self.a, self.index.get_best('/src/include/a.h'))
+        self.assertEqual(self.b, self.index.get_best('/src/include/b/foo.h'))
+        self.assertEqual(self.c, self.index.get_best('/src/c/c_private.h'))
+        self.assertIsNone(self.index.get_best('/src/d/d.h'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 from __future__ import print_function, unicode_literals, absolute_import
 
+import json
 import unittest
 
 try:
@@ -8,6 +9,7 @@ except ImportError:
     from io import StringIO
 
 from compdb.backend.json import (
+    JSONLinesCompileCommandSerializer,
     arguments_to_json,
     compile_commands_to_json,
 )
@@ -70,6 +72,16 @@ class ToJSON(unittest.TestCase):
         compile_commands_to_json(COMPILE_COMMANDS_TO_JSON_DATA[0], output)
         self.assertEqual(COMPILE_COMMANDS_TO_JSON_DATA[1], output.getvalue())
 
+    def test_compile_commands_to_json_lines(self):
+        output = StringIO()
+        with JSONLinesCompileCommandSerializer(output) as serializer:
+            for compile_command in COMPILE_COMMANDS_TO_JSON_DATA[0]:
+                serializer.serialize(compile_command)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(
+            json.loads(COMPILE_COMMANDS_TO_JSON_DATA[1]),
+            [json.loads(line) for line in lines])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,126 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import fnmatch
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from compdb.filelist import (FileScanner, GitIndexScanner,
+                             compile_suppressions, read_suppressions_file)
+from compdb.filesystem import InMemoryFileSystem
+
+
+def _has_git():
+    try:
+        subprocess.check_output(['git', '--version'])
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+class SuppressionsTest(unittest.TestCase):
+    def test_compile_suppressions(self):
+        patterns = ['foo/*', 'bar.h', 'cm*VS*.h', 'b[a-c]z/?.h', 'x[!y].h']
+        regex = compile_suppressions(patterns)
+        for path in [
+                '/src/foo/a.h', '/src/foo/b/c.h', '/src/bar.h', '/bar.h',
+                '/src/xbar.h', '/src/cmVS10.h', '/src/cmAVSB.h.h',
+                '/src/baz/a.h', '/src/bdz/a.h', '/src/baz/ab.h', '/src/xz.h',
+                '/src/xy.h'
+        ]:
+            expected = any(
+                fnmatch.fnmatchcase(path, '*/' + p) for p in patterns)
+            self.assertEqual(expected, bool(regex.match(path)), path)
+        self.assertIsNone(compile_suppressions([]))
+
+    def test_read_suppressions_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'suppressions.txt')
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write('# generated files\n'
+                    'build/*\n'
+                    '\n'
+                    '   \n'
+                    'config.h  # from configure\n'
+                    'caf\u00e9.h\t\n')
+        self.assertEqual(['build/*', 'config.h', 'caf\u00e9.h'],
+                         read_suppressions_file(path))
+
+
+class FileScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.fs = InMemoryFileSystem({
+            '/src/a.cpp': b'',
+            '/src/a.h': b'',
+            '/src/README': b'',
+            '/src/lib/b.hpp': b'',
+            '/src/lib/b.cpp': b'',
+            '/src/tests/c.h': b'',
+            '/src/tests/d/d.h': b'',
+            '/src/tests/d/e/e.h': b'',
+        })
+
+    def scan(self, jobs=1):
+        scanner = FileScanner(self.fs)
+        scanner.jobs = jobs
+        scanner.enable_group('header')
+        scanner.add_suppressions(['tests/*', 'lib/b.hpp'])
+        return list(scanner.scan('/src'))
+
+    def test_scan(self):
+        self.assertEqual(['/src/a.h'], self.scan())
+        # the suppressed directory is not descended
+        self.assertEqual(2, self.fs.calls['listdir'])
+
+    def test_scan_parallel(self):
+        self.assertEqual(self.scan(), self.scan(jobs=4))
+
+
+@unittest.skipUnless(_has_git(), 'requires git')
+class GitIndexScannerTest(unittest.TestCase):
+    LONG_NAME = 'lib/' + 'long' * 20 + '.h'
+    FILES = [
+        'a.cpp', 'a.h', 'README', 'lib/b.hpp', 'lib/b.cpp', LONG_NAME,
+        'tests/c.h', 'tests/d/d.h', 'utf-8-\u00e1.h', 'untracked.h'
+    ]
+
+    def setUp(self):
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        for path in self.FILES:
+            path = os.path.join(self.tmpdir, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+        self.git('init', '-q')
+        self.git('add', '--', *[f for f in self.FILES if f != 'untracked.h'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def git(self, *args):
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                ['git'] + list(args), cwd=self.tmpdir, stdout=devnull)
+
+    def scan(self, path):
+        scanner = GitIndexScanner()
+        scanner.enable_group('header')
+        scanner.add_suppressions(['tests/*', 'lib/b.hpp'])
+        return sorted(
+            os.path.relpath(p, self.tmpdir) for p in scanner.scan(path))
+
+    def test_scan(self):
+        expected = ['a.h', self.LONG_NAME, 'utf-8-\u00e1.h']
+        for version in ['2', '3', '4']:
+            self.git('update-index', '--index-version', version)
+            self.assertEqual(expected, self.scan(self.tmpdir))
+        self.assertEqual(expected[1:2],
+                         self.scan(os.path.join(self.tmpdir, 'lib')))
+
+
+if __name__ == "__main__":
+    unittest.main()
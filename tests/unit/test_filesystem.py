@@ -0,0 +1,103 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from compdb.backend.memory import InMemoryCompilationDatabase
+from compdb.complementer.headerdb import Complementer
+from compdb.filesystem import (InMemoryFileSystem, SnapshotFileSystem)
+from compdb.includedb import IncludeIndexBuilder
+from compdb.models import CompileCommand
+
+
+class SnapshotFileSystemTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmpdir, 'dir'))
+        open(os.path.join(self.tmpdir, 'dir', 'a.h'), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_queries(self):
+        fs = SnapshotFileSystem()
+        a = os.path.join(self.tmpdir, 'dir', 'a.h')
+        self.assertTrue(fs.isfile(a))
+        self.assertTrue(fs.exists(a))
+        self.assertFalse(fs.isdir(a))
+        self.assertTrue(fs.isdir(os.path.join(self.tmpdir, 'dir')))
+        self.assertTrue(fs.isdir(os.path.join(self.tmpdir, 'dir', '..')))
+        self.assertFalse(fs.exists(os.path.join(self.tmpdir, 'dir', 'b.h')))
+        self.assertFalse(fs.isfile(os.path.join(self.tmpdir, 'no', 'b.h')))
+        self.assertTrue(fs.isdir(os.sep))
+
+    def test_relative_path(self):
+        fs = SnapshotFileSystem()
+        cwd = os.getcwd()
+        os.chdir(os.path.join(self.tmpdir, 'dir'))
+        try:
+            self.assertTrue(fs.isfile('a.h'))
+            self.assertTrue(fs.isfile(os.path.join(os.curdir, 'a.h')))
+            self.assertIn('a.h', fs.listdir(os.curdir))
+        finally:
+            os.chdir(cwd)
+
+    def test_snapshot(self):
+        fs = SnapshotFileSystem()
+        b = os.path.join(self.tmpdir, 'dir', 'b.h')
+        self.assertFalse(fs.isfile(b))
+        open(b, 'w').close()
+        self.assertFalse(fs.isfile(b))
+        fs.invalidate(os.path.dirname(b))
+        self.assertTrue(fs.isfile(b))
+
+    def test_case(self):
+        # like os.path.isfile(), whether the file system is case-sensitive
+        # or not
+        fs = SnapshotFileSystem()
+        a = os.path.join(self.tmpdir, 'dir', 'A.h')
+        self.assertEqual(os.path.isfile(a), fs.isfile(a))
+        self.assertEqual(os.path.exists(a), fs.exists(a))
+        self.assertFalse(fs.isfile(os.path.join(self.tmpdir, 'dir', 'B.h')))
+
+    def test_pickle(self):
+        # e.g. sent to spawned worker processes, which take their own snapshot
+        fs = SnapshotFileSystem()
+        b = os.path.join(self.tmpdir, 'dir', 'b.h')
+        self.assertFalse(fs.isfile(b))
+        open(b, 'w').close()
+        self.assertTrue(pickle.loads(pickle.dumps(fs)).isfile(b))
+
+
+class InMemoryFileSystemTest(unittest.TestCase):
+    def setUp(self):
+        self.fs = InMemoryFileSystem({
+            '/src/a.cpp': b'#include "a.h"\n#include <b.h>\n',
+            '/src/a.h': b'#include "c.h"\n',
+            '/src/c.h': b'',
+            '/include/b.h': b'',
+        })
+        self.database = InMemoryCompilationDatabase([
+            CompileCommand('/src', 'a.cpp', ['clang++', '-I/include']),
+        ])
+
+    def test_headerdb(self):
+        layer = Complementer(self.fs).complement([[self.database]])
+        self.assertEqual(
+            ['/include/b.h', '/src/a.h', '/src/c.h'],
+            sorted(layer[0].get_all_files()))
+        self.assertEqual(4, self.fs.calls['read'])
+
+    def test_include_index(self):
+        included_by_database = IncludeIndexBuilder(self.fs).build(
+            self.database)
+        self.assertEqual(
+            ['/include/b.h', '/src/a.h', '/src/c.h'],
+            sorted(included_by_database.get_all_files()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,8 +7,11 @@ import os
 import unittest
 
 from compdb.backend.memory import InMemoryCompilationDatabase
+from compdb.filesystem import InMemoryFileSystem
 from compdb.complementer.headerdb import (
     Complementer,
+    IncludeCache,
+    make_headerdb,
     subword_split,
 )
 from compdb.models import CompileCommand
@@ -44,13 +47,13 @@ class HeaderDB(unittest.TestCase):
     def srcdir(self, dirname):
         return os.path.join(self.TEST_DIR, dirname)
 
-    def complement(self, compile_commands):
+    def complement(self, compile_commands, jobs=1):
         '''
         The output is returned sorted in the following order: file, directory,
         arguments.
         '''
         database = InMemoryCompilationDatabase(compile_commands)
-        result = list(Complementer().complement([[database]])[0]
+        result = list(Complementer().complement([[database]], jobs=jobs)[0]
                       .get_all_compile_commands())
         result.sort(key=operator.attrgetter('file', 'directory', 'arguments'))
         return result
@@ -205,6 +208,209 @@ class HeaderDB(unittest.TestCase):
         self.assertEqual(['clang++', '-DB=1', '-I.', '-c', 'quoted_a.hpp'],
                          result[1].arguments)
 
+    def test_parallel(self):
+        test_srcdir = self.srcdir('test_03')
+        compile_commands = [
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DAB=1'],
+                file='a_b.cpp'),
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DA=1'],
+                file='a.cpp'),
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DB=1'],
+                file='b.cpp'),
+        ]
+        self.assertEqual(
+            self.complement(compile_commands),
+            self.complement(compile_commands, jobs=2))
+        # tie-breaking, the first includer wins
+        test_srcdir = self.srcdir('test_07')
+        compile_commands = [
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DA=1', '-I.'],
+                file='a.cpp'),
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DB=1', '-I.'],
+                file='b.cpp'),
+        ]
+        self.assertEqual(
+            self.complement(compile_commands),
+            self.complement(compile_commands, jobs=2))
+
+    def test_include_cache(self):
+        test_srcdir = self.srcdir('test_03')
+        database = InMemoryCompilationDatabase([
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DAB=1'],
+                file='a_b.cpp'),
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DA=1'],
+                file='a.cpp'),
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DA=2'],
+                file='a.cpp'),
+            CompileCommand(
+                directory=test_srcdir,
+                arguments=['clang++', '-DB=1'],
+                file='b.cpp'),
+        ])
+        include_cache = IncludeCache()
+        make_headerdb([[database]], include_cache=include_cache)
+        # each file of the directory is read once
+        self.assertEqual(len(os.listdir(test_srcdir)), include_cache.reads)
+        reads, stats = include_cache.reads, include_cache.stats
+        make_headerdb([[database]], include_cache=include_cache)
+        self.assertEqual(reads, include_cache.reads)
+        self.assertEqual(stats, include_cache.stats)
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.fs = InMemoryFileSystem({
+            '/src/a.cpp': b'#include "a.hpp"\n#include "b.hpp"\n',
+            '/src/a.hpp': b'#include "a_private.hpp"\n',
+            '/src/a_private.hpp': b'',
+            '/src/b.cpp': b'#include "b.hpp"\n#include "a_private.hpp"\n',
+            '/src/b.hpp': b'',
+        })
+        self.compile_commands = [
+            CompileCommand('/src', 'a.cpp', ['clang++', '-DA=1']),
+            CompileCommand('/src', 'b.cpp', ['clang++', '-DB=1']),
+        ]
+
+    def complement(self, complementer):
+        database = InMemoryCompilationDatabase(self.compile_commands)
+        return list(
+            complementer.complement([[database]])[0]
+            .get_all_compile_commands())
+
+    def test_parallel_file_system(self):
+        # the worker processes use the file system of the complementer
+        database = InMemoryCompilationDatabase(self.compile_commands)
+        self.assertEqual(
+            self.complement(Complementer(self.fs)),
+            list(
+                Complementer(self.fs).complement([[database]], jobs=2)[0]
+                .get_all_compile_commands()))
+
+    def complement_from_state(self, state):
+        self.fs.calls.clear()
+        complementer = Complementer(self.fs)
+        complementer.restore_state(state)
+        return self.complement(complementer), complementer.get_state()
+
+    def test_unchanged(self):
+        complementer = Complementer(self.fs)
+        expected = self.complement(complementer)
+        result, _ = self.complement_from_state(complementer.get_state())
+        self.assertEqual(expected, result)
+        # the includes, the existence checks and the resolved headers
+        # are restored
+        self.assertNotIn('read', self.fs.calls)
+        self.assertNotIn('isfile', self.fs.calls)
+
+    def test_changes(self):
+        complementer = Complementer(self.fs)
+        self.complement(complementer)
+        state = complementer.get_state()
+
+        # only the modified file is read
+        self.fs.add_file('/src/b.cpp', b'#include "b.hpp"\n')
+        result, state = self.complement_from_state(state)
+        self.assertEqual(1, self.fs.calls['read'])
+        self.assertEqual(self.complement(Complementer(self.fs)), result)
+        self.assertEqual(['a.hpp', 'b.hpp', 'a_private.hpp'],
+                         [c.file for c in result])
+        self.assertEqual(['clang++', '-DB=1', '-c', 'b.hpp'],
+                         result[1].arguments)
+
+        # the derived compile commands follow their includer
+        self.compile_commands[1] = CompileCommand('/src', 'b.cpp',
+                                                  ['clang++', '-DB=2'])
+        result, state = self.complement_from_state(state)
+        self.assertNotIn('read', self.fs.calls)
+        self.assertEqual(self.complement(Complementer(self.fs)), result)
+        self.assertEqual(['clang++', '-DB=2', '-c', 'b.hpp'],
+                         result[1].arguments)
+
+        # a header becoming a database file
+        self.compile_commands.append(
+            CompileCommand('/src', 'a.hpp', ['clang++', '-DH=1']))
+        result, state = self.complement_from_state(state)
+        self.assertEqual(self.complement(Complementer(self.fs)), result)
+        # in discovery order, b.hpp is included by an earlier entry
+        self.assertEqual(['b.hpp', 'a_private.hpp'],
+                         [c.file for c in result])
+
+    def test_changed_databases(self):
+        databases = [[
+            InMemoryCompilationDatabase(self.compile_commands[:1]),
+            InMemoryCompilationDatabase(self.compile_commands[1:]),
+        ]]
+        complementer = Complementer(self.fs)
+        complementer.complement(databases)
+        self.assertIsNone(complementer.get_changed_databases())
+
+        # only the complement of b.cpp includes c.hpp
+        self.fs.add_file('/src/b.hpp', b'#include "c.hpp"\n')
+        self.fs.add_file('/src/c.hpp', b'')
+        complementer.complement(databases)
+        self.assertEqual([1], complementer.get_changed_databases())
+
+        self.fs.add_file('/src/b.hpp', b'#include "c.hpp"\n// comment\n')
+        complementer.complement(databases)
+        self.assertEqual([], complementer.get_changed_databases())
+
+
+class DiscoveryOrderTest(unittest.TestCase):
+    def setUp(self):
+        self.fs = InMemoryFileSystem({
+            '/src/a.cpp': b'#include "z.hpp"\n',
+            '/src/b.cpp': b'#include "y.hpp"\n',
+            '/src/c.cpp': b'#include "y.hpp"\n',
+            '/src/y.hpp': b'#include "common.hpp"\n',
+            '/src/z.hpp': b'#include "common.hpp"\n',
+            '/src/common.hpp': b'',
+        })
+        self.compile_commands = [
+            CompileCommand('/src', 'a.cpp', ['clang++', '-DA']),
+            CompileCommand('/src', 'b.cpp', ['clang++', '-DB']),
+        ]
+
+    def complement(self, complementer):
+        database = InMemoryCompilationDatabase(self.compile_commands)
+        return [(c.file, c.arguments[1])
+                for c in complementer.complement([[database]])[0]
+                .get_all_compile_commands()]
+
+    def test_ties(self):
+        complementer = Complementer(self.fs)
+        # the headers are derived in the order they are discovered,
+        # the first one discovered wins the ties of the next round
+        self.assertEqual([
+            ('z.hpp', '-DA'),
+            ('y.hpp', '-DB'),
+            ('common.hpp', '-DA'),
+        ], self.complement(complementer))
+        self.compile_commands.insert(
+            0, CompileCommand('/src', 'c.cpp', ['clang++', '-DC']))
+        expected = [
+            ('y.hpp', '-DC'),
+            ('z.hpp', '-DA'),
+            ('common.hpp', '-DC'),
+        ]
+        self.assertEqual(expected, self.complement(Complementer(self.fs)))
+        self.assertEqual(expected, self.complement(complementer))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,173 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import unittest
+
+import compdb.filesystem
+from compdb.backend.memory import InMemoryCompilationDatabase
+from compdb.filesystem import InMemoryFileSystem
+from compdb.includedb import (IncludedByDatabase, IncludedByReachability,
+                              IncludeIndexBuilder)
+from compdb.models import ChangeSet, CompileCommand
+
+# includee -> includers
+GRAPH = {
+    '/src/a.h': ['/src/a.cpp', '/src/b.h'],
+    '/src/b.h': ['/src/b.cpp', '/src/c.h'],
+    # include cycle
+    '/src/c.h': ['/src/b.h', '/src/c.cpp'],
+    '/src/d.h': ['/src/d.h'],
+}
+
+
+class IncludedByReachabilityTest(unittest.TestCase):
+    def setUp(self):
+        self.reachability = IncludedByReachability(
+            GRAPH, ['/src/a.cpp', '/src/b.cpp', '/src/c.cpp', '/src/e.cpp'])
+
+    def test_transitive(self):
+        self.assertEqual({'/src/a.cpp', '/src/b.cpp', '/src/c.cpp'},
+                         self.reachability.get_dependents(['/src/a.h']))
+
+    def test_cycle(self):
+        self.assertEqual({'/src/b.cpp', '/src/c.cpp'},
+                         self.reachability.get_dependents(['/src/b.h']))
+        self.assertEqual({'/src/b.cpp', '/src/c.cpp'},
+                         self.reachability.get_dependents(['/src/c.h']))
+        self.assertEqual(set(), self.reachability.get_dependents(['/src/d.h']))
+
+    def test_roots(self):
+        self.assertEqual({'/src/a.cpp', '/src/e.cpp'},
+                         self.reachability.get_dependents(
+                             ['/src/a.cpp', '/src/e.cpp']))
+
+    def test_unknown(self):
+        self.assertEqual(set(),
+                         self.reachability.get_dependents(['/src/x.h']))
+
+
+class IncludedByDatabaseTest(unittest.TestCase):
+    def test_get_dependent_compile_commands(self):
+        compile_commands = [
+            CompileCommand('/src', 'a.cpp', ['c++', '-DA', 'a.cpp']),
+            CompileCommand('/src', 'b.cpp', ['c++', 'b.cpp']),
+            CompileCommand('/src', 'a.cpp', ['c++', '-DA2', 'a.cpp']),
+            CompileCommand('/src', 'e.cpp', ['c++', 'e.cpp']),
+        ]
+        database = IncludedByDatabase(
+            GRAPH, InMemoryCompilationDatabase(compile_commands))
+        self.assertEqual(compile_commands[:3],
+                         list(
+                             database.get_dependent_compile_commands(
+                                 ['/src/a.h'])))
+
+
+class UpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.fs = InMemoryFileSystem({
+            '/src/a.cpp': b'#include "a.h"\n',
+            '/src/b.cpp': b'#include "b.h"\n',
+            '/src/a.h': b'#include <conf.h>\n',
+            '/src/b.h': b'#include "a.h"\n',
+            '/inc1/conf.h': b'#include "conf1.h"\n',
+            '/inc1/conf1.h': b'',
+            '/inc2/conf.h': b'',
+        })
+        self.compile_commands = [
+            CompileCommand('/src', 'a.cpp', ['c++', '-I/inc1', 'a.cpp']),
+            CompileCommand('/src', 'b.cpp', ['c++', '-I/inc1', 'b.cpp']),
+        ]
+
+    def build(self):
+        return IncludeIndexBuilder(self.fs).build(
+            InMemoryCompilationDatabase(list(self.compile_commands)))
+
+    def replace(self, database, i, new):
+        old = self.compile_commands[i]
+        self.compile_commands[i] = new
+        database.database.compile_commands[i] = new
+        database.update(ChangeSet(removed=[old], added=[new]), self.fs)
+
+    def assertSameAsBuild(self, database):
+        expected = self.build()
+        self.assertEqual(list(expected.graph.items()),
+                         list(database.graph.items()))
+        for path in expected.graph:
+            self.assertEqual(list(expected.get_compile_commands(path)),
+                             list(database.get_compile_commands(path)), path)
+
+    def test_headers_are_scanned_again(self):
+        database = self.build()
+        self.assertIn('/inc1/conf1.h', database.graph)
+        self.replace(database, 0,
+                     CompileCommand('/src', 'a.cpp',
+                                    ['c++', '-I/inc2', 'a.cpp']))
+        # a.h is still included by b.cpp, through b.h,
+        # but its includes are resolved with the new search paths
+        self.assertEqual({
+            '/src/a.h': ['/src/a.cpp', '/src/b.h'],
+            '/src/b.h': ['/src/b.cpp'],
+            '/inc2/conf.h': ['/src/a.h'],
+        }, database.graph)
+        self.assertSameAsBuild(database)
+
+    def test_includers_order(self):
+        self.fs.add_file('/src/c.cpp', b'#include "a.h"\n')
+        self.compile_commands.append(
+            CompileCommand('/src', 'c.cpp', ['c++', '-I/inc1', 'c.cpp']))
+        database = self.build()
+        # the first includer wins the ties
+        self.assertEqual(['/src/a.cpp', '/src/b.h', '/src/c.cpp'],
+                         database.graph['/src/a.h'])
+        self.replace(database, 0,
+                     CompileCommand('/src', 'a.cpp',
+                                    ['c++', '-I/inc1', '-DA', 'a.cpp']))
+        self.assertSameAsBuild(database)
+        self.compile_commands.insert(
+            0, CompileCommand('/src', 'c.cpp', ['c++', '-DC', 'c.cpp']))
+        database.database.compile_commands.insert(
+            0, self.compile_commands[0])
+        database.update(ChangeSet(added=[self.compile_commands[0]]), self.fs)
+        self.assertSameAsBuild(database)
+
+    def test_replay(self):
+        database = self.build()
+        reads = self.fs.calls['read']
+        self.replace(database, 1,
+                     CompileCommand('/src', 'b.cpp',
+                                    ['c++', '-I/inc1', '-DB', 'b.cpp']))
+        # the search paths did not change, nothing is read again
+        self.assertEqual(reads, self.fs.calls['read'])
+        self.assertSameAsBuild(database)
+
+
+class IncludeDirectoryFallbackTest(unittest.TestCase):
+    def setUp(self):
+        compdb.filesystem.set_default(
+            InMemoryFileSystem({
+                '/src/include/orphan.h': b'',
+                '/src/include/orphan.cpp': b'',
+            }))
+        self.compile_command = CompileCommand(
+            '/build', '/src/a.cpp', ['c++', '-I/src/include', '/src/a.cpp'])
+        self.database = IncludedByDatabase(
+            {}, InMemoryCompilationDatabase([self.compile_command]))
+
+    def tearDown(self):
+        compdb.filesystem.set_default(compdb.filesystem.RealFileSystem())
+
+    def test_existing_header(self):
+        compile_command, = self.database.get_compile_commands(
+            '/src/include/orphan.h')
+        self.assertEqual('/src/include/orphan.h', compile_command.file)
+
+    def test_unknown_paths(self):
+        for path in [
+                '/src/include/missing.h', '/src/include/missing.cpp',
+                '/src/include/orphan.cpp'
+        ]:
+            self.assertEqual([],
+                             list(self.database.get_compile_commands(path)))
+
+
+if __name__ == "__main__":
+    unittest.main()
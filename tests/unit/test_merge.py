@@ -0,0 +1,104 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from compdb.backend.json import JSONCompilationDatabase
+from compdb.core import CompilationDatabase
+from compdb.merge import merge_compile_commands
+from compdb.models import CompileCommand
+
+
+def _cc(filename, *flags):
+    return CompileCommand('/build', filename, ['cc'] + list(flags))
+
+
+class MergeCompileCommandsTest(unittest.TestCase):
+    def setUp(self):
+        self.compile_commands = [
+            _cc('a.c'),
+            _cc('b.c', '-DB'),
+            _cc('./a.c', '-DA', '-O2'),
+            _cc('c.c'),
+            _cc('a.c', '-DX'),
+        ]
+
+    def merge(self, policy):
+        return [(cc.file, cc.arguments) for cc in merge_compile_commands(
+            iter(self.compile_commands), policy)]
+
+    def test_first(self):
+        self.assertEqual([
+            ('a.c', ['cc']),
+            ('b.c', ['cc', '-DB']),
+            ('c.c', ['cc']),
+        ], self.merge('first'))
+
+    def test_last(self):
+        self.assertEqual([
+            ('a.c', ['cc', '-DX']),
+            ('b.c', ['cc', '-DB']),
+            ('c.c', ['cc']),
+        ], self.merge('last'))
+
+    def test_most_flags(self):
+        self.assertEqual([
+            ('./a.c', ['cc', '-DA', '-O2']),
+            ('b.c', ['cc', '-DB']),
+            ('c.c', ['cc']),
+        ], self.merge('most-flags'))
+
+    def test_input_unchanged(self):
+        compile_commands = [CompileCommand('/build/.', 'a.c', ['cc'])]
+        merged = list(merge_compile_commands(iter(compile_commands), 'last'))
+        self.assertEqual(compile_commands, merged)
+        self.assertIsNot(compile_commands[0], merged[0])
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            list(merge_compile_commands([], 'random'))
+
+
+class StreamCompileCommandsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='compdb-test-merge-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_build_dir(self, name, filenames):
+        build_dir = os.path.join(self.tmpdir, name)
+        os.mkdir(build_dir)
+        with io.open(os.path.join(build_dir, 'compile_commands.json'),
+                     'w',
+                     encoding='utf-8') as f:
+            f.write(
+                json.dumps([{
+                    'directory': build_dir,
+                    'file': filename,
+                    'arguments': ['cc', '-c', filename],
+                } for filename in filenames]))
+        return build_dir
+
+    def test_unload(self):
+        database = CompilationDatabase()
+        database.register_backend(JSONCompilationDatabase)
+        database.add_directories([
+            self.make_build_dir('build1', ['a.c', 'b.c']),
+            self.make_build_dir('build2', ['c.c']),
+        ])
+        databases = database._layers[0]
+        stream = database.stream_compile_commands()
+        self.assertEqual('a.c', next(stream).file)
+        self.assertIsNotNone(databases[0]._JSONCompilationDatabase__data)
+        self.assertEqual(['b.c', 'c.c'], [cc.file for cc in stream])
+        for db in databases:
+            self.assertIsNone(db._JSONCompilationDatabase__data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import compdb.profiling
+from compdb.backend.memory import InMemoryCompilationDatabase
+from compdb.filesystem import InMemoryFileSystem
+from compdb.includedb import IncludeIndexBuilder
+from compdb.models import CompileCommand
+from compdb.profiling import (MemoryProfiler, Profiler, ProfilerGroup)
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.profiler = Profiler()
+        compdb.profiling.set_profiler(self.profiler)
+
+    def tearDown(self):
+        compdb.profiling.set_profiler(None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_disabled(self):
+        compdb.profiling.set_profiler(None)
+        with compdb.profiling.phase('probe'):
+            pass
+        self.assertEqual([], self.profiler.events)
+
+    def test_phases(self):
+        fs = InMemoryFileSystem({
+            '/src/a.cpp': b'#include "a.h"\n',
+            '/src/a.h': b'',
+        })
+        database = InMemoryCompilationDatabase(
+            [CompileCommand('/src', 'a.cpp', ['clang++'])])
+        with compdb.profiling.phase('list'):
+            list(IncludeIndexBuilder(fs).build(database)
+                 .get_all_compile_commands())
+        summary = {row[0]: row[1] for row in self.profiler.summary()}
+        self.assertEqual({
+            'list': 1,
+            'include index build': 1,
+            'include scanning': 2,
+            'header resolution': 1,
+            'best-includer selection': 1,
+        }, summary)
+        self.assertIn('include scanning', self.profiler.format_summary())
+        # the fine phases are aggregated
+        self.assertEqual(['include index build', 'list'],
+                         [event[0] for event in self.profiler.events])
+        self.assertEqual(2, self.profiler.totals['include scanning'][0])
+
+    def test_chrome_trace(self):
+        with compdb.profiling.phase('outer'):
+            with compdb.profiling.phase('inner'):
+                pass
+        path = os.path.join(self.tmpdir, 'trace.json')
+        self.profiler.write_chrome_trace(path)
+        with open(path, 'rb') as f:
+            trace = json.loads(f.read().decode('utf-8'))
+        inner, outer = trace['traceEvents']
+        self.assertEqual('inner', inner['name'])
+        self.assertEqual('X', outer['ph'])
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'],
+                                inner['ts'] + inner['dur'])
+        self.assertIn('cpu_ms', inner['args'])
+
+    def test_chrome_trace_fine_phases(self):
+        for _ in range(3):
+            with compdb.profiling.phase('include scanning'):
+                pass
+        trace = self.profiler.to_chrome_trace()
+        self.assertEqual([], trace['traceEvents'])
+        self.assertEqual(3, trace['otherData']['include scanning']['count'])
+
+
+@unittest.skipIf(sys.version_info < (3, 4), 'tracemalloc requires 3.4')
+class MemoryProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.profiler = MemoryProfiler(['json load'], top_count=3)
+        self.profiler.start()
+        compdb.profiling.set_profiler(
+            ProfilerGroup([Profiler(), self.profiler]))
+
+    def tearDown(self):
+        compdb.profiling.set_profiler(None)
+        self.profiler.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_phases(self):
+        with compdb.profiling.phase('json load'):
+            retained = [bytearray(1024) for _ in range(1024)]
+            # the temporary allocation is part of the peak only
+            temporary = bytearray(4 * 1024 * 1024)
+            del temporary
+        # the fine phases are ignored
+        with compdb.profiling.phase('serialization'):
+            pass
+        record, = self.profiler.records
+        self.assertEqual('json load', record['name'])
+        self.assertGreaterEqual(record['retained'], 1024 * 1024)
+        self.assertLess(record['retained'], 2 * 1024 * 1024)
+        self.assertGreaterEqual(record['traced_peak'] - record['traced_start'],
+                                5 * 1024 * 1024)
+        self.assertEqual(__file__.rstrip('c'), record['top'][0]['file'])
+        path = os.path.join(self.tmpdir, 'memory.json')
+        self.profiler.write_json(path)
+        with open(path, 'rb') as f:
+            data = json.loads(f.read().decode('utf-8'))
+        self.assertEqual(['json load'], [p['name'] for p in data['phases']])
+        self.assertIn('json load', self.profiler.format_summary())
+        del retained
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import io
+import unittest
+
+import compdb.progress
+from compdb.backend.memory import InMemoryCompilationDatabase
+from compdb.complementer.headerdb import Complementer
+from compdb.filesystem import InMemoryFileSystem
+from compdb.includedb import (BackgroundIncludeIndexBuilder,
+                              IncludeIndexBuilder)
+from compdb.models import CompileCommand
+from compdb.progress import (ProgressEvent, StderrRenderer, format_event)
+
+
+class ProgressTest(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        compdb.progress.set_listener(self.events.append)
+        self.fs = InMemoryFileSystem({
+            '/src/a.cpp': b'#include "a.h"\n',
+            '/src/b.cpp': b'#include "a.h"\n',
+            '/src/a.h': b'#include "c.h"\n',
+            '/src/c.h': b'',
+        })
+        self.database = InMemoryCompilationDatabase([
+            CompileCommand('/src', 'a.cpp', ['clang++']),
+            CompileCommand('/src', 'b.cpp', ['clang++']),
+        ])
+
+    def tearDown(self):
+        compdb.progress.set_listener(None)
+
+    def summary(self):
+        return [(e.kind, e.task, e.done, e.total) for e in self.events]
+
+    def test_disabled(self):
+        compdb.progress.set_listener(None)
+        IncludeIndexBuilder(self.fs).build(self.database)
+        items = [1, 2]
+        self.assertIs(items, compdb.progress.task('x').iterate(items))
+        self.assertEqual([], self.events)
+
+    def test_include_scanning(self):
+        IncludeIndexBuilder(self.fs).build(self.database)
+        self.assertEqual([
+            ('begin', 'include scanning', 0, 2),
+            ('update', 'include scanning', 1, 2),
+            ('update', 'include scanning', 2, 2),
+            ('end', 'include scanning', 2, 2),
+        ], self.summary())
+
+    def test_background_include_scanning(self):
+        builder = BackgroundIncludeIndexBuilder(self.database, self.fs)
+        for compile_command in self.database.get_all_compile_commands():
+            builder.feed(compile_command)
+        builder.close()
+        builder.result()
+        self.assertEqual(('end', 'include scanning', 2, 2),
+                         self.summary()[-1])
+        self.assertIsNotNone(self.events[-1].queued)
+
+    def test_headerdb_rounds(self):
+        Complementer(self.fs).complement([[self.database]])
+        self.assertEqual([
+            ('end', 'headerdb round 1', 2, 2),
+            ('end', 'headerdb round 2', 1, 1),
+            ('end', 'headerdb round 3', 1, 1),
+        ], [s for s in self.summary() if s[0] == 'end'])
+
+
+class FormatTest(unittest.TestCase):
+    def test_eta(self):
+        event = ProgressEvent('update', 'scan', 100, 400, 7, 2.0)
+        self.assertEqual(50, event.throughput)
+        self.assertEqual(6, event.eta)
+        self.assertEqual('scan: 100/400 files, 50/s, queue 7, ETA 6s',
+                         format_event(event))
+        event = ProgressEvent('update', 'scan', 100, None, None, 0)
+        self.assertIsNone(event.eta)
+        self.assertEqual('scan: 100 files', format_event(event))
+
+    def test_renderer(self):
+        stream = io.StringIO()
+        renderer = StderrRenderer(stream, interval=3600)
+        renderer(ProgressEvent('begin', 'scan', 0, 2, None, 0))
+        renderer(ProgressEvent('update', 'scan', 1, 2, None, 1))
+        renderer(ProgressEvent('end', 'scan', 2, 2, None, 2))
+        lines = [s for s in stream.getvalue().split('\r') if s.strip()]
+        # the update is throttled
+        self.assertEqual(['scan: 0/2 files'], lines)
+        self.assertTrue(stream.getvalue().endswith('\r' + ' ' * 15 + '\r'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import compdb.filesystem
+from compdb.complementer.headerdb import extract_include_dirs
+from compdb.filesystem import InMemoryFileSystem
+from compdb.models import CompileCommand
+from compdb.responsefile import (ResponseFileWriter, clear_cache,
+                                 expand_arguments, iter_blocks,
+                                 quote_argument, revalidate,
+                                 split_arguments)
+
+FLAGS = ['-DFOO', '-I/usr/include/foo', '-Wall', '-O2', '-c']
+
+
+class SplitArgumentsTest(unittest.TestCase):
+    def test_split(self):
+        compile_command = CompileCommand(
+            '/build', '../src/a.cpp',
+            ['c++', '-DFOO', '-o', 'a.o', '-MFa.d', '-c', '/src/a.cpp'])
+        self.assertEqual(('c++', ['-DFOO', '-c'],
+                          ['-o', 'a.o', '-MFa.d', '/src/a.cpp']),
+                         split_arguments(compile_command))
+
+    def test_iter_blocks(self):
+        flags = [
+            '-DFOO', '-U', 'BAR', '-Iinclude', '-isystem', '/usr/include/foo',
+            '-Wall', '-O2', '-I'
+        ]
+        self.assertEqual([
+            ('define', ['-DFOO', '-U', 'BAR']),
+            ('include', ['-Iinclude', '-isystem', '/usr/include/foo']),
+            (None, ['-Wall', '-O2']),
+            ('include', ['-I']),
+        ], list(iter_blocks(flags)))
+
+    def test_quote_argument(self):
+        self.assertEqual('-DFOO', quote_argument('-DFOO'))
+        self.assertEqual('""', quote_argument(''))
+        self.assertEqual(r'"-DFOO=\"a b\""', quote_argument('-DFOO="a b"'))
+        self.assertEqual(r'"C:\\foo"', quote_argument('C:\\foo'))
+
+
+class ResponseFileWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='compdb-test-responsefile-')
+        self.writer = ResponseFileWriter(os.path.join(self.tmpdir, 'flags'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def factor(self, filename, flags):
+        return self.writer.factor(
+            CompileCommand('/build', filename,
+                           ['c++'] + flags + ['-o', filename + '.o', filename],
+                           filename + '.o'))
+
+    def test_shared_flags(self):
+        a = self.factor('a.cpp', FLAGS)
+        b = self.factor('b.cpp', FLAGS)
+        self.assertEqual(1, self.writer.response_file_count)
+        self.assertEqual('c++', a.arguments[0])
+        self.assertTrue(a.arguments[1].startswith('@'))
+        self.assertEqual(['-o', 'a.cpp.o', 'a.cpp'], a.arguments[2:])
+        self.assertEqual('a.cpp.o', a.output)
+        self.assertEqual(a.arguments[1], b.arguments[1])
+        path = a.arguments[1][1:]
+        self.assertEqual(
+            os.path.join(self.tmpdir, 'flags'), os.path.dirname(path))
+        self.assertTrue(
+            re.match(r'^flags-[0-9a-f]{16}\.rsp$', os.path.basename(path)))
+        with io.open(path, encoding='utf-8') as f:
+            self.assertEqual(FLAGS, f.read().splitlines())
+
+    def test_distinct_flags(self):
+        a = self.factor('a.cpp', FLAGS)
+        b = self.factor('b.cpp', FLAGS + ['-DBAR'])
+        self.assertNotEqual(a.arguments[1], b.arguments[1])
+        self.assertEqual(2, self.writer.response_file_count)
+
+    def test_shared_blocks(self):
+        includes = ['-I/src/include/lib{}'.format(i) for i in range(6)]
+        defines = ['-DFEATURE_{}=1'.format(i) for i in range(5)]
+        a = self.factor('a.cpp', ['-Wall'] + includes + defines + ['-O2'])
+        # differs by one flag
+        b = self.factor('b.cpp', ['-Wall'] + includes + defines + ['-O0'])
+        # the 2 blocks, and the flags of each compile command
+        self.assertEqual(4, self.writer.response_file_count)
+        self.assertNotEqual(a.arguments[1], b.arguments[1])
+        with io.open(a.arguments[1][1:], encoding='utf-8') as f:
+            a_flags = f.read().splitlines()
+        with io.open(b.arguments[1][1:], encoding='utf-8') as f:
+            b_flags = f.read().splitlines()
+        self.assertEqual(['-Wall', '-O2'], a_flags[:1] + a_flags[3:])
+        self.assertEqual(a_flags[1:3], b_flags[1:3])
+        with io.open(a_flags[1][1:], encoding='utf-8') as f:
+            self.assertEqual(includes, f.read().splitlines())
+        self.assertEqual(['c++', '-Wall'] + includes + defines +
+                         ['-O2', '-o', 'a.cpp.o', 'a.cpp'],
+                         expand_arguments(a.arguments, a.directory))
+
+    def test_few_flags_inline(self):
+        compile_command = self.factor('a.cpp', ['-c'])
+        self.assertEqual(['c++', '-c', '-o', 'a.cpp.o', 'a.cpp'],
+                         compile_command.arguments)
+        self.assertEqual(0, self.writer.response_file_count)
+
+
+class ExpandArgumentsTest(unittest.TestCase):
+    def setUp(self):
+        self.fs = InMemoryFileSystem({
+            '/build/flags.rsp': b'-DFOO "-DBAR=a b"\n@nested/more.rsp\n',
+            '/build/nested/more.rsp': b'-Iinclude',
+            '/build/loop.rsp': b'-DLOOP @loop.rsp',
+            '/build/utf16.rsp': '-DWIDE'.encode('utf-16'),
+        })
+        compdb.filesystem.set_default(self.fs)
+        clear_cache()
+
+    def tearDown(self):
+        compdb.filesystem.set_default(compdb.filesystem.RealFileSystem())
+        clear_cache()
+
+    def test_expand(self):
+        self.assertEqual(
+            ['cc', '-DFOO', '-DBAR=a b', '-Iinclude', '-c', 'a.c'],
+            expand_arguments(['cc', '@flags.rsp', '-c', 'a.c'], '/build'))
+
+    def test_read_once(self):
+        expand_arguments(['cc', '@flags.rsp'], '/build')
+        expand_arguments(['cc', '@/build/flags.rsp'], '/src')
+        self.assertEqual(2, self.fs.calls['read'])
+
+    def test_changed_file(self):
+        compile_command = CompileCommand('/build', 'a.c',
+                                         ['cc', '@flags.rsp', '-c', 'a.c'])
+        expanded = compile_command.expanded_arguments
+        self.assertIs(expanded, compile_command.expanded_arguments)
+        self.fs.add_file('/build/nested/more.rsp', b'-Iother')
+        revalidate()
+        self.assertEqual(['cc', '-DFOO', '-DBAR=a b', '-Iother', '-c', 'a.c'],
+                         compile_command.expanded_arguments)
+        self.assertEqual(4, self.fs.calls['read'])
+
+    def test_missing_file(self):
+        self.assertEqual(['cc', '@missing.rsp', '@'],
+                         expand_arguments(['cc', '@missing.rsp', '@'],
+                                          '/build'))
+
+    def test_recursion(self):
+        self.assertEqual(['cc', '-DLOOP', '@loop.rsp'],
+                         expand_arguments(['cc', '@loop.rsp'], '/build'))
+
+    def test_utf16(self):
+        self.assertEqual(['cl', '-DWIDE'],
+                         expand_arguments(['cl', '@utf16.rsp'], '/build'))
+
+    def test_include_dirs(self):
+        compile_command = CompileCommand('/build', 'a.c',
+                                         ['cc', '@flags.rsp', '-c', 'a.c'])
+        self.assertEqual(['/build/include'],
+                         list(extract_include_dirs(compile_command)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from compdb.filesystem import InMemoryFileSystem
+from compdb.models import CompileCommand
+from compdb.runner import (ResultCache, RunHistory, ToolRunner,
+                           ideal_makespan, schedule, substitute,
+                           write_job_output)
+
+
+class SubstituteTest(unittest.TestCase):
+    def test_placeholders(self):
+        compile_command = CompileCommand('/build', '../src/a.cpp',
+                                         ['clang++', '-c', '../src/a.cpp'],
+                                         'a.o')
+        self.assertEqual([
+            'tool', '/src/a.cpp', '--dir=/build', '-o', 'a.o.out', '--',
+            'clang++', '-c', '../src/a.cpp', '{Checks: "*"}'
+        ],
+                         substitute([
+                             'tool', '{file}', '--dir={directory}', '-o',
+                             '{output}.out', '--', '{arguments}',
+                             '{Checks: "*"}'
+                         ], compile_command))
+
+
+class ToolRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_compile_commands(self, count):
+        return [
+            CompileCommand(self.tmpdir, 'f{}.cpp'.format(i), ['cc'])
+            for i in range(count)
+        ]
+
+    def test_run(self):
+        # each job writes its file to stdout, some fail
+        template = [
+            sys.executable, '-c', 'import sys; print(sys.argv[1]); '
+            'sys.exit(sys.argv[1].endswith("3.cpp"))', '{file}'
+        ]
+        runner = ToolRunner(template, jobs=4)
+        jobs = list(runner.run(
+            runner.make_jobs(self.make_compile_commands(8))))
+        self.assertEqual(8, len(jobs))
+        for job in jobs:
+            self.assertEqual(job.compile_command.normfile,
+                             job.stdout.decode('utf-8').strip())
+        self.assertEqual([os.path.join(self.tmpdir, 'f3.cpp')], [
+            job.compile_command.normfile for job in jobs if job.returncode
+        ])
+
+    def test_working_directory(self):
+        build_dir = os.path.join(self.tmpdir, 'sub', 'build')
+        os.makedirs(build_dir)
+        with io.open(os.path.join(self.tmpdir, 'sub', 'a.cpp'), 'wb') as f:
+            f.write(b'int a;')
+        compile_command = CompileCommand(build_dir, '../a.cpp',
+                                         ['cc', '-c', '../a.cpp'])
+        # the tool reads the relative path of the compile command
+        runner = ToolRunner([
+            sys.executable, '-c',
+            'import sys; sys.stdout.write(open(sys.argv[-1]).read())',
+            '{arguments}'
+        ])
+        job, = runner.run(runner.make_jobs([compile_command]))
+        self.assertEqual(0, job.returncode, job.stderr)
+        self.assertEqual(b'int a;', job.stdout)
+
+    def test_interrupt_kills_tools(self):
+        template = [
+            sys.executable, '-c', 'import sys, time; '
+            'time.sleep(0 if sys.argv[1].endswith("f0.cpp") else 60)',
+            '{file}'
+        ]
+        runner = ToolRunner(template, jobs=4)
+        start = time.time()
+        results = runner.run(runner.make_jobs(self.make_compile_commands(4)))
+        first = next(results)
+        self.assertEqual(0, first.returncode)
+        results.close()
+        self.assertLess(time.time() - start, 30)
+        self.assertEqual(set(), runner._processes)
+
+    def test_missing_tool(self):
+        runner = ToolRunner(['/nonexistent/compdb-tool', '{file}'])
+        job, = runner.run(runner.make_jobs(self.make_compile_commands(1)))
+        self.assertEqual(127, job.returncode)
+        self.assertIn(b'/nonexistent/compdb-tool', job.stderr)
+
+    def test_write_job_output(self):
+        runner = ToolRunner([sys.executable, '-c', 'print("out")'])
+        job, = runner.run(runner.make_jobs(self.make_compile_commands(1)))
+        stdout = io.BytesIO()
+        stderr = io.BytesIO()
+        write_job_output(job, stdout, stderr)
+        self.assertEqual(b'out', stdout.getvalue().strip())
+        self.assertEqual(b'', stderr.getvalue())
+
+
+class ScheduleTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_jobs(self, names):
+        runner = ToolRunner(['tool', '{file}'])
+        return runner.make_jobs([
+            CompileCommand('/build', '{}.cpp'.format(name), ['cc'])
+            for name in names
+        ])
+
+    def test_longest_first(self):
+        jobs = self.make_jobs(['a', 'b', 'c', 'd'])
+        history = RunHistory()
+        history.record(jobs[0].key, 1.0)
+        history.record(jobs[1].key, 4.0)
+        sizes = {'/build/a.cpp': 10, '/build/b.cpp': 20, '/build/c.cpp': 5,
+                 '/build/d.cpp': 60}
+
+        def cost(compile_command):
+            return sizes[compile_command.normfile]
+
+        # 5 seconds for 30 bytes, d estimated to 10s, c to 0.83s
+        self.assertEqual(['d', 'b', 'a', 'c'], [
+            os.path.basename(job.compile_command.file)[0]
+            for job in schedule(jobs, history, cost)
+        ])
+
+    def test_history_roundtrip(self):
+        path = os.path.join(self.tmpdir, 'history.json')
+        jobs = self.make_jobs(['a'])
+        history = RunHistory(path)
+        self.assertIsNone(history.get(jobs[0].key))
+        history.record(jobs[0].key, 2.5)
+        history.save()
+        self.assertEqual(2.5, RunHistory(path).get(jobs[0].key))
+        self.assertEqual(['history.json'], os.listdir(self.tmpdir))
+
+    def test_key(self):
+        a1, a2 = self.make_jobs(['a', 'a'])
+        b, = self.make_jobs(['b'])
+        self.assertEqual(a1.key, a2.key)
+        self.assertNotEqual(a1.key, b.key)
+
+    def test_ideal_makespan(self):
+        self.assertEqual(0.0, ideal_makespan([], 4))
+        self.assertEqual(5.0, ideal_makespan([5.0, 1.0, 1.0], 4))
+        self.assertEqual(3.0, ideal_makespan([2.0, 2.0, 2.0], 2))
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fs = InMemoryFileSystem({
+            '/src/a.cpp': b'#include "a.h"\n',
+            '/src/a.h': b'#include "b.h"\n',
+            '/src/b.h': b'',
+        })
+        self.graph = {'/src/a.h': ['/src/a.cpp'], '/src/b.h': ['/src/a.h']}
+        self.template = ['tool', '{file}']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_cache(self):
+        return ResultCache(self.tmpdir, self.template, self.graph, self.fs)
+
+    def make_job(self, arguments):
+        runner = ToolRunner(self.template)
+        job, = runner.make_jobs(
+            [CompileCommand('/src', 'a.cpp', arguments)])
+        return job
+
+    def test_replay(self):
+        job = self.make_job(['cc', '-c', 'a.cpp', '-o', 'a.o'])
+        job.returncode = 2
+        job.stdout = b'out\xff'
+        job.stderr = b'err'
+        cache = self.make_cache()
+        self.assertFalse(cache.get(self.make_job(['cc', 'a.cpp'])))
+        cache.put(job)
+
+        # the output is not part of the key
+        replayed = self.make_job(['cc', '-c', 'a.cpp', '-o', 'b.o'])
+        self.assertTrue(self.make_cache().get(replayed))
+        self.assertTrue(replayed.cached)
+        self.assertEqual(2, replayed.returncode)
+        self.assertEqual(b'out\xff', replayed.stdout)
+        self.assertEqual(b'err', replayed.stderr)
+        self.assertFalse(self.make_cache().get(
+            self.make_job(['cc', '-DFOO', 'a.cpp'])))
+
+    def test_include_closure(self):
+        job = self.make_job(['cc', 'a.cpp'])
+        job.returncode = 0
+        self.make_cache().put(job)
+        self.fs.add_file('/src/b.h', b'int b;\n')
+        self.assertFalse(self.make_cache().get(self.make_job(['cc',
+                                                              'a.cpp'])))
+
+    def test_tool(self):
+        self.template = ['/opt/bin/tool', '{file}']
+        self.fs.add_file('/opt/bin/tool', b'v1')
+        job = self.make_job(['cc', 'a.cpp'])
+        job.returncode = 0
+        self.make_cache().put(job)
+        self.assertTrue(self.make_cache().get(self.make_job(['cc', 'a.cpp'])))
+        # another version of the tool
+        self.fs.add_file('/opt/bin/tool', b'v2.0')
+        self.assertFalse(self.make_cache().get(self.make_job(['cc',
+                                                              'a.cpp'])))
+
+    def test_config_files(self):
+        job = self.make_job(['cc', 'a.cpp'])
+        job.returncode = 0
+        self.make_cache().put(job)
+        # a configuration file in a parent directory
+        self.fs.add_file('/.clang-tidy', b'Checks: "-*"\n')
+        self.assertFalse(self.make_cache().get(self.make_job(['cc',
+                                                              'a.cpp'])))
+        self.make_cache().put(job)
+        self.assertTrue(self.make_cache().get(self.make_job(['cc', 'a.cpp'])))
+        self.fs.add_file('/src/tool.cfg', b'')
+        self.assertTrue(self.make_cache().get(self.make_job(['cc', 'a.cpp'])))
+        cache = ResultCache(self.tmpdir, self.template, self.graph, self.fs,
+                            ['.clang-tidy', 'tool.cfg'])
+        self.assertFalse(cache.get(self.make_job(['cc', 'a.cpp'])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import unittest
+
+from compdb.filesystem import InMemoryFileSystem
+from compdb.models import CompileCommand
+from compdb.sharding import (IncludeClosureCost, parse_shard, split_by_cost,
+                             split_by_hash)
+
+
+class ShardingTest(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual((1, 3), parse_shard('1/3'))
+        self.assertEqual((3, 3), parse_shard('3/3'))
+        for spec in ['0/3', '4/3', '3', 'a/b']:
+            self.assertRaises(ValueError, parse_shard, spec)
+
+    def test_split_by_hash(self):
+        compile_commands = [
+            CompileCommand('/src', '{}.cpp'.format(i), ['cc'])
+            for i in range(100)
+        ]
+        shards = [
+            list(split_by_hash(compile_commands, k, 4)) for k in range(1, 5)
+        ]
+        self.assertEqual(
+            sorted(compile_commands, key=lambda c: c.file),
+            sorted(sum(shards, []), key=lambda c: c.file))
+        for shard in shards:
+            self.assertTrue(shard)
+
+    def test_split_by_cost(self):
+        fs = InMemoryFileSystem({
+            '/src/big.cpp': b'x' * 6000,
+            '/src/a.cpp': b'x' * 1000,
+            '/src/b.cpp': b'x' * 1000,
+            '/src/a.h': b'x' * 2000,
+        })
+        compile_commands = [
+            CompileCommand('/src', name, ['cc'])
+            for name in ['a.cpp', 'big.cpp', 'b.cpp']
+        ]
+        cost = IncludeClosureCost({'/src/a.h': ['/src/a.cpp']}, fs)
+        self.assertEqual(4024, cost(compile_commands[0]))
+        self.assertEqual(7024, cost(compile_commands[1]))
+        self.assertEqual([compile_commands[1]],
+                         split_by_cost(compile_commands, 1, 2, cost))
+        self.assertEqual([compile_commands[0], compile_commands[2]],
+                         split_by_cost(compile_commands, 2, 2, cost))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import unittest
+
+import compdb.stats
+from compdb.backend.memory import InMemoryCompilationDatabase
+from compdb.complementer.headerdb import Complementer
+from compdb.filesystem import InMemoryFileSystem
+from compdb.includedb import IncludeIndexBuilder
+from compdb.models import CompileCommand
+
+
+def generate_project(module_count):
+    """Generate a project of independent modules sharing a common header."""
+    files = {'/include/common.h': b'#pragma once\n'}
+    compile_commands = []
+    for i in range(module_count):
+        directory = '/src/mod{}'.format(i)
+        files[directory + '/mod{}.cpp'.format(i)] = (
+            '#include "mod{0}.h"\n'
+            '#include <common.h>\n'
+            'int main() {{ return mod{0}(); }}\n'.format(i).encode('utf-8'))
+        files[directory + '/mod{}.h'.format(i)] = (
+            '#include "mod{0}_detail.h"\n'
+            '#include <common.h>\n'.format(i).encode('utf-8'))
+        files[directory + '/mod{}_detail.h'.format(i)] = b'int detail();\n'
+        compile_commands.append(
+            CompileCommand(directory, 'mod{}.cpp'.format(i),
+                           ['clang++', '-I/include', '-c',
+                            'mod{}.cpp'.format(i)]))
+    return InMemoryFileSystem(files), InMemoryCompilationDatabase(
+        compile_commands)
+
+
+def list_headers(fs, database):
+    builder = IncludeIndexBuilder(fs)
+    return list(builder.build(database).get_all_compile_commands())
+
+
+def complement_headers(fs, database):
+    return Complementer(fs).complement([[database]])
+
+
+class CountersTest(unittest.TestCase):
+    def tearDown(self):
+        compdb.stats.set_counters(None)
+
+    def count(self, func, module_count):
+        fs, database = generate_project(module_count)
+        counters = compdb.stats.enable()
+        func(fs, database)
+        compdb.stats.set_counters(None)
+        return counters
+
+    def test_disabled(self):
+        fs, database = generate_project(2)
+        list_headers(fs, database)
+        self.assertIsNone(compdb.stats.get_counters())
+
+    def test_counts(self):
+        counters = self.count(list_headers, 1)
+        self.assertEqual(4, counters[compdb.stats.FILE_OPENS])
+        self.assertEqual(3, counters[compdb.stats.SCORE_COMPUTATIONS])
+        self.assertIn('file opens', compdb.stats.format_counters(counters))
+
+    def test_normpath(self):
+        counters = compdb.stats.enable()
+        self.assertEqual(
+            os.path.normpath('/src/../include/./a.h'),
+            compdb.stats.normpath('/src/../include/./a.h'))
+        self.assertEqual(1, counters[compdb.stats.NORMPATH_CALLS])
+
+    def assertLinearGrowth(self, func):
+        small = self.count(func, 50)
+        large = self.count(func, 200)
+        for operation in sorted(set(small) | set(large)):
+            # 5% slack for the constant terms
+            self.assertLessEqual(large[operation], small[operation] * 4.2,
+                                 '{}: {} -> {}'.format(
+                                     operation, small[operation],
+                                     large[operation]))
+
+    def test_include_index_growth(self):
+        self.assertLinearGrowth(list_headers)
+
+    def test_headerdb_growth(self):
+        self.assertLinearGrowth(complement_headers)
+
+
+if __name__ == "__main__":
+    unittest.main()